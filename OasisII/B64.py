@@ -21,6 +21,20 @@
 
 #todo:
 
+#the batch functions (...Batch) do the same as their single versions for a whole list at once using numpy,
+#and give byte for byte the same output. Used for the burst lines of an entire sweep
+
+import numpy as np
+
+B64_CHARACTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+B64_VALUES = {temp_char: temp_value for temp_value, temp_char in enumerate(B64_CHARACTERS)} #character to value
+B64_TABLE = np.frombuffer(B64_CHARACTERS.encode('ascii'), dtype=np.uint8) #value to ascii code
+B64_DECODE_TABLE = np.full(256, -1, dtype=np.int64) #ascii code to value, -1 if not B64
+B64_DECODE_TABLE[B64_TABLE] = np.arange(64)
+B64_BIT_WEIGHTS = np.array([32, 16, 8, 4, 2, 1], dtype=np.int64) #inverted b6, see B64ToArray
+B64_INT64_DIGITS = 10 #most B64 digits a batch decodes in int64, 60 bits
+B64_INT64_MAX = 2 ** 63 - 1 #largest value a batch encodes, so the absolute value still fits in int64
+
 def B64ToLookup(temp_input):
     """Takes an integer value between 0 and 63 and returns a character"""
     #constrain values
@@ -29,11 +43,7 @@ def B64ToLookup(temp_input):
     if (temp_input > 63):
         temp_input = 63
         
-    temp_return = ""
-    #make B64 array
-    temp_b64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
-    temp_return += temp_b64[temp_input]
-    return temp_return
+    return B64_CHARACTERS[temp_input]
     
 def B64ToSingle(temp_input):
     """Takes an integer value, and turns it to a string containing the value in B64"""
@@ -95,13 +105,7 @@ def B64ToArray(temp_input):
     
 def B64FromLookup(temp_input):
     """Takes a string of one character B64, and turn it to decimal 0-63"""
-    temp_input = ord(temp_input) #convert to ascii value
-    if (temp_input >= ord('A') and temp_input <= ord('Z')): return temp_input - ord('A') #0-25
-    if (temp_input >= ord('a') and temp_input <= ord('z')): return temp_input - 71 #26-51
-    if (temp_input >= ord('0') and temp_input <= ord('9')): return temp_input + 4 #52-61
-    if (temp_input == ord('+')): return 62 #62
-    if (temp_input == ord('/')): return 63 #63
-    return -1 #-1
+    return B64_VALUES.get(temp_input, -1) #0-63, -1 if not B64
     
 def B64FromSingle(temp_input):
     """takes a string of B64 and turns it into a real value"""
@@ -160,6 +164,106 @@ def B64FromTestArray(temp_input):
         
         if (len(temp_input) <= 0): #if array is empty
             return temp_return_value
+
+
+def B64IntValues(temp_input):
+    """Returns int() of every value as an int64 array. Like int(), raises for nan and infinity,
+    and raises ValueError for values outside +-B64_INT64_MAX, which B64ToSingle still encodes"""
+    temp_array = np.asarray(temp_input)
+    if (temp_array.dtype.kind == 'f' and isinstance(temp_input, np.ndarray)): #the fast path of the planner
+        if not np.isfinite(temp_array).all():
+            raise ValueError("B64ToSingleBatch takes finite values only")
+        if (np.abs(temp_array) >= 2.0 ** 63).any():
+            raise ValueError("B64ToSingleBatch takes values up to " + str(B64_INT64_MAX) + ", use B64ToSingle")
+        return temp_array.astype(np.int64) #rounds towards 0, the same as int()
+    if (temp_array.dtype.kind not in 'iub'): #python numbers, int() of each, floats of a list can round big ints
+        temp_array = np.array([int(temp_value) for temp_value in temp_array.ravel().tolist()], dtype=object)
+    if (temp_array.size > 0 and (temp_array.max() > B64_INT64_MAX or temp_array.min() < -B64_INT64_MAX)):
+        raise ValueError("B64ToSingleBatch takes values up to " + str(B64_INT64_MAX) + ", use B64ToSingle")
+    return temp_array.astype(np.int64)
+
+def B64ToSingleBatch(temp_input):
+    """Takes a list of integer values and returns a list of strings with the values in B64"""
+    temp_values = B64IntValues(temp_input).ravel()
+    if (temp_values.size == 0):
+        return []
+    temp_negative = (temp_values < 0).astype(np.int64)
+    temp_values = np.abs(temp_values)
+    #number of B64 digits per value, at least 1 (0 is 'A')
+    temp_digits = np.ones(len(temp_values), dtype=np.int64)
+    temp_rest = temp_values >> 6
+    while temp_rest.any():
+        temp_digits += temp_rest > 0
+        temp_rest >>= 6
+    temp_width = int((temp_digits + temp_negative).max())
+
+    #character p of a row is the sign, or digit k counted from the least significant digit
+    temp_place = np.arange(temp_width)[None, :] - temp_negative[:, None]
+    temp_k = temp_digits[:, None] - 1 - temp_place
+    temp_chars = B64_TABLE[(temp_values[:, None] >> (6 * np.maximum(temp_k, 0))) & 63]
+    temp_chars[(temp_k < 0) | (temp_place >= temp_digits[:, None])] = 0 #trailing zero bytes are dropped
+    temp_chars[(temp_place < 0)] = ord('-')
+    return temp_chars.view('S%d' % temp_width).ravel().astype('U').tolist()
+
+def B64ToArrayBatch(temp_input):
+    """Takes a 2D array of 1's and 0's, one row per burst, and returns a list with a B64 string per row,
+    in the same inverted b6 order as B64ToArray"""
+    temp_bits = np.asarray(temp_input) >= 1 #values higher than 1 count as 1
+    temp_rows, temp_length = temp_bits.shape
+    if (temp_length == 0):
+        return [''] * temp_rows
+    temp_groups = (temp_length + 5) // 6
+    if (temp_groups * 6 != temp_length): #last group is filled up with zeros, same as B64ToArray
+        temp_bits = np.pad(temp_bits, ((0, 0), (0, temp_groups * 6 - temp_length)), 'constant')
+    temp_values = temp_bits.reshape(temp_rows, temp_groups, 6).dot(B64_BIT_WEIGHTS)
+    temp_chars = B64_TABLE[temp_values]
+    return temp_chars.view('S%d' % temp_groups).ravel().astype('U').tolist()
+
+def B64DecodeRows(temp_input):
+    """Returns a 2D array with the value of every character of every string, the last character first,
+    and the number of valid characters counted from the end (decoding stops at the first non B64 character)"""
+    temp_bytes = np.array([temp_string.encode('ascii') for temp_string in temp_input], dtype=bytes)
+    temp_width = max(temp_bytes.dtype.itemsize, 1)
+    temp_lengths = np.array([len(temp_string) for temp_string in temp_input], dtype=np.int64)
+    temp_codes = np.frombuffer(temp_bytes.tobytes(), dtype=np.uint8).reshape(len(temp_input), temp_width)
+    #reverse every string, so place r is the r-th character from the end
+    temp_index = temp_lengths[:, None] - 1 - np.arange(temp_width)[None, :]
+    temp_values = B64_DECODE_TABLE[temp_codes[np.arange(len(temp_input))[:, None], np.maximum(temp_index, 0)]]
+    temp_values[temp_index < 0] = -1
+    temp_valid = np.cumprod(temp_values >= 0, axis=1).sum(axis=1)
+    return temp_values, temp_valid
+
+def B64FromSingleBatch(temp_input):
+    """Takes a list of B64 strings and returns a list of their real values, the same as B64FromSingle"""
+    if (len(temp_input) == 0):
+        return []
+    temp_values, temp_valid = B64DecodeRows(temp_input)
+    temp_place = np.arange(temp_values.shape[1])[None, :]
+    temp_digits = np.where(temp_place < temp_valid[:, None], temp_values, 0)
+    temp_shifts = 6 * temp_place
+    if (temp_valid.max() > B64_INT64_DIGITS): #longer values overflow int64, add them up as python ints
+        temp_digits = temp_digits.astype(object)
+        temp_shifts = temp_shifts.astype(object)
+    temp_result = (temp_digits << temp_shifts).sum(axis=1)
+    temp_return_value = []
+    for temp_string, temp_value in zip(temp_input, temp_result.tolist()):
+        if (len(temp_string) == 0):
+            temp_return_value.append(None)
+        elif (temp_string[0] == '-'):
+            temp_return_value.append(-temp_value)
+        else:
+            temp_return_value.append(temp_value)
+    return temp_return_value
+
+def B64FromTestArrayBatch(temp_input):
+    """Takes a list of B64 strings in test format and returns a list of arrays of either 1 or 0,
+    the same as B64FromTestArray"""
+    if (len(temp_input) == 0):
+        return []
+    temp_values, temp_valid = B64DecodeRows(temp_input)
+    temp_bits = (np.maximum(temp_values, 0)[:, :, None] >> np.arange(6)) & 1 #LSB first
+    temp_bits = temp_bits.reshape(len(temp_input), -1)
+    return [temp_bits[i, :6 * temp_valid[i]].tolist() for i in range(len(temp_input))]
     
     
 
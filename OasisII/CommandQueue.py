@@ -0,0 +1,138 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#The command queue holds the lines waiting to be sent to a serial device.
+#Producers (GUI, print thread) put lines, the serial reactor takes them.
+#Once the queue reaches the high watermark, producers block until it drained to the low watermark
+
+import collections
+import threading
+
+
+class CommandQueue:
+    """Thread safe FIFO of command lines with a bounded size and byte accounting"""
+
+    def __init__(self, high_watermark: int = 0, low_watermark: int = 0):
+        self.lines = collections.deque()
+        self.byte_count = 0 #characters of all lines in the queue
+        self.high_watermark = int(high_watermark) #0 for unbounded
+        self.low_watermark = min(int(low_watermark), self.high_watermark)
+        self.throttled = False #True from reaching the high watermark until the low watermark
+        self.closed = False #a closed queue refuses lines and releases blocked producers
+        self.on_put = None #called after lines are added and before a producer blocks, to wake the consumer
+        self.condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def Bytes(self) -> int:
+        """Returns the amount of characters in the queue"""
+        return self.byte_count
+
+    def Put(self, line: str, block: bool = True, timeout=None) -> bool:
+        """Adds a line, blocks while the queue is throttled.
+        Returns False if the queue is closed or the timeout passed"""
+        return self.PutMany([line], block, timeout) == 1
+
+    def PutMany(self, lines, block: bool = True, timeout=None) -> int:
+        """Adds lines in order, blocking whenever the queue is throttled.
+        Returns the amount of lines added"""
+        added = 0
+        with self.condition:
+            for line in lines:
+                if self.throttled:
+                    if not block:
+                        break
+                    if added > 0 and self.on_put is not None:
+                        self.on_put() #let the consumer start on what is there
+                    if not self.condition.wait_for(lambda: self.closed or not self.throttled, timeout):
+                        break
+                if self.closed:
+                    break
+                self.lines.append(line)
+                self.byte_count += len(line)
+                added += 1
+                if self.high_watermark > 0 and len(self.lines) >= self.high_watermark:
+                    self.throttled = True
+            if added > 0:
+                self.condition.notify_all()
+        if added > 0 and self.on_put is not None:
+            self.on_put()
+        return added
+
+    def Get(self, block: bool = True, timeout=None):
+        """Takes the oldest line, None if the queue is empty after the timeout or closed"""
+        with self.condition:
+            if block:
+                self.condition.wait_for(lambda: self.closed or len(self.lines) > 0, timeout)
+            if len(self.lines) == 0:
+                return None
+            line = self.lines.popleft()
+            self.Taken(len(line))
+            return line
+
+    def GetMany(self, max_lines: int, max_bytes: int = -1) -> list:
+        """Takes up to max_lines of the oldest lines without blocking,
+        stops before the line that would exceed max_bytes (-1 for no limit)"""
+        taken = []
+        taken_bytes = 0
+        with self.condition:
+            while len(taken) < max_lines and len(self.lines) > 0:
+                line = self.lines[0]
+                if max_bytes >= 0 and taken_bytes + len(line) > max_bytes:
+                    break
+                self.lines.popleft()
+                taken.append(line)
+                taken_bytes += len(line)
+            if len(taken) > 0:
+                self.Taken(taken_bytes)
+        return taken
+
+    def Peek(self):
+        """Returns the oldest line without taking it, None if empty"""
+        with self.condition:
+            if len(self.lines) == 0:
+                return None
+            return self.lines[0]
+
+    def Taken(self, taken_bytes: int) -> None:
+        """Updates the accounting after lines are taken, call with the lock held"""
+        self.byte_count -= taken_bytes
+        if self.throttled and len(self.lines) <= self.low_watermark:
+            self.throttled = False
+        self.condition.notify_all()
+
+    def Clear(self) -> None:
+        """Removes all lines"""
+        with self.condition:
+            self.lines.clear()
+            self.Taken(self.byte_count)
+
+    def Close(self) -> None:
+        """Refuses new lines and releases every blocked producer and consumer"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def Open(self) -> None:
+        """Accepts lines again after a Close"""
+        with self.condition:
+            self.closed = False
+
+    def WaitForLength(self, max_lines: int = 0, timeout=None) -> bool:
+        """Blocks until no more than max_lines are in the queue, returns False on timeout"""
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.lines) <= max_lines, timeout)
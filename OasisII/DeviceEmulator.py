@@ -0,0 +1,522 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#The device emulator runs a virtual GRBL and HP45 on pseudo terminals (Linux and macOS),
+#so the drivers can stream whole jobs without a printer: GRBL().Connect(grbl.port_name).
+#Each device is the master side of a pty, the driver opens the slave side like a serial port.
+#The master runs in packet mode, the input flush pyserial does when it opens a port shows up
+#there, and is handled like the reset a real GRBL does when DTR toggles on open.
+
+#GRBL: 128 byte RX buffer (characters past it are lost, counted in rx_overflows), a planner
+#of 15 blocks that holds back the next line while full, ok/error:N per line, real time ? status
+#reports in the 1.1 format, $h homing and G0/G1/G4 timed with a trapezoid speed profile.
+#Every block starts and ends at standstill, see Kinematics. The lines are parsed and executed by
+#GrblGcode, the same code as the GRBL of the print simulator.
+#HP45: OK per command, GTP/GEP/BWL/THD replies and a finite SBR line buffer. A line leaves the
+#buffer when the encoder crosses its position, the encoder follows the Y axis of a GRBL emulator
+#(or any function returning a position in mm), or moves to the next line on its own.
+
+#Run this file to get both devices with the HP45 encoder on the GRBL Y axis, until ctrl-c.
+
+import collections
+import fcntl
+import math
+import os
+import pty
+import selectors
+import struct
+import termios
+import threading
+import time
+import tty
+import B64
+from GrblGcode import Block, GrblModal, ParseLine
+from Kinematics import ProfileDistance
+
+TIOCPKT_FLUSHREAD = 1 #packet mode status byte, the slave flushed its input
+RESET = 0x18 #ctrl-x, GRBL soft reset
+
+
+class PtyDevice:
+    """A device on the master side of a pseudo terminal, drivers connect to port_name.
+    Subclasses handle Opened (the port was opened), Receive (bytes from the driver)
+    and Step (time passed), all called from the device thread under lock"""
+
+    def __init__(self, baudrate: int = None):
+        self.baudrate = baudrate #bits per second the device reads at, None for as fast as the pty goes
+        self.tick = 0.05 #seconds between steps when nothing is due
+        self.master = -1
+        self.slave = -1
+        self.port_name = ''
+        self.lock = threading.RLock()
+        self.thread = None
+        self.running = False
+        self.read_credit = 0.0 #bytes that may be read, refilled at baudrate
+        self.read_time = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.opened = 0 #times the port was opened
+
+    def Start(self) -> str:
+        """Opens the pty and starts the device thread, returns the port name"""
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        fcntl.ioctl(self.master, termios.TIOCPKT, struct.pack('i', 1))
+        os.set_blocking(self.master, False)
+        self.port_name = os.ttyname(self.slave)
+        self.read_time = time.monotonic()
+        self.running = True
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+        self.thread.start()
+        return self.port_name
+
+    def Stop(self) -> None:
+        """Stops the device thread and closes the pty"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for fd in (self.master, self.slave):
+            if fd >= 0:
+                os.close(fd)
+        self.master = self.slave = -1
+
+    def Run(self) -> None:
+        selector = selectors.DefaultSelector()
+        selector.register(self.master, selectors.EVENT_READ)
+        while self.running:
+            now = time.monotonic()
+            with self.lock:
+                timeout = min(max(self.NextEvent(now) - now, 0.0), self.tick)
+            allowance = self.ReadAllowance(now)
+            if allowance == 0:
+                time.sleep(min(timeout, 10.0 / self.baudrate)) #wait for the next character to arrive
+            elif selector.select(timeout):
+                self.Read(allowance)
+            with self.lock:
+                self.Step(time.monotonic())
+        selector.close()
+
+    def Read(self, allowance: int) -> None:
+        """Reads from the pty and hands the bytes or the port opening to the device"""
+        try:
+            data = os.read(self.master, allowance + 1) #the first byte is the packet mode status
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.running = False
+            return
+        if len(data) == 0:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if data[0] == 0:
+                self.bytes_in += len(data) - 1
+                if self.baudrate is not None:
+                    self.read_credit -= len(data) - 1
+                self.Receive(bytes(data[1:]), now)
+            elif data[0] & TIOCPKT_FLUSHREAD:
+                self.opened += 1
+                self.Opened(now)
+
+    def ReadAllowance(self, now: float) -> int:
+        """Returns how many bytes can be read now"""
+        if self.baudrate is None:
+            return 4096
+        self.read_credit = min(self.read_credit + (now - self.read_time) * self.baudrate / 10.0, 64.0)
+        self.read_time = now
+        return int(self.read_credit)
+
+    def Write(self, data: bytes) -> None:
+        """Sends bytes to the driver, dropped if the driver does not read them"""
+        try:
+            self.bytes_out += os.write(self.master, data)
+        except (BlockingIOError, OSError):
+            pass
+
+    def NextEvent(self, now: float) -> float:
+        """Returns when the device next has to step"""
+        return now + self.tick
+
+    def Opened(self, now: float) -> None:
+        pass
+
+    def Receive(self, data: bytes, now: float) -> None:
+        pass
+
+    def Step(self, now: float) -> None:
+        pass
+
+
+class GrblEmulator(PtyDevice):
+    """A GRBL 1.1 with X, Y, Z (build piston) and A (feed piston)"""
+
+    def __init__(self, acceleration: float = 500.0, max_rate: float = 30000.0, homing_time: float = 2.0,
+                 boot_time: float = 0.1, baudrate: int = None):
+        PtyDevice.__init__(self, baudrate)
+        self.acceleration = acceleration #mm/s^2, all axes
+        self.max_rate = max_rate #mm/min, speed of G0 and limit of G1
+        self.homing_time = homing_time #seconds $h takes
+        self.boot_time = boot_time #seconds after a reset before the welcome message
+        self.home_position = (0.0, 0.0, 0.0, 0.0) #machine position after homing
+        self.rx_buffer_size = 128
+        self.planner_size = 15
+        self.version = '1.1f'
+
+        self.rx = bytearray() #characters received, not yet handled
+        self.planner = collections.deque() #blocks to move, the first one is moving
+        self.block_time = 0.0 #when the first block started
+        self.mpos = list(self.home_position) #machine position at the start of the first block
+        self.modal = GrblModal(self.home_position) #modal state and the position after the last planned block
+        self.busy_until = 0.0 #no lines are handled before this time (boot and homing)
+        self.booting = 0
+        self.homing = 0
+
+        #statistics
+        self.lines = 0
+        self.errors = 0
+        self.status_reports = 0
+        self.rx_overflows = 0 #characters lost to a full RX buffer
+        self.rx_peak = 0 #most characters in the RX buffer
+        self.planner_peak = 0 #most blocks in the planner
+        self.motion_time = 0.0 #seconds of planned motion and dwell
+
+    def Opened(self, now: float) -> None:
+        """Opening the port toggles DTR, which resets the controller"""
+        self.Reset(now)
+
+    def Reset(self, now: float) -> None:
+        """Soft reset: stops motion, drops what was received and planned, welcome after booting"""
+        self.mpos = list(self.Position(now))
+        self.modal.Reset(self.mpos)
+        self.planner.clear()
+        self.rx.clear()
+        self.homing = 0
+        self.booting = 1
+        self.busy_until = now + self.boot_time
+
+    def Receive(self, data: bytes, now: float) -> None:
+        for character in data:
+            if self.booting:
+                continue #lost while GRBL starts
+            if character == ord('?'):
+                self.Write(self.StatusReport(now).encode('ascii'))
+            elif character == RESET:
+                self.Reset(now)
+            elif character in (ord('!'), ord('~')):
+                pass #feed hold and resume, not emulated
+            elif len(self.rx) < self.rx_buffer_size:
+                self.rx.append(character)
+            else:
+                self.rx_overflows += 1
+        self.rx_peak = max(self.rx_peak, len(self.rx))
+
+    def NextEvent(self, now: float) -> float:
+        events = [now + self.tick]
+        if self.busy_until > now:
+            events.append(self.busy_until)
+        if len(self.planner) > 0:
+            events.append(self.block_time + self.planner[0].duration)
+        return min(events)
+
+    def Step(self, now: float) -> None:
+        self.Advance(now)
+        if now < self.busy_until:
+            return
+        if self.booting:
+            self.booting = 0
+            self.Write(("\r\nGrbl " + self.version + " ['$' for help]\r\n").encode('ascii'))
+        if self.homing:
+            self.homing = 0
+            self.mpos = list(self.home_position)
+            self.modal.Reset(self.home_position)
+            self.Reply('ok')
+        while now >= self.busy_until and self.HandleLine(now):
+            pass #homing stops handling lines until it is done
+
+    def Advance(self, now: float) -> None:
+        """Removes the blocks that finished moving"""
+        while len(self.planner) > 0 and now >= self.block_time + self.planner[0].duration:
+            block = self.planner.popleft()
+            self.block_time += block.duration
+            self.mpos = list(block.end)
+        if len(self.planner) == 0:
+            self.block_time = max(self.block_time, now)
+
+    def HandleLine(self, now: float) -> int:
+        """Handles the oldest line in the RX buffer if the planner allows it, returns 1 if handled"""
+        end = next((index for index, character in enumerate(self.rx) if character in b'\r\n'), -1)
+        if end < 0:
+            return 0
+        line = self.rx[:end].decode('ascii', 'replace').replace(' ', '').upper()
+        command = ParseLine(line)
+        if command[0] == 'sync' and len(self.planner) > 0:
+            return 0 #waits for the moves before it to finish
+        if command[0] == 'move' and len(self.planner) >= self.planner_size:
+            return 0 #planner full, the line stays in the RX buffer
+        del self.rx[:end + 1]
+        if len(line) == 0:
+            self.Reply('ok') #an empty line also gets an ok
+            return 1
+        self.lines += 1
+        self.Execute(command, now)
+        return 1
+
+    def Execute(self, command, now: float) -> None:
+        kind, action, words = command
+        if isinstance(action, int):
+            self.Error(action)
+        elif action == 'home':
+            self.homing = 1
+            self.busy_until = now + self.homing_time #ok is sent when homing is done
+        elif action == '$$':
+            settings = (('110', self.max_rate), ('111', self.max_rate), ('112', self.max_rate), ('113', self.max_rate),
+                        ('120', self.acceleration), ('121', self.acceleration), ('122', self.acceleration),
+                        ('123', self.acceleration))
+            for number, value in settings:
+                self.Write(('$' + number + '=%.3f\r\n' % value).encode('ascii'))
+            self.Reply('ok')
+        elif action == '$':
+            self.Write(b'[HLP:$$ $# $G $I $N $x=val $Nx=line $J=line $SLP $C $X $H ~ ! ? ctrl-x]\r\n')
+            self.Reply('ok')
+        elif action in ('$X', '$G', '$#', '$I'):
+            self.Reply('ok')
+        else:
+            self.GCode(words, now)
+
+    def GCode(self, words: dict, now: float) -> None:
+        """Executes a line of g-code that passed ParseLine"""
+        error, block = self.modal.Execute(words, self.max_rate, self.acceleration)
+        if error:
+            self.Error(error)
+            return
+        if block is not None:
+            self.Plan(block, now)
+        self.Reply('ok')
+
+    def Plan(self, block: Block, now: float) -> None:
+        """Adds a block to the planner"""
+        if len(self.planner) == 0:
+            self.block_time = now
+            self.mpos = list(block.start)
+        self.planner.append(block)
+        self.motion_time += block.duration
+        self.planner_peak = max(self.planner_peak, len(self.planner))
+
+    def Reply(self, line: str) -> None:
+        self.Write((line + '\r\n').encode('ascii'))
+
+    def Error(self, number: int) -> None:
+        self.errors += 1
+        self.Reply('error:' + str(number))
+
+    def Position(self, now: float = None) -> tuple:
+        """Returns the machine position at time now (default the current time)"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            if len(self.planner) == 0:
+                return tuple(self.mpos)
+            elapsed = now - self.block_time
+            for block in self.planner: #blocks that ended since the last step are skipped
+                if elapsed < block.duration:
+                    break
+                elapsed -= block.duration
+            else:
+                return tuple(self.planner[-1].end)
+            if block.distance == 0.0:
+                return block.start
+            fraction = ProfileDistance(block.distance, block.speed, self.acceleration, elapsed) / block.distance
+            return tuple(s + (e - s) * fraction for s, e in zip(block.start, block.end))
+
+    def WorkPosition(self, now: float = None) -> tuple:
+        """Returns the work position (machine position minus the G92 offset) at time now"""
+        with self.lock:
+            return tuple(m - o for m, o in zip(self.Position(now), self.modal.wco))
+
+    def State(self, now: float) -> str:
+        if self.homing:
+            return 'Home'
+        if len(self.planner) > 0 and now < self.block_time + sum(block.duration for block in self.planner):
+            return 'Run'
+        return 'Idle'
+
+    def StatusReport(self, now: float) -> str:
+        """Returns the status report line answering a ?"""
+        self.status_reports += 1
+        state = self.State(now)
+        feed = 0.0
+        if state == 'Run':
+            feed = self.planner[0].speed * 60.0
+        return '<%s|WPos:%s|Bf:%d,%d|FS:%d,0>\r\n' % (
+            state, ','.join('%.3f' % value for value in self.WorkPosition(now)),
+            self.planner_size - len(self.planner), self.rx_buffer_size - len(self.rx), feed)
+
+    def Stats(self) -> dict:
+        with self.lock:
+            return {'lines': self.lines, 'errors': self.errors, 'status_reports': self.status_reports,
+                    'rx_overflows': self.rx_overflows, 'rx_peak': self.rx_peak, 'planner_peak': self.planner_peak,
+                    'motion_time': self.motion_time, 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
+
+
+class HP45Emulator(PtyDevice):
+    """An HP45 controller with a buffer of buffer_size SBR lines"""
+
+    def __init__(self, buffer_size: int = 1000, encoder=None, encoder_speed: float = 100.0,
+                 temperature: float = 25.0, nozzles: int = 300, dead_nozzles=(), baudrate: int = None):
+        PtyDevice.__init__(self, baudrate)
+        self.buffer_size = buffer_size
+        self.encoder = encoder #function returning the head position in mm, None to move to the next line on its own
+        self.encoder_speed = encoder_speed #mm/s of the head without an encoder function
+        self.temperature = temperature #degrees
+        self.nozzles = nozzles
+        self.dead_nozzles = set(dead_nozzles) #nozzles THD reports as not working
+
+        self.rx = bytearray()
+        self.lines = collections.deque() #(position in microns, burst) of the SBR lines in the buffer
+        self.encoder_offset = 0.0 #microns added to the encoder, set by SEP
+        self.free_position = 0.0 #microns, head position without an encoder function
+        self.last_position = None #encoder position at the last step
+        self.last_time = 0.0
+        self.dpi = 600
+        self.density = 100
+
+        #statistics
+        self.commands = 0
+        self.lines_received = 0
+        self.lines_printed = 0
+        self.overflows = 0 #SBR lines lost to a full buffer
+        self.buffer_peak = 0
+        self.unknown = 0 #commands that are not understood
+
+    def Opened(self, now: float) -> None:
+        self.rx.clear()
+        self.last_time = now
+
+    def Receive(self, data: bytes, now: float) -> None:
+        self.rx += data
+        while True:
+            end = self.rx.find(b'\r')
+            if end < 0:
+                break
+            line = self.rx[:end].decode('ascii', 'replace').strip()
+            del self.rx[:end + 1]
+            if len(line) > 0:
+                self.Execute(line, now)
+
+    def Execute(self, line: str, now: float) -> None:
+        """Handles a command, every command is answered with OK"""
+        self.commands += 1
+        command, _, argument = line.partition(' ')
+        if command == 'SBR':
+            self.Print(now)
+            position, _, burst = argument.partition(' ')
+            if len(self.lines) < self.buffer_size:
+                self.lines.append((B64.B64FromSingle(position), burst))
+                self.lines_received += 1
+                self.buffer_peak = max(self.buffer_peak, len(self.lines))
+            else:
+                self.overflows += 1
+        elif command == 'GTP':
+            self.Write(('GTP:' + B64.B64ToSingle(int(self.temperature * 10)) + '\n').encode('ascii'))
+        elif command == 'GEP':
+            self.Write(('GEP:' + B64.B64ToSingle(int(self.EncoderPosition(now))) + '\n').encode('ascii'))
+        elif command == 'BWL':
+            self.Print(now)
+            self.Write(('BWL:' + B64.B64ToSingle(self.buffer_size - len(self.lines)) + '\n').encode('ascii'))
+        elif command == 'THD':
+            self.Write(('THD:' + self.TestResult() + '\n').encode('ascii'))
+        elif command == 'SEP':
+            self.encoder_offset += B64.B64FromSingle(argument) - self.EncoderPosition(now)
+            self.last_position = self.EncoderPosition(now)
+        elif command == 'BCL':
+            self.lines.clear()
+        elif command == 'SDP':
+            self.dpi = B64.B64FromSingle(argument)
+        elif command == 'SDN':
+            self.density = B64.B64FromSingle(argument)
+        elif command not in ('PHT', 'PRM'):
+            self.unknown += 1
+        self.Write(b'OK\n')
+
+    def TestResult(self) -> str:
+        """Returns the nozzle test as THD sends it, 6 nozzles per character, last character first"""
+        characters = []
+        for start in range(0, self.nozzles, 6):
+            value = 0
+            for bit in range(6):
+                nozzle = start + bit
+                if nozzle < self.nozzles and nozzle not in self.dead_nozzles:
+                    value |= 1 << bit
+            characters.append(B64.B64ToLookup(value))
+        return ''.join(characters)[::-1]
+
+    def EncoderPosition(self, now: float) -> float:
+        """Returns the head position in microns"""
+        if self.encoder is not None:
+            return self.encoder() * 1000.0 + self.encoder_offset
+        return self.free_position + self.encoder_offset
+
+    def NextEvent(self, now: float) -> float:
+        if len(self.lines) > 0:
+            return now + 0.001 #the encoder moves
+        return now + self.tick
+
+    def Step(self, now: float) -> None:
+        self.Print(now)
+
+    def Print(self, now: float) -> None:
+        """Prints the lines in the buffer whose position the encoder passed since the last step"""
+        if self.encoder is None and len(self.lines) > 0:
+            #the head moves to the next line on its own
+            target = self.lines[0][0] - self.encoder_offset
+            step = self.encoder_speed * 1000.0 * (now - self.last_time)
+            if abs(target - self.free_position) <= step:
+                self.free_position = target
+            else:
+                self.free_position += math.copysign(step, target - self.free_position)
+        self.last_time = now
+        position = self.EncoderPosition(now)
+        if self.last_position is None:
+            self.last_position = position
+        low = min(self.last_position, position)
+        high = max(self.last_position, position)
+        while len(self.lines) > 0 and low <= self.lines[0][0] <= high:
+            self.lines.popleft()
+            self.lines_printed += 1
+        self.last_position = position
+
+    def Stats(self) -> dict:
+        with self.lock:
+            return {'commands': self.commands, 'lines_received': self.lines_received,
+                    'lines_printed': self.lines_printed, 'overflows': self.overflows,
+                    'buffer_peak': self.buffer_peak, 'buffer_used': len(self.lines), 'unknown': self.unknown,
+                    'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
+
+
+if __name__ == '__main__':
+    grbl = GrblEmulator()
+    hp45 = HP45Emulator(encoder=lambda: grbl.WorkPosition()[1])
+    print("GRBL on: " + grbl.Start())
+    print("HP45 on: " + hp45.Start())
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        print("GRBL: " + str(grbl.Stats()))
+        print("HP45: " + str(hp45.Stats()))
+        hp45.Stop()
+        grbl.Stop()
@@ -0,0 +1,136 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#The g-code GRBL accepts from the drivers, parsed and executed the way GRBL 1.1 does it, for the
+#GRBL of the device emulator and of the print simulator. ParseLine sorts a line into what it waits
+#for, GrblModal keeps the modal state (G90/G91, G0/G1, feed, spindle, G92 offset) and turns a line
+#into the block it plans. Axes are X, Y, Z (build piston) and A (feed piston)
+
+import collections
+import math
+import re
+from Kinematics import ProfileTime
+
+AXES = 'XYZA'
+WORD = re.compile(r'([A-Z])([-+]?[0-9]*\.?[0-9]*)')
+
+Block = collections.namedtuple('Block', (
+    'start', #machine position at the start of the block
+    'end', #machine position at the end of the block
+    'distance', #mm
+    'speed', #top speed in mm/s
+    'duration', #seconds
+))
+
+
+def ParseLine(line: str):
+    """Returns (kind, action, words) of a line without spaces in upper case, kind is sync, move or other,
+    action is an error number for lines GRBL rejects"""
+    if line.startswith('$'):
+        if line == '$H':
+            return 'sync', 'home', None
+        if line in ('$', '$$', '$X', '$G', '$#', '$I'):
+            return 'other', line, None
+        return 'other', 3, None #invalid $ statement
+    words = {}
+    position = 0
+    for match in WORD.finditer(line):
+        if match.start() != position:
+            return 'other', 1, None #expected command letter
+        position = match.end()
+        letter, value = match.groups()
+        try:
+            value = float(value)
+        except ValueError:
+            return 'other', 2, None #bad number format
+        if letter in ('G', 'M'):
+            words.setdefault(letter, []).append(value)
+        else:
+            words[letter] = value
+    if position != len(line):
+        return 'other', 1, None
+    for letter in words:
+        if letter not in 'GMXYZAFPSN':
+            return 'other', 20, None #unsupported command
+    for value in words.get('G', []):
+        if value not in (0, 1, 4, 17, 20, 21, 90, 91, 92, 94):
+            return 'other', 20, None
+    for value in words.get('M', []):
+        if value not in (3, 4, 5):
+            return 'other', 20, None
+    if 4 in words.get('G', []) or 'M' in words:
+        return 'sync', 'gcode', words #dwell and spindle changes wait for the planner to empty
+    if any(axis in words for axis in AXES) and 92 not in words.get('G', []):
+        return 'move', 'gcode', words
+    return 'other', 'gcode', words
+
+
+class GrblModal:
+    """The modal state of GRBL and the machine position after the last planned block"""
+
+    def __init__(self, position=(0.0, 0.0, 0.0, 0.0)):
+        self.target = list(position) #machine position after the last planned block
+        self.wco = [0.0] * 4 #work coordinate offset, wpos = mpos - wco
+        self.absolute = 1 #G90 (1) or G91 (0)
+        self.motion = 0 #modal motion, G0 or G1
+        self.feed = None #mm/min, None until an F was given
+        self.spindle = 0 #0 off, 3 or 4 on
+
+    def Reset(self, position) -> None:
+        """A soft reset or a home, the feed and the G92 offset are kept"""
+        self.target = list(position)
+        self.absolute = 1
+        self.motion = 0
+
+    def Execute(self, words: dict, max_rate: float, acceleration: float):
+        """Executes the words of a line that passed ParseLine, returns (error, block), error is 0
+        or a GRBL error number, block the Block the line plans (a dwell has no distance) or None"""
+        gcodes = words.get('G', [])
+        if 'F' in words:
+            self.feed = words['F']
+        for value in gcodes:
+            if value in (90, 91):
+                self.absolute = int(value == 90)
+            elif value in (0, 1):
+                self.motion = int(value)
+        for value in words.get('M', []):
+            self.spindle = int(value) if value != 5 else 0
+        if 4 in gcodes:
+            return 0, Block(tuple(self.target), tuple(self.target), 0.0, 0.0, words.get('P', 0.0))
+        if 92 in gcodes:
+            for index, axis in enumerate(AXES):
+                if axis in words:
+                    self.wco[index] = self.target[index] - words[axis]
+            return 0, None
+        if not any(axis in words for axis in AXES):
+            return 0, None
+        if self.motion == 1 and self.feed is None:
+            return 22, None #feed rate has not yet been set
+        end = list(self.target)
+        for index, axis in enumerate(AXES):
+            if axis in words:
+                if self.absolute:
+                    end[index] = words[axis] + self.wco[index]
+                else:
+                    end[index] += words[axis]
+        distance = math.sqrt(sum((e - s) ** 2 for s, e in zip(self.target, end)))
+        rate = max_rate if self.motion == 0 else min(self.feed, max_rate)
+        speed = rate / 60.0
+        if distance <= 0.0 or speed <= 0.0:
+            return 0, None
+        block = Block(tuple(self.target), tuple(end), distance, speed, ProfileTime(distance, speed, acceleration))
+        self.target = end
+        return 0, block
@@ -0,0 +1,146 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#Parser for GRBL status reports, both the 1.1 format and the older comma format:
+#<Idle|MPos:0.000,250.000,0.000,0.000|Bf:15,127|FS:0,0|WCO:0.000,0.000,0.000,0.000>
+#<Idle,MPos:0.000,250.000,0.000,WPos:0.000,250.000,0.000>
+#Every report gives a new GrblStatus, an immutable snapshot, so readers that take the
+#snapshot once never mix the X of one report with the Y of the next
+
+import collections
+
+AXES = 4 #X, Y, Z (build piston) and A (feed piston)
+
+GrblStatus = collections.namedtuple('GrblStatus', (
+    'state', #idle, run, hold, jog, alarm, door, check, home or sleep
+    'substate', #the number after the state (hold:0, door:1), -1 if none
+    'mpos', #machine position per axis
+    'wpos', #work position per axis, as reported or mpos - wco
+    'wco', #work coordinate offset per axis
+    'planner_free', #free blocks in the planner buffer (Bf), -1 if not reported
+    'rx_free', #free bytes in the serial RX buffer (Bf), -1 if not reported
+    'feed', #current feed rate (FS or F)
+    'spindle', #current spindle speed (FS)
+    'line', #line number being executed (Ln), -1 if not reported
+    'pins', #input pins that are active (Pn), for example 'XP'
+    'overrides', #feed, rapid and spindle override in percent (Ov)
+    'accessories', #accessory states (A)
+))
+
+EMPTY_STATUS = GrblStatus('', -1, (0.0,) * AXES, (0.0,) * AXES, (0.0,) * AXES,
+                          -1, -1, 0.0, 0.0, -1, '', (100, 100, 100), '')
+
+
+def _Axes(value: str) -> tuple:
+    """Parses a comma separated position, padded to all axes"""
+    axes = tuple(map(float, value.split(',')))
+    if len(axes) < AXES:
+        axes += (0.0,) * (AXES - len(axes))
+    return axes
+
+
+def _Ints(value: str) -> tuple:
+    return tuple(map(int, value.split(',')))
+
+
+def _Floats(value: str) -> tuple:
+    return tuple(map(float, value.split(',')))
+
+
+class GrblStatusParser:
+    """Turns status report lines into GrblStatus snapshots.
+    Fields GRBL only reports now and then (WCO, Ov) are kept from earlier reports"""
+
+    #field name in the report: (function to parse the value, name of the parsed field)
+    FIELDS = {
+        'mpos': (_Axes, 'mpos'),
+        'wpos': (_Axes, 'wpos'),
+        'wco': (_Axes, 'wco'),
+        'bf': (_Ints, 'bf'),
+        'fs': (_Floats, 'fs'),
+        'f': (_Floats, 'fs'),
+        'ln': (int, 'line'),
+        'pn': (str.upper, 'pins'),
+        'ov': (_Ints, 'overrides'),
+        'a': (str.upper, 'accessories'),
+    }
+
+    def __init__(self):
+        self.status = EMPTY_STATUS #the last snapshot
+
+    def Parse(self, line: str):
+        """Parses a status report line, returns the new GrblStatus,
+        None if the line is not a (valid) status report"""
+        line = line.strip()
+        if not (line.startswith('<') and line.endswith('>')):
+            return None
+        body = line[1:-1]
+        if '|' in body:
+            tokens = body.split('|')
+        else:
+            tokens = self._CommaTokens(body)
+
+        state, _, substate = tokens[0].partition(':')
+        fields = {}
+        try:
+            for token in tokens[1:]:
+                name, _, value = token.partition(':')
+                entry = self.FIELDS.get(name.lower())
+                if entry is not None:
+                    fields[entry[1]] = entry[0](value)
+            substate = int(substate) if substate else -1
+        except ValueError:
+            return None
+
+        last = self.status
+        wco = fields.get('wco', last.wco)
+        if 'mpos' in fields and 'wpos' in fields: #old comma format reports both, the offset follows from them
+            mpos = fields['mpos']
+            wpos = fields['wpos']
+            wco = tuple(round(m - w, 4) for m, w in zip(mpos, wpos))
+        elif 'mpos' in fields:
+            mpos = fields['mpos']
+            wpos = tuple(round(m - o, 4) for m, o in zip(mpos, wco)) #reports have at most 4 decimals
+        elif 'wpos' in fields:
+            wpos = fields['wpos']
+            mpos = tuple(round(w + o, 4) for w, o in zip(wpos, wco))
+        else:
+            mpos = last.mpos
+            wpos = last.wpos
+        planner_free, rx_free = (fields['bf'] + (-1, -1))[:2] if 'bf' in fields else (-1, -1)
+        feed_speed = fields.get('fs', (last.feed, last.spindle))
+        feed = feed_speed[0]
+        spindle = feed_speed[1] if len(feed_speed) > 1 else last.spindle
+
+        self.status = GrblStatus(state.lower(), substate, mpos, wpos, wco, planner_free, rx_free,
+                                 feed, spindle, fields.get('line', -1), fields.get('pins', ''),
+                                 fields.get('overrides', last.overrides), fields.get('accessories', ''))
+        return self.status
+
+    @staticmethod
+    def _CommaTokens(body: str) -> list:
+        """Splits an old comma format report into fields, a part without ':' belongs to the field before it"""
+        tokens = []
+        for part in body.split(','):
+            if ':' in part or len(tokens) == 0:
+                tokens.append(part)
+            else:
+                tokens[-1] += ',' + part
+        return tokens
+
+    def Reset(self) -> None:
+        """Forgets everything, for a new connection"""
+        self.status = EMPTY_STATUS
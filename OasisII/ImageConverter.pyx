@@ -29,11 +29,76 @@ cimport numpy as np
 import os
 # import multiprocessing
 import time
+from LayerCache import LayerCache
+from Rasterizer import ParsePoints, Crossings, Spans
+from Metrics import GetMetrics
+from Tracer import GetTracer
+
+
+THRESHOLD_STRIP_ROWS = 256 #rows thresholded per array operation, keeps temporaries small on 600 DPI pages
+
+#conversion timings, only recorded while metrics are enabled (see Metrics.py)
+OPEN_SECONDS = GetMetrics().Histogram('convert_open_seconds', 'Seconds to open an image or svg file')
+THRESHOLD_SECONDS = GetMetrics().Histogram('convert_threshold_seconds', 'Seconds to threshold an image')
+RENDER_SECONDS = GetMetrics().Histogram('convert_render_seconds', 'Seconds to render the output image')
+SVG_LAYER_SECONDS = GetMetrics().Histogram('convert_svg_layer_seconds', 'Seconds to rasterize an svg layer, cached layers not counted')
+
+def QImageToArray(temp_image):
+    """Returns a zero copy (height, width) uint32 numpy view of a 32 bit QImage,
+    the image must be kept alive as long as the view is used"""
+    temp_bits = temp_image.constBits()
+    temp_bits.setsize(temp_image.bytesPerLine() * temp_image.height())
+    temp_view = np.frombuffer(temp_bits, dtype=np.uint32)
+    temp_view = temp_view.reshape(temp_image.height(), temp_image.bytesPerLine() // 4)
+    return temp_view[:, :temp_image.width()]
+
+def PackedToMonoImage(temp_bits, int temp_width):
+    """Turns a bit packed array (rows packed MSB first) in a bilevel QImage,
+    1 is ink (black), 0 is paper (white)"""
+    temp_height = temp_bits.shape[0]
+    temp_bytes_per_line = (temp_bits.shape[1] + 3) // 4 * 4 #Qt lines are 32 bit aligned
+    temp_bits = np.pad(temp_bits, ((0, 0), (0, temp_bytes_per_line - temp_bits.shape[1])), 'constant')
+    temp_image = QImage(temp_bits.tobytes(), temp_width, temp_height, temp_bytes_per_line, QImage.Format_Mono)
+    temp_image.setColorTable([QColor(255, 255, 255).rgb(), QColor(0, 0, 0).rgb()])
+    return temp_image.copy() #detach from the numpy buffer
+
+def ArrayToGrayImage(temp_array):
+    """Packs a 0/1 array in a Grayscale8 QImage, 1 is ink (black), 0 is paper (white)"""
+    temp_height, temp_width = temp_array.shape
+    temp_bytes_per_line = (temp_width + 3) // 4 * 4
+    temp_gray = np.full((temp_height, temp_bytes_per_line), 255, dtype=np.uint8)
+    temp_gray[:, :temp_width][temp_array != 0] = 0
+    temp_image = QImage(temp_gray.tobytes(), temp_width, temp_height, temp_bytes_per_line, QImage.Format_Grayscale8)
+    return temp_image.copy() #detach from the numpy buffer
+
+ctypedef fused pixel_t:
+    np.uint8_t
+    double
+
+def FillSpans(pixel_t[:, :] temp_out, np.int64_t[:] temp_rows, np.int64_t[:] temp_firsts, np.int64_t[:] temp_lasts):
+    """Sets the pixels of every span (row, first column, column after the last) to 1"""
+    cdef Py_ssize_t i, y
+    for i in range(temp_rows.shape[0]):
+        for y in range(temp_firsts[i], temp_lasts[i]):
+            temp_out[temp_rows[i], y] = 1
+
+def ArrayToPreview(temp_array, int temp_preview_size):
+    """Shrinks a 0/1 array so the largest side fits in preview size,
+    a preview pixel is ink if any pixel it covers is ink, so thin lines stay visible"""
+    cdef int temp_factor
+    temp_height, temp_width = temp_array.shape
+    temp_factor = -(-max(temp_height, temp_width) // temp_preview_size) #round up
+    if (temp_factor <= 1):
+        return temp_array
+    temp_array = np.maximum.reduceat(temp_array, np.arange(0, temp_height, temp_factor), axis=0)
+    temp_array = np.maximum.reduceat(temp_array, np.arange(0, temp_width, temp_factor), axis=1)
+    return temp_array
 
 
 cdef class ImageConverter():
     cdef public int dpi
     cdef public double burst_size
+    cdef public double threshold
     cdef public int file_type
     cdef public int image_array_width
     cdef public int image_array_height
@@ -41,13 +106,19 @@ cdef class ImageConverter():
     cdef public double svg_height
     cdef public list svg_layer_names
     cdef public list svg_layer_height
+    cdef public list svg_layer_offsets
+    cdef public object layer_cache
 
     cdef public double[:,:] image_array
+    cdef public object image_packed
+    cdef public int packed_mode
+    cdef public object occupancy
     cdef public int svg_layers
     cdef public str file_path
 
     cdef public object output_image
     cdef public object conversion_image
+    cdef public object gray_image
     cdef public object input_image
     cdef public object temp_color
     cdef public object temp_image
@@ -60,6 +131,7 @@ cdef class ImageConverter():
         self.file_path = ''
         self.dpi = 300 #defaults to 600
         self.burst_size = self.dpi/2 #defaults half of dpi
+        self.threshold = -1 #threshold of the last conversion, -1 if not converted
         self.file_type = 0 #type of file, 0 for nothing, 1 for bitmap, 2 for vector
         self.image_array_width = 0 #the width of the image
         self.image_array_height = 0 #the height of the image
@@ -68,12 +140,25 @@ cdef class ImageConverter():
 
         self.svg_layer_names = []
         self.svg_layer_height = []
+        self.svg_layer_offsets = [] #byte offset of the <g line of every layer in the svg file
 
         self.svg_layers = 0 #how many layers there are in the file
+        self.layer_cache = LayerCache() #rasterized svg layers, bit packed
+
+        self.packed_mode = 0 #0 stores the converted image in image_array, 1 bit packed in image_packed
+        self.image_array = np.zeros( (0, 0) )
+        self.image_packed = None
+        self.occupancy = None #occupancy index of the converted image, made by the print planner
+        self.gray_image = None #grayscale array of an image opened from memory, thresholded instead of conversion_image
  
-    cpdef int OpenFile(self, str temp_file_path):
+    cpdef int OpenFile(self, str temp_file_path, int temp_pixmaps=1):
         """open attempts to open file in path, if successful, return a 1,
-        if failed, will return a 0"""
+        if failed, will return a 0. With pixmaps 0 no input and output pixmap is made,
+        for opening outside of the GUI thread"""
+        with OPEN_SECONDS.Time():
+            return self.OpenFileUntimed(temp_file_path, temp_pixmaps)
+
+    cdef int OpenFileUntimed(self, str temp_file_path, int temp_pixmaps):
         #print("Attempting to open: " + str(temp_file_path))
         cdef int temp_success = 0
 
@@ -94,13 +179,18 @@ cdef class ImageConverter():
                 self.file_type = 1 #set image type to bitmap
                 #print('set to bitmap')
 
+            self.occupancy = None
+            self.gray_image = None
+            self.layer_cache.Clear()
+
             #open bitmap file
             if (self.file_type == 1): #attempt opening bitmap file
                 try: #try opening file
                     #self.input_image = QPixmap(str(temp_file_path))
                     self.conversion_image = QImage(str(self.file_path)) #create conversion image
-                    self.input_image = QPixmap(self.conversion_image) #create input image
-                    self.output_image = QPixmap(self.conversion_image) #create output image
+                    if (temp_pixmaps == 1):
+                        self.input_image = QPixmap(self.conversion_image) #create input image
+                        self.output_image = QPixmap(self.conversion_image) #create output image
                     temp_success = 1 #set succesful,
                 except:
                     nothing = 0
@@ -111,22 +201,19 @@ cdef class ImageConverter():
                     self.image_array_width = self.conversion_image.width()
                     self.image_array_height = self.conversion_image.height()
                     #print("Image width: " + str(self.image_array_width) + ", Image height: " + str(self.image_array_height))
-                    self.image_array = np.zeros( (self.image_array_height, self.image_array_width) )
+                    self.ClearArray()
                     #print(self.image_array)
                     return 1
 
             if (self.file_type == 2): #attempt opening vector file
-                try: #try opening file
-                    with open(self.file_path) as file_object:
-                        self.vector_file = file_object.read()
-                        #print(self.vector_file)
+                try: #try opening file, indexes the layers in one pass
+                    self.SVGGetData() #get data from vector file
                     temp_success = 1 #set succesful,
-                except:
-                    nothing = 0
+                except (OSError, ValueError) as e:
+                    print("Could not open svg: " + str(e))
 
                 if (temp_success == 1):
                     #print("file opened")
-                    self.SVGGetData() #get data from vector file
                     #Get data automatically filles width, height and layers
 
                     #make output array the size of the image, filled with 0
@@ -139,6 +226,33 @@ cdef class ImageConverter():
                     return 2
 
 
+    def OpenArray(self, temp_gray, str temp_file_path='', int temp_pixmaps=1):
+        """Opens a grayscale image from memory, a (height, width) uint8 array with 0 black and 255 white,
+        as a bitmap. Thresholding works on the array, the same as on an opaque image of it. Returns 1"""
+        self.gray_image = np.ascontiguousarray(temp_gray, dtype=np.uint8)
+        self.file_path = temp_file_path
+        self.file_type = 1 #set image type to bitmap
+        self.threshold = -1
+        self.occupancy = None
+        self.layer_cache.Clear()
+        self.image_array_height, self.image_array_width = self.gray_image.shape
+        self.conversion_image = QImage(self.gray_image.data, self.image_array_width, self.image_array_height,
+                                       self.image_array_width, QImage.Format_Grayscale8).copy() #detach from the array
+        if (temp_pixmaps == 1):
+            self.input_image = QPixmap(self.conversion_image) #create input image
+            self.output_image = QPixmap(self.conversion_image) #create output image
+        self.ClearArray()
+        return 1
+
+    def ClearArray(self):
+        """Makes the converted image the size of the image, filled with 0"""
+        if (self.packed_mode == 1):
+            self.image_packed = np.zeros( (self.image_array_height, (self.image_array_width + 7) // 8), dtype=np.uint8)
+            self.image_array = np.zeros( (0, 0) )
+        else:
+            self.image_packed = None
+            self.image_array = np.zeros( (self.image_array_height, self.image_array_width) )
+
     cdef void Threshold2(self, double temp_threshold, int i_w, int e_w):
         """cythonize function
 
@@ -168,8 +282,57 @@ cdef class ImageConverter():
                 if (gray < temp_threshold):
                     self.image_array[h, w] = 1
 
+    cdef void ThresholdVector(self, double temp_threshold, int i_w, int e_w):
+        """numpy version of Threshold2, takes a strip of rows of the image
+        per array operation instead of asking Qt for every pixel"""
+        cdef int h_start
+        cdef int h_end
+
+        self.occupancy = None
+        if (self.gray_image is not None): #opened from memory, opaque gray needs no conversion
+            temp_pixels = self.gray_image
+        else:
+            temp_image = self.conversion_image
+            if (temp_image.format() != QImage.Format_ARGB32):
+                temp_image = temp_image.convertToFormat(QImage.Format_ARGB32) #not premultiplied, same values as pixelColor
+            temp_pixels = QImageToArray(temp_image) #0xAARRGGBB per pixel
+        temp_array = np.asarray(self.image_array)
+
+        for h_start in range(0, self.image_array_height, THRESHOLD_STRIP_ROWS):
+            h_end = min(h_start + THRESHOLD_STRIP_ROWS, self.image_array_height)
+            temp_strip = temp_pixels[h_start:h_end, i_w:e_w]
+            if (self.gray_image is not None):
+                gray = temp_strip #(3 * gray) / 3 * 1.0 + 0.0 of an opaque pixel is gray itself
+            else:
+                #same order of operations as Threshold2, so the results match to the bit
+                falpha = (temp_strip >> 24) / 255.0
+                gray = ((temp_strip >> 16) & 255) + ((temp_strip >> 8) & 255) + (temp_strip & 255)
+                gray = gray / 3
+                gray *= falpha
+                gray += 255 * (1.0 - falpha)
+            if (self.packed_mode == 1): #or the bits into the packed rows
+                temp_mask = np.zeros((h_end - h_start, self.image_array_width), dtype=np.bool_)
+                temp_mask[:, i_w:e_w] = gray < temp_threshold
+                self.image_packed[h_start:h_end] |= np.packbits(temp_mask, axis=1)
+            else:
+                temp_array[h_start:h_end, i_w:e_w][gray < temp_threshold] = 1
+
     cpdef void Threshold(self, float temp_threshold):
-        self.Threshold2(temp_threshold, 0, self.image_array_width) 
+        """Converts the image with the threshold, replacing the ink of any earlier threshold"""
+        self.threshold = temp_threshold
+        with THRESHOLD_SECONDS.Time(), GetTracer().Span('threshold', 'convert'):
+            self.ClearArray() #the conversion only sets dots, a lower threshold must not keep the old ones
+            self.ThresholdVector(temp_threshold, 0, self.image_array_width)
+
+    cpdef void ThresholdPixel(self, float temp_threshold):
+        """Per pixel threshold, kept as reference for the vector version"""
+        self.ClearArray()
+        cdef int temp_packed = self.IsPacked()
+        if (temp_packed == 1): #Threshold2 only writes image_array
+            self.Unpack()
+        self.Threshold2(temp_threshold, 0, self.image_array_width)
+        if (temp_packed == 1):
+            self.Pack()
 
     def Convert(self):
         """Takes the threshold image and converts it to an inkjet image array"""
@@ -205,8 +368,69 @@ cdef class ImageConverter():
                     temp_image.setPixelColor(w, h, temp_color_0)
         self.output_image = QPixmap(temp_image)
 
-    cpdef void ArrayToImage(self):
-        self.ArrayToImage2()
+    cdef void ArrayToImageVector(self, int temp_preview_size):
+        """Take the conversion array and pack it to a bilevel output image in one step,
+        with a preview size, only renders the image at that size"""
+        if (temp_preview_size > 0):
+            temp_array = ArrayToPreview(self.GetArray(), temp_preview_size)
+            self.output_image = QPixmap(ArrayToGrayImage(temp_array))
+        else:
+            self.output_image = QPixmap(PackedToMonoImage(self.GetPacked(), self.image_array_width))
+
+    cpdef void ArrayToImage(self, int temp_preview_size=0):
+        """Renders the output image, 0 for full size or the preview size in pixels"""
+        with RENDER_SECONDS.Time():
+            self.ArrayToImageVector(temp_preview_size)
+
+    def SetPackedMode(self, temp_mode):
+        """Sets whether the converted image is stored bit packed (1) or as array (0),
+        converts the image already loaded"""
+        self.packed_mode = int(temp_mode)
+        if (self.packed_mode == 1):
+            self.Pack()
+        else:
+            self.Unpack()
+
+    def Pack(self):
+        """Moves image_array to the bit packed image_packed (8 dots per byte) and frees the array"""
+        if (self.image_array is not None and self.image_array.shape[0] == self.image_array_height
+                and self.image_array.shape[1] == self.image_array_width):
+            self.image_packed = np.packbits(np.asarray(self.image_array) != 0, axis=1)
+            self.image_array = np.zeros((0, 0))
+
+    def Unpack(self):
+        """Moves image_packed back to image_array"""
+        if (self.image_packed is not None):
+            self.image_array = self.GetArray().astype(np.double)
+            self.image_packed = None
+
+    def IsPacked(self):
+        """Returns 1 if the image is currently stored bit packed"""
+        if (self.image_packed is not None):
+            return 1
+        return 0
+
+    def GetBand(self, temp_start, temp_end):
+        """Returns rows temp_start to temp_end of the converted image as a uint8 array of 0 and 1,
+        a column of the band is a burst line for the printhead"""
+        if (self.image_packed is not None):
+            #sliced to the width instead of unpackbits count=, which needs numpy 1.17
+            return np.unpackbits(self.image_packed[temp_start:temp_end], axis=1)[:, :self.image_array_width]
+        return (np.asarray(self.image_array[temp_start:temp_end]) != 0).view(np.uint8)
+
+    def GetArray(self):
+        """Returns the entire converted image as a uint8 array of 0 and 1"""
+        return self.GetBand(0, self.image_array_height)
+
+    def GetPackedBand(self, temp_start, temp_end):
+        """Returns rows temp_start to temp_end of the converted image bit packed along the rows (MSB first)"""
+        if (self.image_packed is not None):
+            return self.image_packed[temp_start:temp_end]
+        return np.packbits(np.asarray(self.image_array[temp_start:temp_end]) != 0, axis=1)
+
+    def GetPacked(self):
+        """Returns the entire converted image bit packed along the rows (MSB first)"""
+        return self.GetPackedBand(0, self.image_array_height)
 
     def RGBToImage(self):
         """Takes the only the RGB of an image and writes it to output"""
@@ -236,17 +460,30 @@ cdef class ImageConverter():
                 self.temp_image.setPixelColor(w,h,self.temp_color)
         self.output_image = QPixmap(self.temp_image)
 
+    def SetLayerCacheBudget(self, temp_bytes):
+        """Sets how many bytes of rasterized svg layers are kept, 0 to not cache layers"""
+        self.layer_cache.SetBudget(temp_bytes)
+
     def SVGGetData(self):
-        """Gets data like image size, image pixel size and layers from the svg, inputed as a path to svg"""
+        """Gets data like image size, image pixel size and layers from the svg, inputed as a path to svg.
+        Indexes the byte offset of every layer in the same pass, so a layer is read without scanning the file"""
         #print("getting data from svg file")
         #print(str(temp_input_data))
 
         temp_layer_counter = 0 #clear number of layers counter
         self.svg_layer_names = [] #clear layer array
         self.svg_layer_height = [] #clear height array
-
-        with open(self.file_path) as file_object:
-            for L in file_object:
+        self.svg_layer_offsets = [] #clear offset array
+
+        temp_offset = 0 #byte offset of the current line
+        with open(self.file_path, 'rb') as file_object:
+            for temp_raw in file_object:
+                temp_line_offset = temp_offset
+                temp_offset += len(temp_raw)
+                #only the header and layer lines are decoded, polygons are skipped
+                if not (temp_raw.startswith(b'<svg ') or temp_raw.startswith(b'  <g ')):
+                    continue
+                L = temp_raw.decode('utf-8', 'replace')
                 #print(L.rstrip())
                 if (L.startswith('<svg ')): #decode svg data
                     #print("svg data found")
@@ -289,6 +526,7 @@ cdef class ImageConverter():
                             temp_layer_counter += 1
                             temp_layer_name = temp_decode[0]
                             self.svg_layer_names.append(temp_layer_name)
+                            self.svg_layer_offsets.append(temp_line_offset)
                             #print(temp_layer_name)
                         if (temp_decode[0].lstrip() == 'slic3r:z='): #get layer height
                             #print("Getting layer height")
@@ -314,7 +552,8 @@ cdef class ImageConverter():
         #print(self.svg_layer_height)
 
     def SVGLayerToArray(self, temp_layer):
-        """Reads the layer in the Slic3r SVG file and converts it to array"""
+        """Reads the layer in the Slic3r SVG file and converts it to array, returns 1 if the layer was rendered.
+        Layers rendered before come from the layer cache"""
         #Behold the magnificence.
         #Instead of taking an SVG library to handle the parsing of SVG files like a sane person
         #I went out of my way to write one myself. Why you might ask.
@@ -323,18 +562,68 @@ cdef class ImageConverter():
         #It works surprisingly well on slic3r svg's. I do not care much for other svg files
         #proceed with caution.
 
-        if (temp_layer >= self.svg_layers): #if requested layer exceeds available
+        if (temp_layer < 0 or temp_layer >= self.svg_layers): #if requested layer exceeds available
             return 0
 
-        temp_line_found = 0
-        with open(self.file_path) as file_object:
-            for L in file_object:
-                #print(L.rstrip())
+        self.image_packed = None
+        self.occupancy = None
+        temp_key = (temp_layer, self.dpi)
+        temp_packed = self.layer_cache.Get(temp_key)
+        if (temp_packed is not None):
+            if (self.packed_mode == 1):
+                self.image_packed = temp_packed #cached layers are never written to
+                self.image_array = np.zeros( (0, 0) )
+            else:
+                self.image_array = np.unpackbits(temp_packed, axis=1)[:, :self.image_array_width].astype(np.double)
+            return 1
+
+        #even-odd scanline fill of all polygons of the layer at once
+        with SVG_LAYER_SECONDS.Time():
+            temp_crossings = Crossings([ParsePoints(temp_points) for temp_points in self.SVGLayerPolygons(temp_layer)],
+                                       self.image_array_height, self.image_array_width, 25.4 / self.dpi)
+            if (self.packed_mode == 1):
+                temp_filled = np.zeros( (self.image_array_height, self.image_array_width), dtype=np.uint8)
+            else:
+                temp_filled = np.zeros( (self.image_array_height, self.image_array_width) ) #fill the image array itself
+            FillSpans(temp_filled, *Spans(temp_crossings, self.image_array_width))
+            temp_packed = np.packbits(temp_filled != 0, axis=1)
+        self.layer_cache.Put(temp_key, temp_packed)
+        if (self.packed_mode == 1):
+            self.image_packed = temp_packed
+            self.image_array = np.zeros( (0, 0) )
+        else:
+            self.image_array = temp_filled
+        return 1
 
-                #look for the right layer, if found, set line to right one
-                if (L.startswith('  <g ')): #decode layer data
-                    #print("layer data found")
-                    temp_decode = L.partition('  <g ') #partition the svg header away
+    def SVGLayerToArrayPixel(self, temp_layer):
+        """Renders a layer with the per pixel toggle algorithm, uncached,
+        the reference SVGLayerToArray is validated against"""
+        if (temp_layer < 0 or temp_layer >= self.svg_layers): #if requested layer exceeds available
+            return 0
+        self.image_packed = None
+        self.occupancy = None
+        self.image_array = np.zeros( (self.image_array_height, self.image_array_width) ) #clear image array
+        for temp_points in self.SVGLayerPolygons(temp_layer):
+            self.ArrayAddPolygon(temp_points)
+        self.ArrayConvert() #convert flip points to image
+        if (self.packed_mode == 1):
+            self.Pack()
+        return 1
+
+    def SVGLayerPolygons(self, temp_layer):
+        """Returns the points strings of all polygons in a layer of the Slic3r SVG file"""
+        temp_polygons = []
+        with open(self.file_path, 'rb') as file_object:
+            file_object.seek(self.svg_layer_offsets[temp_layer]) #go to the <g line of the layer
+            file_object.readline()
+            for temp_raw in file_object:
+                #look for data until end of layer is found
+                if (temp_raw.startswith(b'  </g>')):
+                    break
+                if (temp_raw.startswith(b'    <polygon ')): #decode polygon data
+                    L = temp_raw.decode('utf-8', 'replace')
+                    #print("polygon found")
+                    temp_decode = L.partition('    <polygon ') #partition the svg header away
                     temp_decode = temp_decode[2] #set remainder as new string
                     while(True):
                         temp_decode = temp_decode.partition('"') #get next bit of data
@@ -343,55 +632,21 @@ cdef class ImageConverter():
                         if (temp_decode[1] != '"'): #break from while when the partition character is no longer found
                             break
 
-                        if (temp_decode[0].lstrip() == 'id='): #get layer data
-                            #print("Getting layer data")
+                        if (temp_decode[0].lstrip() == 'points='): #get point data
+                            #print("Getting point data")
                             temp_decode = temp_decode[2].partition('"')
-                            temp_layer_name = temp_decode[0]
-                            if (temp_layer_name == self.svg_layer_names[temp_layer]):
-                                temp_line_found = 1
-                                temp_toggle_array = np.zeros( (self.image_array_height, self.image_array_width) ) #clear image array
-                                self.image_array = np.zeros( (self.image_array_height, self.image_array_width) ) #clear image array
-                                #print(temp_layer_name)
+                            temp_points = temp_decode[0]
+                            #print(temp_points)
+
+                            temp_polygons.append(temp_points)
 
                         #set to read next part
                         temp_decode = temp_decode[2]
-
-                #start looking for data until end of layer is found
-                if (temp_line_found == 1):
-                    if (L.startswith('    <polygon ')): #decode polygon data
-                        #print("polygon found")
-                        temp_decode = L.partition('    <polygon ') #partition the svg header away
-                        temp_decode = temp_decode[2] #set remainder as new string
-                        while(True):
-                            temp_decode = temp_decode.partition('"') #get next bit of data
-                            #print(temp_decode)
-                            #check exit requirements
-                            if (temp_decode[1] != '"'): #break from while when the partition character is no longer found
-                                break
-
-                            if (temp_decode[0].lstrip() == 'points='): #get point data
-                                #print("Getting point data")
-                                temp_decode = temp_decode[2].partition('"')
-                                temp_points = temp_decode[0]
-                                #print(temp_points)
-
-                                self.ArrayAddPolygon(temp_points)
-
-
-
-
-                            #set to read next part
-                            temp_decode = temp_decode[2]
-
-                    if (L.startswith('  </g>')): #decode polygon data
-                        #print("polygon end")
-                        temp_line_found = 0
-
-                        #convert flip points to image
-                        self.ArrayConvert()
+        return temp_polygons
 
     def ArrayAddPolygon(self, temp_input):
-        """add a string with coordinates to the toggle point image array"""
+        """add a string with coordinates to the toggle point image array,
+        the per pixel reference of the scanline fill in Rasterizer"""
         #move from point to point. Wherever the points intersect with the array, frip bit from 1 to 0 or 0 to 1
 
         #15,35 10,35 10,25 5,25 5,35 0,35 0,20 15,20 #normal output
@@ -0,0 +1,66 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#Gantry kinematics shared by the print planner, the device emulator and the print simulator.
+#Every move starts and ends at standstill with a trapezoid speed profile.
+#Speeds are in mm/s, acceleration in mm/s^2
+
+import math
+
+
+def ProfileTime(distance: float, speed: float, acceleration: float) -> float:
+    """Returns the seconds a move takes from standstill to standstill"""
+    if distance <= 0.0:
+        return 0.0
+    ramp = speed * speed / acceleration #distance to speed up and slow down
+    if distance >= ramp:
+        return distance / speed + speed / acceleration
+    return 2.0 * math.sqrt(distance / acceleration) #never reaches full speed
+
+
+def ProfileDistance(distance: float, speed: float, acceleration: float, elapsed: float) -> float:
+    """Returns the distance covered after elapsed seconds of a move of ProfileTime"""
+    total = ProfileTime(distance, speed, acceleration)
+    if elapsed >= total:
+        return distance
+    if elapsed <= 0.0:
+        return 0.0
+    peak = min(speed, math.sqrt(distance * acceleration)) #top speed of the move
+    ramp_time = peak / acceleration
+    if elapsed < ramp_time:
+        return 0.5 * acceleration * elapsed * elapsed
+    if elapsed > total - ramp_time:
+        left = total - elapsed
+        return distance - 0.5 * acceleration * left * left
+    return 0.5 * peak * ramp_time + peak * (elapsed - ramp_time)
+
+
+def ProfileTimeAt(distance: float, speed: float, acceleration: float, covered: float) -> float:
+    """Returns the seconds after the start of a move at which covered mm are passed,
+    the inverse of ProfileDistance"""
+    if covered <= 0.0 or distance <= 0.0:
+        return 0.0
+    total = ProfileTime(distance, speed, acceleration)
+    if covered >= distance:
+        return total
+    peak = min(speed, math.sqrt(distance * acceleration))
+    ramp_time = peak / acceleration
+    ramp = 0.5 * peak * ramp_time #distance covered while speeding up
+    if covered < ramp:
+        return math.sqrt(2.0 * covered / acceleration)
+    if covered > distance - ramp:
+        return total - math.sqrt(2.0 * (distance - covered) / acceleration)
+    return ramp_time + (covered - ramp) / peak
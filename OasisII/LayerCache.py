@@ -0,0 +1,89 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+
+#The layer cache keeps rasterized layers of a vector file, bit packed, so going back and
+#forth between layers does not parse and rasterize them again.
+#Least recently used layers are dropped once the cache is over its memory budget
+
+import collections
+import threading
+
+
+class LayerCache:
+    """Thread safe LRU cache of bit packed layer arrays with a memory budget in bytes"""
+
+    def __init__(self, memory_budget: int = 64 << 20):
+        self.memory_budget = int(memory_budget) #0 disables the cache
+        self.layers = collections.OrderedDict() #key to packed array, least recently used first
+        self.byte_count = 0 #bytes of all cached arrays
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.layers)
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            return key in self.layers
+
+    def Bytes(self) -> int:
+        """Returns the memory used by the cached arrays"""
+        return self.byte_count
+
+    def Get(self, key):
+        """Returns the cached array of a key and marks it as most recently used, None if not cached"""
+        with self.lock:
+            packed = self.layers.get(key)
+            if packed is None:
+                self.misses += 1
+                return None
+            self.layers.move_to_end(key)
+            self.hits += 1
+            return packed
+
+    def Put(self, key, packed) -> bool:
+        """Caches an array, dropping least recently used arrays to stay within the budget.
+        Returns False if the array alone is larger than the budget, it is not cached then"""
+        with self.lock:
+            if key in self.layers:
+                self.byte_count -= self.layers.pop(key).nbytes
+            if packed.nbytes > self.memory_budget:
+                return False
+            self.layers[key] = packed
+            self.byte_count += packed.nbytes
+            self.Trim()
+            return True
+
+    def Trim(self):
+        """Drops least recently used arrays until the cache is within the budget, call with the lock held"""
+        while self.byte_count > self.memory_budget and self.layers:
+            key, packed = self.layers.popitem(last=False)
+            self.byte_count -= packed.nbytes
+
+    def SetBudget(self, memory_budget: int):
+        """Changes the memory budget, dropping arrays if the cache is over the new budget"""
+        with self.lock:
+            self.memory_budget = int(memory_budget)
+            self.Trim()
+
+    def Clear(self):
+        """Drops all cached arrays"""
+        with self.lock:
+            self.layers.clear()
+            self.byte_count = 0
@@ -0,0 +1,204 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+
+#The layer precompute renders and plans the layers of an opened svg in worker processes,
+#ahead of the layer the operator is on. Rendered layers stream into the layer cache of the
+#image converter and plans are kept here, so moving to the next layer and printing it does
+#not wait for conversion.
+#Only a window of layers after the current one is worked on, as many as fit in the layer
+#cache, so layers that are needed soon are never pushed out by layers far ahead.
+
+import concurrent.futures
+import copy
+import functools
+import multiprocessing
+import threading
+import traceback
+
+_worker_converter = None #image converter of a worker process
+
+
+def _InitWorker(file_path: str, dpi: int, height: int, width: int, layer_names, layer_offsets):
+    """Sets up the image converter of a worker process with the index of the svg"""
+    global _worker_converter
+    from ImageConverter import ImageConverter #workers only, loads Qt in the worker process
+    _worker_converter = ImageConverter()
+    _worker_converter.SetDPI(dpi)
+    _worker_converter.SetLayerCacheBudget(0) #every layer is rendered once, the main process caches it
+    _worker_converter.packed_mode = 1
+    _worker_converter.file_path = file_path
+    _worker_converter.file_type = 2
+    _worker_converter.image_array_height = height
+    _worker_converter.image_array_width = width
+    _worker_converter.svg_layer_names = list(layer_names)
+    _worker_converter.svg_layer_offsets = list(layer_offsets)
+    _worker_converter.svg_layers = len(layer_offsets)
+
+
+def _RenderLayer(layer: int, planner, x_start_pos: float, y_start_pos: float):
+    """Renders a layer in a worker process, returns (bit packed layer, print plan)"""
+    _worker_converter.SVGLayerToArray(layer)
+    plan = None
+    if planner is not None:
+        plan = planner.Compile(_worker_converter, x_start_pos, y_start_pos)
+    return _worker_converter.GetPacked(), plan
+
+
+class LayerPrecompute:
+    """Background rendering and planning of svg layers in a process pool"""
+
+    def __init__(self, workers: int = None):
+        self.workers = workers #worker processes, None for one per cpu
+        self.executor = None
+        self.imageconverter = None
+        self.planner = None #copy of the planner at start, the workers plan with these settings
+        self.start_position = None #function of the layer returning its (x, y) start position in mm
+        self.on_progress = None #called with (layers ready, layers total) from a background thread
+        self.futures = {} #layer to future of the layers being worked on
+        self.plans = {} #layer to print plan of the finished layers, from the current layer on
+        self.ready = set() #all finished layers, less the ones the layer cache dropped since
+        self.cached = set() #finished layers that went into the layer cache
+        self.failed = set() #layers the worker raised on, they are rendered on demand
+        self.total = 0
+        self.current_layer = 0
+        self.window = 0 #layers worked on after the current layer
+        self.dpi = 0
+        self.generation = 0 #raised on every start and cancel, results of an older run are dropped
+        self.condition = threading.Condition()
+
+    def Start(self, imageconverter, planner=None, first_layer: int = 0):
+        """Starts working on the layers of the svg opened in the image converter, from first layer on.
+        Without a planner only the layers are rendered"""
+        self.Cancel()
+        with self.condition:
+            self.imageconverter = imageconverter
+            self.planner = copy.copy(planner)
+            self.dpi = imageconverter.GetDPI()
+            self.total = imageconverter.svg_layers
+            self.current_layer = first_layer
+            self.window = self.WindowSize()
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=_InitWorker,
+                initargs=(imageconverter.file_path, self.dpi, imageconverter.image_array_height,
+                          imageconverter.image_array_width, imageconverter.svg_layer_names,
+                          imageconverter.svg_layer_offsets))
+            self.SubmitWindow()
+
+    def WindowSize(self) -> int:
+        """Returns how many layers after the current one fit in the layer cache next to it"""
+        layer_bytes = max(self.imageconverter.image_array_height * ((self.imageconverter.image_array_width + 7) // 8), 1)
+        return max(self.imageconverter.layer_cache.memory_budget // layer_bytes - 1, 1)
+
+    def SubmitWindow(self):
+        """Hands the layers of the window that are not done or underway to the workers, call with the condition held"""
+        if self.executor is None:
+            return
+        self.DropEvicted()
+        for layer in range(self.current_layer, min(self.current_layer + self.window + 1, self.total)):
+            if layer in self.futures or layer in self.ready or layer in self.failed:
+                continue
+            x_start_pos, y_start_pos = (0.0, 0.0)
+            if self.start_position is not None:
+                x_start_pos, y_start_pos = self.start_position(layer)
+            future = self.executor.submit(_RenderLayer, layer, self.planner, x_start_pos, y_start_pos)
+            self.futures[layer] = future
+            future.add_done_callback(functools.partial(self.LayerDone, self.generation, layer))
+
+    def LayerDone(self, generation: int, layer: int, future):
+        """Stores the result of a worker, called from the executor when a layer is finished"""
+        if future.cancelled():
+            return
+        with self.condition:
+            if generation != self.generation:
+                return
+            del self.futures[layer]
+            try:
+                packed, plan = future.result()
+            except Exception:
+                print("Precompute of layer " + str(layer) + " failed")
+                traceback.print_exc()
+                self.failed.add(layer)
+            else:
+                if self.imageconverter.layer_cache.Put((layer, self.dpi), packed):
+                    self.cached.add(layer)
+                if layer >= self.current_layer:
+                    self.plans[layer] = plan
+                self.ready.add(layer)
+            self.condition.notify_all()
+            progress = (len(self.ready), self.total)
+        if self.on_progress is not None:
+            self.on_progress(*progress)
+
+    def DropEvicted(self):
+        """Forgets the finished layers the layer cache dropped, so they are rendered again.
+        Call with the condition held"""
+        for layer in [layer for layer in self.cached if (layer, self.dpi) not in self.imageconverter.layer_cache]:
+            self.cached.discard(layer)
+            self.ready.discard(layer)
+
+    def SetCurrentLayer(self, layer: int):
+        """Moves the window to a layer, drops what is behind it and works on the layers after it"""
+        with self.condition:
+            self.current_layer = layer
+            for old_layer in [old for old in self.plans if old < layer]:
+                del self.plans[old_layer]
+            for old_layer in [old for old in self.futures if old < layer]:
+                if self.futures[old_layer].cancel():
+                    del self.futures[old_layer]
+            self.SubmitWindow()
+
+    def IsReady(self, layer: int) -> bool:
+        """Returns True if a layer is rendered and planned"""
+        with self.condition:
+            self.DropEvicted()
+            return layer in self.ready
+
+    def GetPlan(self, layer: int, timeout=None):
+        """Returns the plan of a layer, waits if a worker is on it.
+        None if the layer is not precomputed, or without a planner"""
+        with self.condition:
+            self.condition.wait_for(lambda: layer not in self.futures, timeout)
+            return self.plans.get(layer)
+
+    def Progress(self):
+        """Returns (layers ready, layers total)"""
+        with self.condition:
+            self.DropEvicted()
+            return len(self.ready), self.total
+
+    def IsRunning(self) -> bool:
+        """Returns True while workers are on layers"""
+        with self.condition:
+            return len(self.futures) > 0
+
+    def Cancel(self):
+        """Stops all work, layers already in the layer cache stay there"""
+        with self.condition:
+            self.generation += 1
+            for future in self.futures.values():
+                future.cancel()
+            self.futures.clear()
+            self.plans.clear()
+            self.ready.clear()
+            self.cached.clear()
+            self.failed.clear()
+            executor = self.executor
+            self.executor = None
+            self.condition.notify_all()
+        if executor is not None:
+            executor.shutdown(wait=False) #the queued futures are cancelled above, cancel_futures needs python 3.9
@@ -0,0 +1,66 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#The line framer cuts the bytes read from a serial port into lines.
+#Every read gives all lines it completes at once, only the unfinished end is kept for the next read.
+#Lines stay bytes, so only lines that are used get decoded
+
+import json
+
+
+class LineFramer:
+    """Incremental splitter of a byte stream into '\\n' terminated lines"""
+
+    def __init__(self, max_line: int = 4096):
+        self.buffer = bytearray() #the unfinished line
+        self.max_line = max_line #an unfinished line longer than this is garbage and dropped
+        self.dropped = 0 #bytes dropped
+
+    def Feed(self, data) -> list:
+        """Adds read bytes, returns the list of lines completed by them
+        (bytes like, without the '\\n', a '\\r' before it is kept)"""
+        if self.buffer:
+            self.buffer += data
+            lines = self.buffer.split(b'\n')
+        else:
+            lines = data.split(b'\n') #one split in C for all lines of the read
+        rest = lines.pop() #the unfinished line, empty if the read ended with '\n'
+        self.buffer.clear()
+        if rest:
+            if len(rest) > self.max_line:
+                self.dropped += len(rest)
+            else:
+                self.buffer += rest
+        return lines
+
+    def Pending(self) -> int:
+        """Returns the amount of bytes of the unfinished line"""
+        return len(self.buffer)
+
+    def Clear(self) -> None:
+        """Forgets the unfinished line"""
+        self.buffer.clear()
+
+
+def TraceRecord(trace_file, data) -> None:
+    """Writes one read to a trace file, one JSON string per read"""
+    trace_file.write(json.dumps(bytes(data).decode('latin-1')) + '\n')
+
+
+def TraceLoad(path) -> list:
+    """Returns the reads recorded in a trace file as a list of bytes"""
+    with open(path, 'r') as trace_file:
+        return [json.loads(line).encode('latin-1') for line in trace_file if line.strip()]
@@ -0,0 +1,254 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+
+#Metrics of the print pipeline: counters, gauges, histograms and timers, kept by name in one registry
+#shared by the whole program (GetMetrics). They are off by default, then every update returns at its
+#first check, so the hot paths (the serial reactor, the threshold) pay one attribute lookup.
+#Enable writes a snapshot every interval seconds, as json and as Prometheus text
+#(for the textfile collector of node_exporter). Rates, like lines sent per second, are in the json
+#snapshot as the change of every counter since the snapshot before, Prometheus makes its own with rate()
+
+import bisect
+import json
+import os
+import threading
+import time
+
+#seconds, from a serial round trip up to a long sweep
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+#lines or bytes, for buffer fill
+FILL_BUCKETS = (0, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class Counter:
+    """A count that only goes up, like lines sent"""
+    kind = 'counter'
+
+    def __init__(self, registry, name: str, help_text: str):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.Clear()
+
+    def Clear(self) -> None:
+        self.value = 0
+
+    def Inc(self, amount=1) -> None:
+        if not self.registry.enabled:
+            return
+        with self.registry.lock:
+            self.value += amount
+
+    def Snapshot(self) -> dict:
+        return {'value': self.value}
+
+
+class Gauge:
+    """A value that goes up and down, like the lines waiting in a buffer"""
+    kind = 'gauge'
+
+    def __init__(self, registry, name: str, help_text: str):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.Clear()
+
+    def Clear(self) -> None:
+        self.value = 0
+
+    def Set(self, value) -> None:
+        if not self.registry.enabled:
+            return
+        self.value = value
+
+    def Snapshot(self) -> dict:
+        return {'value': self.value}
+
+
+class Histogram:
+    """Counts observations in buckets of upper bounds, with their count, sum, minimum and maximum"""
+    kind = 'histogram'
+
+    def __init__(self, registry, name: str, help_text: str, buckets=TIME_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.Clear()
+
+    def Clear(self) -> None:
+        self.counts = [0] * (len(self.buckets) + 1) #the last one is above every bound
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def Observe(self, value) -> None:
+        if not self.registry.enabled:
+            return
+        with self.registry.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def Time(self):
+        """Returns a context manager that observes the seconds its block takes"""
+        return Timer(self)
+
+    def Snapshot(self) -> dict:
+        return {'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max,
+                'mean': self.sum / self.count if self.count > 0 else None,
+                'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self.counts))}
+
+
+class Timer:
+    """Observes the seconds between enter and exit in a histogram, does not read the clock when disabled"""
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        if self.histogram.registry.enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        if self.start is not None:
+            self.histogram.Observe(time.perf_counter() - self.start)
+            self.start = None
+        return False
+
+
+class Metrics:
+    """The registry, metrics are made once (at import or in __init__) and updated by their object"""
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.start_time = time.time()
+        self.last_values = {} #counter values at the last snapshot, for the rates
+        self.last_time = self.start_time
+        self.interval = 5.0 #seconds between snapshot files
+        self.path = None #snapshot files are path + .json and path + .prom, None for no files
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def Get(self, kind, name: str, help_text: str, *args):
+        """Returns the metric of that name, made the first time"""
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = kind(self, name, help_text, *args)
+            return self.metrics[name]
+
+    def Counter(self, name: str, help_text: str = '') -> Counter:
+        return self.Get(Counter, name, help_text)
+
+    def Gauge(self, name: str, help_text: str = '') -> Gauge:
+        return self.Get(Gauge, name, help_text)
+
+    def Histogram(self, name: str, help_text: str = '', buckets=TIME_BUCKETS) -> Histogram:
+        return self.Get(Histogram, name, help_text, buckets)
+
+    def Enable(self, path: str = None, interval: float = 5.0) -> None:
+        """Starts recording, and with a path writing the snapshot files every interval seconds"""
+        self.enabled = True
+        self.path = path
+        self.interval = interval
+        if path is not None and self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.Run, daemon=True)
+            self.thread.start()
+
+    def Disable(self) -> None:
+        """Stops recording, writes the last snapshot files"""
+        self.enabled = False
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def Reset(self) -> None:
+        """Forgets all recorded values, the metrics stay"""
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.Clear()
+            self.start_time = self.last_time = time.time()
+            self.last_values = {}
+
+    def Run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.WriteSnapshot()
+        self.WriteSnapshot()
+
+    def Snapshot(self) -> dict:
+        """Returns all values, and per counter the change per second since the snapshot before"""
+        now = time.time()
+        with self.lock:
+            metrics = {name: dict(metric.Snapshot(), type=metric.kind) for name, metric in self.metrics.items()}
+            elapsed = now - self.last_time
+            rates = {}
+            for name, metric in self.metrics.items():
+                if metric.kind == 'counter':
+                    rates[name] = (metric.value - self.last_values.get(name, 0)) / elapsed if elapsed > 0 else 0.0
+                    self.last_values[name] = metric.value
+            self.last_time = now
+        return {'time': now, 'uptime': now - self.start_time, 'metrics': metrics, 'rates': rates}
+
+    def Prometheus(self) -> str:
+        """Returns all values in the Prometheus text format"""
+        lines = []
+        with self.lock:
+            for name, metric in sorted(self.metrics.items()):
+                if metric.help:
+                    lines.append('# HELP %s %s' % (name, metric.help))
+                lines.append('# TYPE %s %s' % (name, metric.kind))
+                if metric.kind == 'histogram':
+                    total = 0
+                    for bound, count in zip([repr(float(bound)) for bound in metric.buckets] + ['+Inf'], metric.counts):
+                        total += count #Prometheus buckets are cumulative
+                        lines.append('%s_bucket{le="%s"} %d' % (name, bound, total))
+                    lines.append('%s_sum %r' % (name, float(metric.sum)))
+                    lines.append('%s_count %d' % (name, metric.count))
+                else:
+                    lines.append('%s %r' % (name, float(metric.value)))
+        return '\n'.join(lines) + '\n'
+
+    def WriteSnapshot(self, path: str = None) -> None:
+        """Writes path.json and path.prom, each replaced at once so a reader never sees half a file"""
+        path = path or self.path
+        if path is None:
+            return
+        for extension, text in (('.json', json.dumps(self.Snapshot(), indent=1)), ('.prom', self.Prometheus())):
+            temp_path = path + extension + '.tmp'
+            with open(temp_path, 'w') as file_object:
+                file_object.write(text)
+            os.replace(temp_path, path + extension)
+
+
+_metrics = Metrics()
+
+
+def GetMetrics() -> Metrics:
+    """Returns the metrics registry shared by the whole program"""
+    return _metrics
@@ -0,0 +1,121 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#The occupancy index answers where the ink is in a converted image
+#without scanning the image again. Built once per image, used by the print planner
+
+import numpy as np
+
+
+class OccupancyIndex:
+    """Per row first and last inked column of an image, with sparse tables
+    so the inked column range of any band of rows is found in O(1).
+
+    Rows are the gantry (X) direction, columns the sweep (Y) direction,
+    the same as image_array in ImageConverter.
+    """
+
+    def __init__(self, row_first, row_last, width: int):
+        self.width = int(width)
+        self.height = len(row_first)
+        #first inked column per row, width if the row is empty
+        self.row_first = np.asarray(row_first, dtype=np.int32)
+        #last inked column per row, -1 if the row is empty
+        self.row_last = np.asarray(row_last, dtype=np.int32)
+        self.inked_rows = np.flatnonzero(self.row_last >= 0)
+
+        #level k holds the min/max over 2**k rows starting at each row
+        self.table_first = [self.row_first]
+        self.table_last = [self.row_last]
+        span = 1
+        while span * 2 <= self.height:
+            prev_first = self.table_first[-1]
+            prev_last = self.table_last[-1]
+            self.table_first.append(np.minimum(prev_first[:-span], prev_first[span:]))
+            self.table_last.append(np.maximum(prev_last[:-span], prev_last[span:]))
+            span *= 2
+
+    @classmethod
+    def FromArray(cls, image_array):
+        """Builds the index from a 2D array, non zero is ink"""
+        image_array = np.asarray(image_array) != 0
+        height, width = image_array.shape
+        row_first, row_last = cls._RowExtents(image_array, width)
+        return cls(row_first, row_last, width)
+
+    @classmethod
+    def FromImage(cls, imageconverter, band_rows: int = 256):
+        """Builds the index from an ImageConverter one band at a time,
+        so a bit packed image is never unpacked as a whole"""
+        width = imageconverter.image_array_width
+        height = imageconverter.image_array_height
+        row_first = np.empty(height, dtype=np.int32)
+        row_last = np.empty(height, dtype=np.int32)
+        for start in range(0, height, band_rows):
+            end = min(start + band_rows, height)
+            band = imageconverter.GetBand(start, end) != 0
+            row_first[start:end], row_last[start:end] = cls._RowExtents(band, width)
+        return cls(row_first, row_last, width)
+
+    @staticmethod
+    def _RowExtents(band, width: int):
+        """Returns the first and last inked column of every row in a boolean band"""
+        inked = band.any(axis=1)
+        first = np.where(inked, band.argmax(axis=1), width)
+        last = np.where(inked, width - 1 - band[:, ::-1].argmax(axis=1), -1)
+        return first, last
+
+    def IsEmpty(self) -> bool:
+        """Returns True if there is no ink in the entire image"""
+        return len(self.inked_rows) == 0
+
+    def RowMin(self) -> int:
+        """Returns the first row with ink, -1 if the image is empty"""
+        if self.IsEmpty():
+            return -1
+        return int(self.inked_rows[0])
+
+    def RowMax(self) -> int:
+        """Returns the last row with ink, -1 if the image is empty"""
+        if self.IsEmpty():
+            return -1
+        return int(self.inked_rows[-1])
+
+    def NextInkedRow(self, row: int) -> int:
+        """Returns the first row with ink at or after row, -1 if there is none"""
+        index = np.searchsorted(self.inked_rows, row)
+        if index >= len(self.inked_rows):
+            return -1
+        return int(self.inked_rows[index])
+
+    def BandExtents(self, row_start: int, row_end: int):
+        """Returns (first column, last column) with ink in rows row_start
+        up to (not including) row_end, None if the band is empty"""
+        row_start = max(int(row_start), 0)
+        row_end = min(int(row_end), self.height)
+        if row_end <= row_start:
+            return None
+        level = (row_end - row_start).bit_length() - 1
+        last_start = row_end - (1 << level)
+        col_first = min(self.table_first[level][row_start], self.table_first[level][last_start])
+        col_last = max(self.table_last[level][row_start], self.table_last[level][last_start])
+        if col_last < 0:
+            return None
+        return int(col_first), int(col_last)
+
+    def BandEmpty(self, row_start: int, row_end: int) -> bool:
+        """Returns True if rows row_start up to row_end hold no ink"""
+        return self.BandExtents(row_start, row_end) is None
@@ -5,6 +5,7 @@
 from PyQt5.QtGui import QPixmap, QColor, QImage
 from PyQt5 import QtCore
 from numpy import *
+import numpy as np
 import os
 import sys
 import subprocess
@@ -55,6 +56,66 @@ try:
 except ImportError:
     pass
 
+PDFTOPPM = shutil.which('pdftoppm')  # poppler, renders pages to memory
+
+
+def can_render_in_memory() -> bool:
+    """True if pages can be rendered straight to memory with pdftoppm"""
+    return PDFTOPPM is not None
+
+
+def parse_pgm_stream(data: bytes) -> list:
+    """Split a stream of binary PGM (P5) images, as pdftoppm -gray writes
+    them to stdout, in grayscale numpy arrays
+
+    Returns
+    -------
+    list of (height, width) uint8 arrays, 0 is black, 255 is white
+    """
+    pages = []
+    pos = 0
+    while pos < len(data):
+        # header: magic, width, height and maxval, separated by whitespace, comments start with #
+        fields = []
+        while len(fields) < 4:
+            while data[pos:pos + 1].isspace():
+                pos += 1
+            if data[pos:pos + 1] == b'#':
+                pos = data.index(b'\n', pos)
+                continue
+            end = pos
+            while end < len(data) and not data[end:end + 1].isspace():
+                end += 1
+            fields.append(data[pos:end])
+            pos = end
+        pos += 1  # single whitespace before the pixels
+        if fields[0] != b'P5' or int(fields[3]) > 255:
+            raise ValueError('not an 8 bit binary PGM image')
+        width, height = int(fields[1]), int(fields[2])
+        page = np.frombuffer(data, dtype=np.uint8, count=width * height, offset=pos)
+        pages.append(page.reshape(height, width))
+        pos += width * height
+        while pos < len(data) and data[pos:pos + 1].isspace():
+            pos += 1
+    return pages
+
+
+def render_pages(fname: str, first_page: int, last_page: int, dpi: int) -> list:
+    """Render pages first_page up to and including last_page (from 0) of a pdf
+    in grayscale numpy arrays, through a pipe from pdftoppm. No page files
+    are written and there is no lossy compression in between
+
+    Returns
+    -------
+    list of (height, width) uint8 arrays, 0 is black, 255 is white
+    """
+    out = subprocess.run([PDFTOPPM or 'pdftoppm', '-gray', '-r', str(dpi),
+                          '-f', str(first_page + 1), '-l', str(last_page + 1), fname],
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE,
+                         check=True)
+    return parse_pgm_stream(out.stdout)
+
 class PDFConverter:
     def __init__(self):
         self.dpi = 300  # default dpi to 300
@@ -231,13 +292,27 @@ class PDFConverter:
 
         for i in range(self.number_of_pages):
             pdfWriter = PyPDF2.PdfFileWriter()
-            outputpdf_name = self.file_name.split('.')[0] + str(i) + '.pdf'
 
             pdfWriter.addPage(self.pdfReader.getPage(i))
 
-            with open(os.path.join(self.working_dir, outputpdf_name), 'wb') as f:
+            with open(self.page_path(i), 'wb') as f:
                 pdfWriter.write(f)
 
+    def page_path(self, page: int) -> str:
+        """Path of the pdf of a single page, written by split_pdf
+
+        Parameters
+        ----------
+        page : int
+            page number, from 0
+
+        Returns
+        -------
+        path of the page pdf in the working dir
+        """
+        outputpdf_name = self.file_name.split('.')[0] + str(page) + '.pdf'
+        return os.path.join(self.working_dir, outputpdf_name)
+
     def convert_svg(self, fname: str, output_dir: str) -> None:
         """Convert a pdf to svg file
 
@@ -319,6 +394,24 @@ class PDFConverter:
 
         self.pdfFileObj.close()
 
+    def render_pages(self, first_page: int = 0, last_page: int = -1) -> list:
+        """Render pages of the opened pdf in memory, see render_pages
+
+        Parameters
+        ----------
+        first_page : int
+            first page, from 0
+        last_page : int
+            last page, included, -1 for the last page of the pdf
+
+        Returns
+        -------
+        list of grayscale uint8 arrays, one per page
+        """
+        if last_page < 0:
+            last_page = self.number_of_pages - 1
+        return render_pages(self.file_path, first_page, last_page, self.dpi)
+
     def convert_pdf_to_png(self) -> None:
         """Convert the pdf pages to png
 
@@ -0,0 +1,256 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+
+#The page pipeline turns the pages of a pdf into print plans while the printer prints.
+#Pages are rasterized, thresholded and planned in a process pool, and handed to the printer
+#in page order through a bounded queue. With poppler (pdftoppm) pages are rendered straight
+#to grayscale arrays in memory, otherwise every page is split to a pdf and rasterized to an
+#image file first. At most a window of pages is converted ahead of the
+#page being printed, so a long pdf never has all its pages in memory, and the first page
+#prints as soon as it is planned.
+
+import collections
+import concurrent.futures
+import copy
+import glob
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+from Metrics import GetMetrics
+from Tracer import GetTracer, TracedCall, Untraced
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.ppm', '.tif')
+PAGE_SECONDS = GetMetrics().Histogram('pdf_page_seconds', 'Seconds from handing a pdf page to the workers to its plan')
+
+
+def _PageConverter(dpi: int):
+    """Returns an image converter for a page in a worker process"""
+    from ImageConverter import ImageConverter #workers only, loads Qt in the worker process
+    converter = ImageConverter()
+    converter.SetDPI(dpi)
+    converter.SetPackedMode(1)
+    return converter
+
+
+def _RenderPage(pdf_path: str, page: int, dpi: int, threshold: float, planner,
+                x_start_pos: float, y_start_pos: float, key: str, render):
+    """Renders one page of the pdf to memory, thresholds and plans it in a worker process, returns the print plan"""
+    converter = _PageConverter(dpi)
+    with GetTracer().Span('page render', 'convert', {'page': page}):
+        gray = render(pdf_path, page, page, dpi)[0]
+    converter.OpenArray(gray, pdf_path, 0) #no pixmaps outside of the GUI thread
+    converter.Threshold(threshold)
+    with GetTracer().Span('plan page', 'plan', {'page': page}):
+        return planner.Compile(converter, x_start_pos, y_start_pos, key)
+
+
+def _ConvertPage(page_pdf: str, page_dir: str, dpi: int, threshold: float, planner,
+                 x_start_pos: float, y_start_pos: float, key: str, rasterize):
+    """Rasterizes the pdf of one page to an image file, thresholds and plans it in a worker process,
+    returns the print plan"""
+    os.makedirs(page_dir, exist_ok=True)
+    try:
+        with GetTracer().Span('page render', 'convert', {'page': page_pdf}):
+            rasterize(page_pdf, page_dir, dpi)
+        page_images = sorted(temp_path for temp_path in glob.glob(os.path.join(page_dir, '*'))
+                             if os.path.splitext(temp_path)[1].lower() in IMAGE_EXTENSIONS)
+        if not page_images:
+            raise RuntimeError("no image rendered from " + page_pdf)
+        converter = _PageConverter(dpi)
+        converter.OpenFile(page_images[0], 0) #no pixmaps outside of the GUI thread
+        if converter.image_array_width == 0:
+            raise RuntimeError("could not open " + page_images[0])
+        converter.Threshold(threshold)
+        with GetTracer().Span('plan page', 'plan', {'page': page_pdf}):
+            return planner.Compile(converter, x_start_pos, y_start_pos, key)
+    finally:
+        shutil.rmtree(page_dir, ignore_errors=True)
+
+
+class PagePipeline:
+    """Producer of the print plans of pdf pages, consumed in page order with Get"""
+
+    def __init__(self, window: int = 3, workers: int = None):
+        self.window = max(int(window), 1) #pages converted or waiting ahead of the printer
+        self.workers = workers #worker processes, None for one per cpu
+        self.executor = None
+        self.pages = collections.deque() #(page, future) submitted and not yet in the queue, in page order
+        self.submit_times = {} #perf_counter when a page went to the workers, by page
+        self.ready = queue.Queue(maxsize=self.window + 1) #(page, plan) in page order, (None, None) at the end
+        self.held = 0 #pages submitted and not taken by the printer yet
+        self.total = 0
+        self.done = 0 #pages taken by the printer
+        self.cancelled = False
+        self.on_progress = None #called with (pages converted, pages total) from the producer thread
+        self.condition = threading.Condition()
+        self.producer_thread = None
+
+    def Start(self, pdfconverter, planner, threshold: float, start_position, rasterize=None, render=None):
+        """Starts converting the pages of the pdf opened in the pdf converter.
+        start_position is a function of the page returning its (x, y) start position in mm and its side.
+        Pages are rendered to memory with render(pdf, first page, last page, dpi), or rasterized to files
+        with rasterize(page pdf, output dir, dpi), by default in memory when pdftoppm is installed"""
+        from PDFConverter import convert_png, render_pages, can_render_in_memory
+        if rasterize is None and render is None:
+            if can_render_in_memory():
+                render = render_pages
+            else:
+                rasterize = convert_png
+        self.Cancel()
+        self.Join() #the producer of the pdf before ends right away, its queue has room for the end
+        self.cancelled = False
+        self.ready = queue.Queue(maxsize=self.window + 1)
+        self.pages.clear()
+        self.submit_times.clear()
+        self.held = 0
+        self.done = 0
+        self.total = pdfconverter.number_of_pages
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'))
+        self.producer_thread = threading.Thread(target=self.Produce, name='page pipeline', daemon=True,
+            args=(pdfconverter, copy.copy(planner), threshold, start_position, rasterize, render))
+        self.producer_thread.start()
+
+    def Produce(self, pdfconverter, planner, threshold, start_position, rasterize, render):
+        """Producer thread: submits pages while the window has room and queues finished pages in order"""
+        if render is None:
+            pdfconverter.split_pdf() #single page pdfs for the rasterizer, small next to the rasterized pages
+        next_page = 0
+        converted = 0
+        while True:
+            with self.condition:
+                if self.cancelled:
+                    break
+                finished = []
+                while self.pages and self.pages[0][1].done():
+                    finished.append(self.pages.popleft())
+                submit = next_page < self.total and self.held < self.window
+                if not finished and not submit:
+                    if next_page >= self.total and not self.pages:
+                        break
+                    self.condition.wait()
+                    continue
+
+            #plans are saved and keys hashed without the condition, Get and PageDone do not wait on the files
+            for page, future in finished: #move finished pages to the queue, in page order
+                submit_time = self.submit_times.pop(page, None)
+                plan = None
+                if not future.cancelled():
+                    try:
+                        plan = Untraced(future.result()) #adds the spans of the worker to the trace
+                        planner.SaveCached(plan)
+                        if submit_time is not None: #converted, not from the plan cache
+                            PAGE_SECONDS.Observe(time.perf_counter() - submit_time)
+                    except Exception:
+                        print("Conversion of page " + str(page) + " failed")
+                        traceback.print_exc()
+                self.ready.put((page, plan)) #never blocks, at most window pages are held
+                converted += 1
+                if self.on_progress is not None:
+                    self.on_progress(converted, self.total)
+
+            if submit:
+                self.SubmitPage(pdfconverter, planner, threshold, start_position, rasterize, render, next_page)
+                next_page += 1
+
+        with self.condition: #the workers are not needed until the next Start, Cancel already shut them down
+            executor = self.executor
+            self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        self.ready.put((None, None))
+
+    def SubmitPage(self, pdfconverter, planner, threshold, start_position, rasterize, render, page):
+        """Hands a page to the workers, or takes its plan from the plan cache.
+        Call without the condition held, the key hashes the whole file"""
+        x_start_pos, y_start_pos, side = start_position(page)
+        key = planner.PlanKey(pdfconverter.file_path, page, pdfconverter.get_dpi(), threshold, side,
+                              x_start_pos, y_start_pos)
+        plan = planner.LoadCached(key)
+        with self.condition:
+            if self.cancelled: #the executor is gone
+                return
+            if plan is not None:
+                future = concurrent.futures.Future()
+                future.set_result(plan)
+            elif render is not None:
+                self.submit_times[page] = time.perf_counter()
+                future = self.Submit(_RenderPage, pdfconverter.file_path, page, pdfconverter.get_dpi(), threshold,
+                                     planner, x_start_pos, y_start_pos, key, render)
+                future.add_done_callback(self.PageDone)
+            else:
+                page_pdf = pdfconverter.page_path(page)
+                page_dir = os.path.splitext(page_pdf)[0]
+                self.submit_times[page] = time.perf_counter()
+                future = self.Submit(_ConvertPage, page_pdf, page_dir, pdfconverter.get_dpi(), threshold,
+                                     planner, x_start_pos, y_start_pos, key, rasterize)
+                future.add_done_callback(self.PageDone)
+            self.pages.append((page, future))
+            self.held += 1
+
+    def Submit(self, function, *args):
+        """Hands a call to the workers, traced in the worker while the tracer is on"""
+        if GetTracer().enabled:
+            return self.executor.submit(TracedCall, function, *args)
+        return self.executor.submit(function, *args)
+
+    def PageDone(self, future):
+        """Wakes the producer when a worker finished a page"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def Get(self, timeout=None):
+        """Returns (page, plan) of the next page in order, the plan is None if the page failed.
+        (None, None) after the last page or on cancel"""
+        try:
+            page, plan = self.ready.get(timeout=timeout)
+        except queue.Empty:
+            return None, None
+        if page is not None:
+            with self.condition:
+                self.held -= 1
+                self.done += 1
+                self.condition.notify_all()
+        return page, plan
+
+    def Progress(self):
+        """Returns (pages printed, pages total)"""
+        with self.condition:
+            return self.done, self.total
+
+    def Cancel(self):
+        """Stops converting, Get returns (None, None) after the pages already queued"""
+        with self.condition:
+            self.cancelled = True
+            for page, future in self.pages:
+                future.cancel()
+            self.pages.clear()
+            executor = self.executor
+            self.executor = None
+            self.condition.notify_all()
+        if executor is not None:
+            executor.shutdown(wait=False) #the queued futures are cancelled above, cancel_futures needs python 3.9
+
+    def Join(self, timeout=None):
+        """Waits for the producer thread to end"""
+        if self.producer_thread is not None:
+            self.producer_thread.join(timeout)
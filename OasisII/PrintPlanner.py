@@ -0,0 +1,298 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#The print planner turns a converted image into a print plan ahead of time.
+#A plan is the list of sweeps with their GRBL moves and HP45 burst lines, so
+#printing only has to stream data. Plans are cached on disk, a reprint of the
+#same file with the same settings skips conversion and planning.
+
+#With bidirectional on, every other sweep prints on the way back (serpentine), so the
+#gantry does not have to travel back to the start of the sweep without printing.
+#A sweep printed in reverse fires each burst at the top edge of its columns, in
+#descending position order, with the all off caps mirrored.
+
+#With band packing on, each sweep starts at the first inked row after the sweep before,
+#instead of a fixed step of a nozzle height from the first inked row, so white space
+#between blocks of ink never splits a line of text over two sweeps.
+
+import os
+import hashlib
+import pickle
+import threading
+import numpy as np
+import B64
+from Kinematics import ProfileTime
+from Occupancy import OccupancyIndex
+from Metrics import GetMetrics
+from Tracer import GetTracer
+
+FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+B64_SECONDS = GetMetrics().Histogram('plan_b64_seconds', 'Seconds to encode the lines of a sweep in B64')
+
+PLAN_VERSION = 3 #raise when the plan format or planning changes, invalidates the cache
+
+
+def FileHash(temp_file_path):
+    """Returns the sha1 of the contents of a file"""
+    temp_hash = hashlib.sha1()
+    with open(temp_file_path, 'rb') as file_object:
+        for temp_chunk in iter(lambda: file_object.read(1 << 20), b''):
+            temp_hash.update(temp_chunk)
+    return temp_hash.hexdigest()
+
+
+class PrintSweep:
+    """A single pass of the printhead over a band of image rows"""
+    def __init__(self, band_start, band_end, x_pos, y_start_pos, y_end_pos, direction=1):
+        self.band_start = band_start #first image row (nozzle 0) of the sweep
+        self.band_end = band_end #image row after the last row of the sweep
+        self.x_pos = x_pos #gantry position of the sweep in mm
+        self.y_start_pos = y_start_pos #where the printing move starts in mm
+        self.y_end_pos = y_end_pos #where the printing move ends in mm
+        self.direction = direction #1 prints moving up in Y, -1 moving down
+        self.moves = [] #GRBL moves as (x, y, feedrate)
+        self.lines = [] #HP45 commands (SBR) in the order they are sent
+
+
+class PrintPlan:
+    """All sweeps of one page, ready to be streamed to the printer"""
+    def __init__(self, temp_key=''):
+        self.key = temp_key
+        self.version = PLAN_VERSION
+        self.sweeps = []
+        self.settings = {}
+
+    def LineCount(self):
+        """Returns the total amount of HP45 lines in the plan"""
+        return sum(len(temp_sweep.lines) for temp_sweep in self.sweeps)
+
+    def Save(self, temp_path):
+        """Writes the plan to a binary file, replaced at once so a reader never sees half a plan"""
+        temp_write_path = '%s.%d.%d.tmp' % (temp_path, os.getpid(), threading.get_ident()) #one per writer
+        with open(temp_write_path, 'wb') as file_object:
+            pickle.dump(self, file_object, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_write_path, temp_path)
+
+    @staticmethod
+    def Load(temp_path):
+        """Reads a plan from a binary file, returns None if it is not a valid plan"""
+        try:
+            with open(temp_path, 'rb') as file_object:
+                temp_plan = pickle.load(file_object)
+        except Exception:
+            return None
+        if (not isinstance(temp_plan, PrintPlan) or temp_plan.version != PLAN_VERSION):
+            return None
+        return temp_plan
+
+
+class PrintPlanner:
+    def __init__(self):
+        self.travel_speed = 20000.0 #speed of moves without printing in mm/min
+        self.print_speed = 9000.0 #speed of the printing moves in mm/min
+        self.y_acceleration_distance = 10.0 #distance before and after the image to get up to speed
+        self.bidirectional = 0 #1 to print every other sweep on the way back
+        self.pack_bands = 0 #1 to start every sweep at the next inked row instead of a fixed step
+        self.sweep_size = 0 #image rows per sweep, 0 for the height of the nozzle row (half the DPI)
+        self.reverse_offset = 0.0 #mm added to the burst positions of reverse sweeps, to line them up with forward sweeps
+        self.acceleration = 500.0 #gantry acceleration in mm/s^2, only used for time estimates
+        self.cache_dir = os.path.join(FILE_PATH, 'plans') #where compiled plans are kept
+        self.file_hashes = {} #hash per (path, size, modification time), pages of a pdf share the file
+
+    def PlanKey(self, temp_file_path, temp_page, temp_dpi, temp_threshold, temp_side, temp_x_start, temp_y_start):
+        """Returns the cache key of a plan, made of the file contents and every setting that changes the plan"""
+        temp_stat = os.stat(temp_file_path)
+        temp_file_id = (os.path.abspath(temp_file_path), temp_stat.st_size, temp_stat.st_mtime)
+        if temp_file_id not in self.file_hashes:
+            self.file_hashes[temp_file_id] = FileHash(temp_file_path)
+        temp_settings = (PLAN_VERSION, self.file_hashes[temp_file_id], int(temp_page), int(temp_dpi), float(temp_threshold),
+                         int(temp_side), float(temp_x_start), float(temp_y_start), self.travel_speed,
+                         self.print_speed, self.y_acceleration_distance, int(self.bidirectional),
+                         float(self.reverse_offset), int(self.pack_bands), int(self.sweep_size))
+        return hashlib.sha1(repr(temp_settings).encode('utf-8')).hexdigest()
+
+    def CachePath(self, temp_key):
+        """Returns the file the plan with the given key is cached in"""
+        return os.path.join(self.cache_dir, temp_key + '.plan')
+
+    def LoadCached(self, temp_key):
+        """Returns the cached plan for the key, None if it was not compiled before"""
+        temp_path = self.CachePath(temp_key)
+        if not os.path.exists(temp_path):
+            return None
+        return PrintPlan.Load(temp_path)
+
+    def SaveCached(self, temp_plan):
+        """Stores a plan in the cache under its key"""
+        if (temp_plan.key):
+            os.makedirs(self.cache_dir, exist_ok=True) #the page pipeline and the printer thread both save
+            temp_plan.Save(self.CachePath(temp_plan.key))
+
+    def Compile(self, temp_imageconverter, temp_x_start_pos, temp_y_start_pos, temp_key=''):
+        """Turns a converted image into a print plan.
+        y is sweep direction, x is gantry direction
+        Width is Y direction, height is X direction"""
+        temp_plan = PrintPlan(temp_key)
+        temp_dpi = temp_imageconverter.GetDPI()
+        temp_plan.settings = {'dpi': temp_dpi, 'x_start_pos': temp_x_start_pos, 'y_start_pos': temp_y_start_pos,
+                              'travel_speed': self.travel_speed, 'print_speed': self.print_speed,
+                              'bidirectional': int(self.bidirectional), 'pack_bands': int(self.pack_bands),
+                              'sweep_size': self.SweepSize(temp_dpi)}
+
+        #get the occupancy index, made once per converted image
+        if (temp_imageconverter.occupancy is None):
+            temp_imageconverter.occupancy = OccupancyIndex.FromImage(temp_imageconverter)
+        temp_occupancy = temp_imageconverter.occupancy
+        if (temp_occupancy.IsEmpty()):
+            print("Nothing to print")
+            return temp_plan
+
+        temp_sweep_size = self.SweepSize(temp_dpi)
+        temp_burst_size = int(temp_dpi / 2) #a burst always has a bit for every nozzle row
+        temp_pixel_to_pos = 25.4 / temp_dpi #pixel to position multiplier (in millimeters)
+        temp_plan.settings['fixed_sweeps'] = self.CountSweeps(temp_imageconverter, 0) #to report what packing saves
+
+        temp_direction = 1 #direction of the next sweep
+        for temp_x_min_pos, temp_x_max_pos in self.Bands(temp_occupancy, temp_sweep_size, self.pack_bands):
+            #Look for Y min and Y max in sweep, skip empty sweeps entirely
+            temp_extents = temp_occupancy.BandExtents(temp_x_min_pos, temp_x_max_pos)
+            if (temp_extents is not None):
+                temp_y_min, temp_y_max = temp_extents
+                temp_sweep = PrintSweep(temp_x_min_pos, temp_x_max_pos,
+                    temp_x_min_pos * temp_pixel_to_pos + temp_x_start_pos,
+                    temp_y_min * temp_pixel_to_pos + temp_y_start_pos - self.y_acceleration_distance,
+                    temp_y_max * temp_pixel_to_pos + temp_y_start_pos + self.y_acceleration_distance,
+                    temp_direction)
+                with GetTracer().Span('plan sweep', 'plan', {'rows': [temp_x_min_pos, temp_x_max_pos]}):
+                    temp_sweep.moves = self.SweepMoves(temp_sweep, temp_sweep.direction)
+
+                    #a line for every column where the burst changes, between all off caps
+                    temp_sweep.lines = self.BurstLines(temp_imageconverter.GetBand(temp_x_min_pos, temp_x_max_pos),
+                        temp_y_min, temp_y_max, temp_burst_size, temp_pixel_to_pos, temp_y_start_pos, temp_sweep.direction)
+                temp_plan.sweeps.append(temp_sweep)
+                if (self.bidirectional == 1):
+                    temp_direction *= -1 #the next sweep prints on the way back
+
+        return temp_plan
+
+    def SweepSize(self, temp_dpi):
+        """Returns the image rows a sweep prints, the nozzle row is half an inch high"""
+        if (self.sweep_size > 0):
+            return min(int(self.sweep_size), int(temp_dpi / 2)) #never more than the nozzles
+        return int(temp_dpi / 2) #get sweep size (is halve of DPI)
+
+    def Bands(self, temp_occupancy, temp_sweep_size, temp_pack_bands=0):
+        """Returns the (first row, row after the last row) of every band a sweep could print.
+        Fixed (0) steps a sweep size from the first inked row, packed (1) starts every band
+        at the first inked row after the band before, which is the least bands that cover all ink"""
+        temp_bands = []
+        if (temp_occupancy.IsEmpty()):
+            return temp_bands
+        temp_x_max = temp_occupancy.RowMax()
+        temp_x_min_pos = temp_occupancy.RowMin()
+        if (temp_pack_bands == 1):
+            while (temp_x_min_pos != -1):
+                temp_x_max_pos = min(temp_x_min_pos + temp_sweep_size, temp_occupancy.height)
+                temp_bands.append((temp_x_min_pos, temp_x_max_pos))
+                temp_x_min_pos = temp_occupancy.NextInkedRow(temp_x_max_pos)
+            return temp_bands
+
+        temp_sweep_stop = 0
+        while (temp_sweep_stop == 0):
+            #determine X-start and X end of sweep
+            if (temp_x_min_pos + temp_sweep_size <= temp_x_max):
+                temp_x_max_pos = temp_x_min_pos + temp_sweep_size
+            else:
+                temp_x_max_pos = temp_x_max #set max of image as max pos
+                temp_sweep_stop = 1 #mark last loop
+            temp_bands.append((temp_x_min_pos, temp_x_max_pos))
+            temp_x_min_pos += temp_sweep_size
+        return temp_bands
+
+    def CountSweeps(self, temp_imageconverter, temp_pack_bands=0):
+        """Returns the amount of sweeps an image needs with fixed (0) or packed (1) bands,
+        without compiling the plan"""
+        if (temp_imageconverter.occupancy is None):
+            temp_imageconverter.occupancy = OccupancyIndex.FromImage(temp_imageconverter)
+        temp_occupancy = temp_imageconverter.occupancy
+        temp_sweep_size = self.SweepSize(temp_imageconverter.GetDPI())
+        return sum(1 for temp_start, temp_end in self.Bands(temp_occupancy, temp_sweep_size, temp_pack_bands)
+                   if not temp_occupancy.BandEmpty(temp_start, temp_end))
+
+    def CompareBands(self, temp_imageconverter):
+        """Returns the amount of sweeps of an image with (fixed bands, packed bands)"""
+        return self.CountSweeps(temp_imageconverter, 0), self.CountSweeps(temp_imageconverter, 1)
+
+    def SweepMoves(self, temp_sweep, temp_direction):
+        """Returns the GRBL moves of a sweep: travel to the start, then print to the other end"""
+        if (temp_direction == 1):
+            temp_from, temp_to = temp_sweep.y_start_pos, temp_sweep.y_end_pos
+        else:
+            temp_from, temp_to = temp_sweep.y_end_pos, temp_sweep.y_start_pos
+        return [(temp_sweep.x_pos, temp_from, self.travel_speed), (temp_sweep.x_pos, temp_to, self.print_speed)]
+
+    def BurstLines(self, temp_band, temp_y_min, temp_y_max, temp_sweep_size, temp_pixel_to_pos, temp_y_start_pos, temp_direction=1):
+        """Makes the SBR commands of columns y min up to y max of a band, only where the burst
+        differs from the column before (the column before y min counts as all off), with an all off cap
+        on both ends. In reverse (direction -1) the lines are in descending order and every burst is
+        fired at the column after its last column, where the head enters it"""
+        #a column of the band is a burst, one row per column
+        temp_bursts = np.zeros((temp_y_max - temp_y_min + 1, temp_sweep_size), dtype=np.uint8)
+        temp_bursts[1:, :temp_band.shape[0]] = temp_band[:, temp_y_min:temp_y_max].T
+        temp_changed = np.flatnonzero((temp_bursts[1:] != temp_bursts[:-1]).any(axis=1))
+
+        #caps: all off before y min and after y max
+        temp_columns = np.concatenate(([temp_y_min - 1], temp_changed + temp_y_min, [temp_y_max + 1]))
+        temp_rows = np.concatenate(([0], temp_changed + 1, [0])) #row 0 of temp_bursts is all off
+        if (temp_direction == -1):
+            #enter each run of equal bursts from the top, the off cap at the end marks where it starts
+            temp_columns = np.concatenate(([temp_y_max + 2], temp_columns[:0:-1]))
+            temp_rows = temp_rows[::-1]
+
+        temp_pos = temp_columns * temp_pixel_to_pos + temp_y_start_pos
+        if (temp_direction == -1):
+            temp_pos += self.reverse_offset
+        temp_pos *= 1000 #printhead pos is in microns
+        with B64_SECONDS.Time():
+            temp_burst_strings = B64.B64ToArrayBatch(temp_bursts[temp_rows])
+            temp_pos_strings = B64.B64ToSingleBatch(temp_pos)
+        return ["SBR " + temp_pos_b64 + " " + temp_burst for temp_pos_b64, temp_burst in zip(temp_pos_strings, temp_burst_strings)]
+
+    def MoveTime(self, temp_distance, temp_feed):
+        """Returns the seconds a move takes from standstill to standstill, with a trapezoid speed profile"""
+        return ProfileTime(temp_distance, temp_feed / 60.0, self.acceleration) #feed is in mm/min
+
+    def EstimateTime(self, temp_plan, temp_bidirectional=None):
+        """Returns the estimated seconds of gantry motion for a plan, printed uni- (0)
+        or bidirectionally (1), by default in the way the plan was compiled"""
+        if (temp_bidirectional is None):
+            temp_bidirectional = temp_plan.settings.get('bidirectional', 0)
+        temp_time = 0.0
+        temp_pos = None
+        temp_direction = 1
+        for temp_sweep in temp_plan.sweeps:
+            for temp_x, temp_y, temp_f in self.SweepMoves(temp_sweep, temp_direction):
+                if (temp_pos is not None):
+                    temp_distance = ((temp_x - temp_pos[0]) ** 2 + (temp_y - temp_pos[1]) ** 2) ** 0.5
+                    temp_time += self.MoveTime(temp_distance, temp_f)
+                temp_pos = (temp_x, temp_y)
+            if (temp_bidirectional == 1):
+                temp_direction *= -1
+        return temp_time
+
+    def CompareDirections(self, temp_plan):
+        """Returns the estimated seconds of a plan printed (unidirectional, bidirectional)"""
+        return self.EstimateTime(temp_plan, 0), self.EstimateTime(temp_plan, 1)
@@ -0,0 +1,561 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#The print simulator replays a print job in virtual time, faster than the printer would, to see
+#what the speeds, the sweep size or the HP45 buffer margin do to a print without printing.
+#It follows MainWindow.PrintArray (clear the HP45, home, the sweeps one by one or pipelined, park)
+#and GRBL.NewLayer, with the flow control of the drivers: character counting into the GRBL RX buffer
+#(StreamRoom), the 15 block GRBL planner, and the HP45 credits from BWL replies with at most
+#inkjet_max_in_flight commands without OK (CreditsLeft and LinesToSend). GRBL handles the lines with
+#GrblGcode, as the GRBL of the device emulator. Both connections send at their baudrate, every command is handled after a latency.
+#The gantry moves with the trapezoid profile of Kinematics. The HP45 fires a line when the head passes
+#its position on the printing move of its sweep, a line that arrives after that is an underrun.
+#Status reports are requested every status_interval, the waits of the controller only see those.
+
+import collections
+import heapq
+import B64
+from GrblGcode import GrblModal, ParseLine
+from Kinematics import ProfileTimeAt
+from PrintPlanner import PrintPlanner
+from SerialGRBL import GRBL, StreamRoom
+from SerialHP45 import HP45, CreditsLeft, LinesToSend
+
+
+class EventQueue:
+    """Functions to call at a point in virtual time, called in time order"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.events = []
+        self.count = 0 #keeps events at the same time in the order they were added
+
+    def At(self, when: float, function, *args) -> None:
+        heapq.heappush(self.events, (max(when, self.now), self.count, function, args))
+        self.count += 1
+
+    def RunNext(self) -> bool:
+        """Calls the next event, returns False if there is none"""
+        if len(self.events) == 0:
+            return False
+        when, count, function, args = heapq.heappop(self.events)
+        self.now = when
+        function(*args)
+        return True
+
+
+class SerialLink:
+    """One direction of a serial connection, bytes go out one after the other at the baudrate"""
+
+    def __init__(self, events: EventQueue, baudrate: int):
+        self.events = events
+        self.byte_time = 10.0 / baudrate #start bit, 8 data bits and a stop bit
+        self.free_time = 0.0 #when the last byte sent so far is out
+        self.bytes = 0
+
+    def Send(self, size: int, function, *args) -> None:
+        """Sends size bytes, function is called with args when the last byte arrived"""
+        self.free_time = max(self.events.now, self.free_time) + size * self.byte_time
+        self.bytes += size
+        self.events.At(self.free_time, function, *args)
+
+
+class SimulatedGrbl:
+    """The GRBL driver (streaming) and controller (RX buffer, planner, gantry) in virtual time"""
+
+    def __init__(self, simulator, driver: GRBL, baudrate: int):
+        self.simulator = simulator
+        self.events = simulator.events
+        self.streaming_mode = driver.streaming_mode
+        self.rx_buffer_size = driver.rx_buffer_size
+        self.to_grbl = SerialLink(self.events, baudrate)
+        self.from_grbl = SerialLink(self.events, baudrate)
+        self.planner_size = 15
+
+        #driver
+        self.queue = collections.deque() #(line, tag) still to send
+        self.sent = collections.deque() #lines sent, waiting for their ok
+        self.sent_chars = 0
+        self.status = 'idle' #last state reported
+        self.status_index = 0 #reports received
+
+        #controller
+        self.rx = collections.deque() #(line, tag) received, not yet handled
+        self.busy_until = 0.0 #the next line is handled from this time on
+        self.handle_pending = 0
+        self.planner = 0 #blocks planned, including the one moving
+        self.gantry_free = 0.0 #when the last planned block ends
+        self.homing = 0
+        self.modal = GrblModal() #modal state and the position after the last planned block
+        self.lines = 0
+        self.errors = 0
+
+    def Send(self, lines, tag=None) -> None:
+        """Adds lines to the driver buffer, tag is handed to on_block for the blocks they plan"""
+        for line in lines:
+            self.queue.append((line + '\r', tag))
+        self.Pump()
+
+    def Pump(self) -> None:
+        """Sends what the driver would send now, as GRBL.Pump"""
+        if self.streaming_mode == 1:
+            room = StreamRoom(self.rx_buffer_size, self.sent_chars, len(self.sent),
+                              self.queue[0][0] if len(self.queue) > 0 else None)
+            while len(self.queue) > 0 and len(self.queue[0][0]) <= room:
+                room -= len(self.queue[0][0])
+                self.Transmit(self.queue.popleft())
+        elif len(self.sent) == 0 and len(self.queue) > 0:
+            self.Transmit(self.queue.popleft())
+
+    def Transmit(self, item) -> None:
+        self.sent.append(item[0])
+        self.sent_chars += len(item[0])
+        self.to_grbl.Send(len(item[0]), self.Receive, item)
+
+    def Receive(self, item) -> None:
+        self.rx.append(item)
+        self.Handle()
+
+    def Handle(self) -> None:
+        """Handles received lines while the planner allows it"""
+        self.handle_pending = 0
+        while len(self.rx) > 0:
+            if self.events.now < self.busy_until:
+                if self.handle_pending == 0:
+                    self.handle_pending = 1
+                    self.events.At(self.busy_until, self.Handle)
+                return
+            line, tag = self.rx[0]
+            command = ParseLine(line.strip().replace(' ', '').upper())
+            if command[0] == 'sync' and self.planner > 0:
+                return #waits for the moves before it, BlockDone handles it
+            if command[0] == 'move' and self.planner >= self.planner_size:
+                return #planner full, stays in the RX buffer
+            self.rx.popleft()
+            self.lines += 1
+            self.busy_until = self.events.now + self.simulator.grbl_latency
+            self.Execute(command, tag)
+
+    def Execute(self, command, tag) -> None:
+        kind, action, words = command
+        if action == 'home':
+            self.homing = 1
+            self.modal.Reset([0.0] * 4)
+            end = self.Plan(self.simulator.homing_time, 0.0, 0.0, tag)
+            self.busy_until = end #no lines are handled while homing
+            self.events.At(end, self.HomingDone)
+            return
+        error = action if isinstance(action, int) else 0
+        if action == 'gcode':
+            error, block = self.modal.Execute(words, self.simulator.max_rate, self.simulator.acceleration)
+            if error == 0 and block is not None:
+                self.Plan(block.duration, block.distance, block.speed, tag)
+        if error:
+            self.errors += 1
+            self.Reply(len('error:' + str(error) + '\r\n'))
+            return
+        self.Reply(4)
+
+    def Plan(self, duration: float, distance: float, speed: float, tag) -> float:
+        """Adds a block to the planner, returns when it ends"""
+        start = max(self.events.now, self.gantry_free)
+        idle = start - self.gantry_free #the gantry stood still waiting for this block
+        self.gantry_free = start + duration
+        self.planner += 1
+        self.events.At(self.gantry_free, self.BlockDone)
+        self.simulator.BlockPlanned(start, duration, distance, speed, idle, tag)
+        return self.gantry_free
+
+    def BlockDone(self) -> None:
+        self.planner -= 1
+        self.Handle()
+
+    def HomingDone(self) -> None:
+        self.homing = 0
+        self.Reply(4)
+
+    def Reply(self, size: int) -> None:
+        """Sends an ok (or error) of size bytes to the driver"""
+        self.from_grbl.Send(size, self.Acknowledged)
+
+    def Acknowledged(self) -> None:
+        """The driver got the ok of its oldest line"""
+        if len(self.sent) > 0:
+            self.sent_chars -= len(self.sent.popleft())
+        self.Pump()
+        self.simulator.Wake()
+
+    def RequestStatus(self) -> None:
+        """Sends a ? (real time, skips the RX buffer)"""
+        self.to_grbl.Send(1, self.ReportStatus)
+
+    def ReportStatus(self) -> None:
+        if self.homing:
+            state = 'home'
+        elif self.planner > 0:
+            state = 'run'
+        else:
+            state = 'idle'
+        self.from_grbl.Send(60, self.StatusArrived, state) #a report with 4 axes is about 60 characters
+
+    def StatusArrived(self, state: str) -> None:
+        self.status = state
+        self.status_index += 1
+        self.simulator.Wake()
+
+
+class SimulatedHP45:
+    """The HP45 driver (credits from BWL replies) and controller (line buffer) in virtual time"""
+
+    def __init__(self, simulator, driver: HP45, baudrate: int):
+        self.simulator = simulator
+        self.events = simulator.events
+        self.to_hp45 = SerialLink(self.events, baudrate)
+        self.from_hp45 = SerialLink(self.events, baudrate)
+        self.margin = driver.inkjet_buffer_margin
+        self.max_in_flight = driver.inkjet_max_in_flight
+        self.bwl_interval = driver.bwl_interval
+
+        #driver
+        self.queue = collections.deque() #(line, tag) still to send
+        self.in_flight = 0
+        self.sent_total = 0
+        self.sent_at_bwl = 0
+        self.sent_at_request = 0
+        self.bwl_pending = 0
+        self.bwl_time = -1.0
+        self.writeleft = 0 #free space of the last BWL reply
+        self.send_status = None #status request to send, GTP, GEP or BWL
+        self.status_state = 0
+        self.pump_pending = 0
+
+        #controller
+        self.busy_until = 0.0
+        self.buffer = 0 #lines in the HP45 buffer
+        self.buffer_peak = 0
+        self.overflows = 0
+
+    def Send(self, lines, tag=None) -> None:
+        """Adds lines to the driver buffer, tag is handed to LineArrived for every SBR line"""
+        for index, line in enumerate(lines):
+            self.queue.append((line + '\r', None if tag is None else (tag, index)))
+        self.Pump()
+
+    def Credits(self) -> int:
+        return CreditsLeft(self.writeleft, self.sent_total, self.sent_at_bwl, self.margin)
+
+    def Pump(self) -> None:
+        """Sends what the driver would send now, as HP45.Pump"""
+        self.pump_pending = 0
+        if self.send_status is not None and self.in_flight < self.max_in_flight:
+            if self.send_status != 'BWL' or self.bwl_pending == 0:
+                self.Request(self.send_status)
+            self.send_status = None
+        count, bwl = LinesToSend(len(self.queue), self.in_flight, self.max_in_flight, self.Credits(), self.bwl_pending)
+        if count > 0:
+            self.in_flight += count
+            self.sent_total += count
+            for index in range(count):
+                line, tag = self.queue.popleft()
+                self.to_hp45.Send(len(line), self.Receive, line, tag)
+        elif bwl == 1:
+            if self.events.now - self.bwl_time > self.bwl_interval:
+                self.Request('BWL') #out of credits, ask for the free space right away
+            elif self.pump_pending == 0:
+                self.pump_pending = 1
+                self.events.At(self.bwl_time + self.bwl_interval + 1e-6, self.Pump)
+
+    def Request(self, command: str) -> None:
+        if command == 'BWL':
+            self.bwl_pending = 1
+            self.bwl_time = self.events.now
+            self.sent_at_request = self.sent_total
+        self.in_flight += 1
+        self.to_hp45.Send(len(command) + 1, self.Receive, command, None)
+
+    def RequestStatus(self) -> None:
+        """The driver asks for the temperature, position and buffer in turn"""
+        self.send_status = ('GTP', 'GEP', 'BWL')[self.status_state]
+        self.status_state = (self.status_state + 1) % 3
+        self.Pump()
+
+    def Receive(self, line: str, tag) -> None:
+        """A command arrived, the controller handles the commands in order"""
+        self.busy_until = max(self.events.now, self.busy_until) + self.simulator.inkjet_latency
+        self.events.At(self.busy_until, self.Execute, line, tag)
+
+    def Execute(self, line: str, tag) -> None:
+        command = line[:3]
+        if command == 'SBR':
+            if self.buffer < self.simulator.inkjet_buffer_size:
+                self.buffer += 1
+                self.buffer_peak = max(self.buffer_peak, self.buffer)
+                if tag is not None:
+                    self.simulator.LineArrived(tag)
+            else:
+                self.overflows += 1
+            self.from_hp45.Send(3, self.Acknowledged)
+        elif command == 'BWL':
+            free = self.simulator.inkjet_buffer_size - self.buffer
+            self.from_hp45.Send(len('BWL:' + B64.B64ToSingle(free) + '\nOK\n'), self.BufferReply, free)
+        elif command in ('GTP', 'GEP'):
+            self.from_hp45.Send(11, self.Acknowledged) #reply and OK
+        else:
+            if command == 'BCL':
+                self.buffer = 0
+            self.from_hp45.Send(3, self.Acknowledged)
+
+    def Fire(self) -> None:
+        """A line was printed and leaves the buffer"""
+        self.buffer -= 1
+
+    def BufferReply(self, free: int) -> None:
+        self.writeleft = free
+        self.sent_at_bwl = self.sent_at_request #the reply counts all lines sent before the request
+        self.bwl_pending = 0
+        self.Acknowledged()
+
+    def Acknowledged(self) -> None:
+        if self.in_flight > 0:
+            self.in_flight -= 1
+        self.Pump()
+        self.simulator.Wake()
+
+
+class SweepResult:
+    """What happened during one sweep"""
+    def __init__(self, index: int, lines: int):
+        self.index = index
+        self.lines = lines #HP45 lines of the sweep
+        self.idle_gap = 0.0 #seconds the gantry stood still before the sweep, waiting for the host
+        self.print_start = None #when the printing move started
+        self.print_end = None
+        self.buffered = 0 #lines of the sweep in the HP45 buffer when the printing move started
+        self.arrived = 0 #lines of the sweep that reached the HP45 buffer
+        self.underruns = 0 #lines that reached the HP45 after the head passed their position
+
+
+class SimulationReport:
+    """The result of a simulated job"""
+    def __init__(self):
+        self.job_time = 0.0 #seconds from the start of the job until the gantry parked
+        self.sweeps = []
+        self.new_layer_time = 0.0 #seconds of the new layer before the print, 0 without
+        self.motion_time = 0.0 #seconds the gantry moved (or homed)
+        self.overflows = 0 #SBR lines lost to a full HP45 buffer
+        self.buffer_peak = 0
+        self.grbl_bytes = 0
+        self.inkjet_bytes = 0
+        self.completed = 1 #0 if the job did not end within the time limit
+
+    def Underruns(self) -> int:
+        return sum(sweep.underruns for sweep in self.sweeps)
+
+    def IdleTime(self) -> float:
+        return sum(sweep.idle_gap for sweep in self.sweeps)
+
+    def Summary(self) -> str:
+        text = "Job time: %.1fs, motion %.1fs, idle before sweeps %.1fs\n" % (self.job_time, self.motion_time, self.IdleTime())
+        text += "Underruns: %d, overflows: %d, HP45 buffer peak: %d\n" % (self.Underruns(), self.overflows, self.buffer_peak)
+        text += "%5s %6s %8s %8s %9s %9s\n" % ('sweep', 'lines', 'idle s', 'print s', 'buffered', 'underruns')
+        for sweep in self.sweeps:
+            print_time = 0.0
+            if sweep.print_start is not None:
+                print_time = sweep.print_end - sweep.print_start
+            text += "%5d %6d %8.2f %8.2f %9d %9d\n" % (sweep.index, sweep.lines, sweep.idle_gap, print_time,
+                                                      sweep.buffered, sweep.underruns)
+        return text
+
+
+class PrintSimulator:
+    """Replays print plans in virtual time. The planner gives the speeds and acceleration, the
+    drivers their flow control settings, so changes to either can be tried here first"""
+
+    def __init__(self, planner: PrintPlanner = None, grbl: GRBL = None, inkjet: HP45 = None):
+        self.planner = planner if planner is not None else PrintPlanner()
+        self.grbl_driver = grbl if grbl is not None else GRBL()
+        self.inkjet_driver = inkjet if inkjet is not None else HP45()
+        self.grbl_baudrate = self.grbl_driver.ser.baudrate
+        self.inkjet_baudrate = self.inkjet_driver.ser.baudrate
+        self.grbl_latency = 0.001 #seconds GRBL takes to handle a line
+        self.inkjet_latency = 0.0002 #seconds the HP45 takes to handle a command
+        self.inkjet_buffer_size = 1000 #lines the HP45 buffer holds
+        self.acceleration = self.planner.acceleration #mm/s^2
+        self.max_rate = 30000.0 #mm/min, G0 and the limit of G1
+        self.homing_time = 8.0 #seconds a home takes
+        self.status_interval = 0.1 #seconds between status requests, as GetStatus of the drivers
+        self.set_position_delay = 0.3 #InkjetSetPosition waits this long for a new position
+        self.pipelined = 1 #1 as PrintSweepsPipelined, 0 as PrintSweeps
+        self.park_position = (5, 410, '20000') #where PrintArray sends the gantry after printing
+        self.time_limit = 24 * 3600.0 #virtual seconds after which a job that does not end is stopped
+
+    def Run(self, plan, layer_thickness: float = None) -> SimulationReport:
+        """Simulates printing a plan, after a new layer of layer_thickness mm if given"""
+        self.events = EventQueue()
+        self.grbl = SimulatedGrbl(self, self.grbl_driver, self.grbl_baudrate)
+        self.inkjet = SimulatedHP45(self, self.inkjet_driver, self.inkjet_baudrate)
+        self.report = SimulationReport()
+        self.report.sweeps = [SweepResult(index, len(sweep.lines)) for index, sweep in enumerate(plan.sweeps)]
+        self.plan = plan
+        self.line_positions = [[B64.B64FromSingle(line.split(' ')[1]) / 1000.0 for line in sweep.lines]
+                               for sweep in plan.sweeps] #mm, where each line is fired
+        self.waiting_lines = [[] for sweep in plan.sweeps] #lines in the HP45 before their printing move is planned
+        self.print_blocks = [None] * len(plan.sweeps) #(start, distance, speed) of the printing move per sweep
+        self.status_index_set = 0
+
+        self.job = self.Job(plan, layer_thickness)
+        self.waiting = None
+        self.StatusTick()
+        self.Resume()
+        while self.job is not None and self.events.now < self.time_limit and self.events.RunNext():
+            pass
+        if self.job is not None:
+            self.report.completed = 0
+            self.report.job_time = self.events.now
+        self.report.overflows = self.inkjet.overflows
+        self.report.buffer_peak = self.inkjet.buffer_peak
+        self.report.grbl_bytes = self.grbl.to_grbl.bytes
+        self.report.inkjet_bytes = self.inkjet.to_hp45.bytes
+        return self.report
+
+    def Job(self, plan, layer_thickness):
+        """The host side of a job, yields the seconds to sleep or a function to wait for"""
+        if layer_thickness is not None:
+            self.grbl.Send(self.grbl_driver.NewLayerLines(layer_thickness), ('layer', -1))
+            self.StatusIndexSet()
+            yield from self.WaitForIdle(1)
+            self.report.new_layer_time = self.events.now
+
+        self.inkjet.Send(['BCL']) #clear inkjet buffer on HP45
+        self.grbl.Send(self.grbl_driver.HomeLines(), ('home', -1))
+        if self.pipelined == 1:
+            yield from self.PrintSweepsPipelined(plan)
+        else:
+            yield from self.PrintSweeps(plan)
+        self.grbl.Send([self.grbl_driver.GotoLine(*self.park_position)], ('park', -1))
+        self.StatusIndexSet()
+        yield from self.WaitForIdle(1)
+
+    def PrintSweeps(self, plan):
+        """As MainWindow.PrintSweeps"""
+        for index, sweep in enumerate(plan.sweeps):
+            yield from self.WaitForIdle()
+            yield from self.InkjetSetPosition()
+            self.inkjet.Send(sweep.lines, index)
+            self.SendMoves(sweep, index)
+            yield from self.WaitForIdle(1)
+
+    def PrintSweepsPipelined(self, plan):
+        """As MainWindow.PrintSweepsPipelined"""
+        yield from self.WaitForIdle()
+        yield from self.InkjetSetPosition()
+        for index, sweep in enumerate(plan.sweeps):
+            self.inkjet.Send(sweep.lines, index)
+            yield lambda: len(self.inkjet.queue) == 0 or (self.StatusChanged() and self.grbl.status == 'idle')
+            self.SendMoves(sweep, index)
+        yield from self.WaitForIdle(1)
+
+    def SendMoves(self, sweep, index: int) -> None:
+        travel, printing = sweep.moves
+        self.grbl.Send([self.grbl_driver.GotoLine(*travel)], ('travel', index))
+        self.grbl.Send([self.grbl_driver.GotoLine(*printing)], ('print', index))
+        self.StatusIndexSet()
+
+    def InkjetSetPosition(self):
+        yield self.set_position_delay
+        self.inkjet.Send(['SEP ' + B64.B64ToSingle(0)])
+
+    def StatusIndexSet(self) -> None:
+        self.status_index_set = self.grbl.status_index
+
+    def StatusChanged(self) -> bool:
+        """As GRBL.StatusIndexChanged, 3 reports after StatusIndexSet"""
+        return self.grbl.status_index >= self.status_index_set + 3
+
+    def WaitForIdle(self, new_status: int = 0):
+        """As GRBL.WaitForIdle"""
+        yield lambda: (new_status == 0 or self.StatusChanged()) and self.grbl.status == 'idle'
+
+    def Resume(self) -> None:
+        """Runs the job until it sleeps or waits"""
+        while self.job is not None:
+            try:
+                step = next(self.job)
+            except StopIteration:
+                self.job = None
+                self.report.job_time = self.events.now
+                return
+            if callable(step):
+                if not step():
+                    self.waiting = step
+                    return
+            else:
+                self.events.At(self.events.now + step, self.Resume)
+                return
+
+    def Wake(self) -> None:
+        """Something the job may wait for changed"""
+        if self.waiting is not None and self.waiting():
+            self.waiting = None
+            self.Resume()
+
+    def StatusTick(self) -> None:
+        if self.job is None:
+            return
+        self.grbl.RequestStatus()
+        self.inkjet.RequestStatus()
+        self.events.At(self.events.now + self.status_interval, self.StatusTick)
+
+    def BlockPlanned(self, start: float, duration: float, distance: float, speed: float, idle: float, tag) -> None:
+        """Called by the GRBL for every block, with the tag of the line that planned it"""
+        self.report.motion_time += duration
+        if tag is None or tag[1] < 0:
+            return
+        kind, index = tag
+        sweep = self.report.sweeps[index]
+        if kind == 'travel':
+            sweep.idle_gap = idle
+        elif kind == 'print':
+            if idle > 0.0:
+                sweep.idle_gap += idle #the travel move ended before the printing move was planned
+            sweep.print_start = start
+            sweep.print_end = start + duration
+            sweep.buffered = len(self.waiting_lines[index])
+            self.print_blocks[index] = (start, distance, speed)
+            for line in self.waiting_lines[index]:
+                self.events.At(self.FireTime(index, line), self.inkjet.Fire)
+            self.waiting_lines[index] = []
+
+    def FireTime(self, index: int, line: int) -> float:
+        """Returns when the head passes the position of a line on the printing move of its sweep"""
+        start, distance, speed = self.print_blocks[index]
+        travel, printing = self.plan.sweeps[index].moves
+        covered = (self.line_positions[index][line] - travel[1]) * (1 if printing[1] >= travel[1] else -1)
+        return start + ProfileTimeAt(distance, speed, self.acceleration, min(max(covered, 0.0), distance))
+
+    def LineArrived(self, tag) -> None:
+        """Called by the HP45 for every SBR line that made it into its buffer"""
+        index, line = tag
+        sweep = self.report.sweeps[index]
+        sweep.arrived += 1
+        if self.print_blocks[index] is None:
+            self.waiting_lines[index].append(line)
+            return
+        fire_time = self.FireTime(index, line)
+        if fire_time < self.events.now:
+            sweep.underruns += 1 #the head already passed, fired late
+            fire_time = self.events.now
+        self.events.At(fire_time, self.inkjet.Fire)
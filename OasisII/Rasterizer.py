@@ -0,0 +1,105 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+
+#Even-odd scanline fill of the polygons of a vector layer.
+#Gives the same pixels as toggling the crossing of every edge with every row and then
+#flipping the fill state at every toggled pixel along the row (ArrayAddPolygon and
+#ArrayConvert in ImageConverter), but computes all crossings of a layer at once.
+#Rows are the gantry (X) direction, columns the sweep (Y) direction.
+
+import numpy as np
+
+
+def ParsePoints(points: str):
+    """Returns the (n, 2) array of the x,y pairs in an svg points string"""
+    return np.array(points.replace(',', ' ').split(), dtype=np.double).reshape(-1, 2)
+
+
+def Crossings(polygons, height: int, width: int, pixel_size: float):
+    """Returns the flat indices (row * width + column) of every pixel an odd amount of edges cross, sorted.
+    An edge crosses the rows whose position lies between its ends, ends included,
+    at the column its position rounds down to"""
+    starts = []
+    ends = []
+    for polygon in polygons:
+        if len(polygon) > 0:
+            starts.append(np.roll(polygon, 1, axis=0)) #edge k runs from point k-1 to point k
+            ends.append(polygon)
+    if not starts:
+        return np.empty(0, dtype=np.int64)
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+
+    #smallest x first, edges along a row never cross it
+    flip = starts[:, 0] >= ends[:, 0]
+    x_start = np.where(flip, ends[:, 0], starts[:, 0])
+    x_end = np.where(flip, starts[:, 0], ends[:, 0])
+    y_start = np.where(flip, ends[:, 1], starts[:, 1])
+    y_end = np.where(flip, starts[:, 1], ends[:, 1])
+    keep = x_start != x_end
+    x_start, x_end, y_start, y_end = x_start[keep], x_end[keep], y_start[keep], y_end[keep]
+
+    #candidate rows of every edge, truncated like int() does
+    row_first = np.trunc(x_start / pixel_size).astype(np.int64)
+    row_count = np.trunc(x_end / pixel_size).astype(np.int64) + 1 - row_first
+    row_count = np.maximum(row_count, 0)
+    edge = np.repeat(np.arange(len(x_start)), row_count)
+    row = np.arange(len(edge)) - np.repeat(np.cumsum(row_count) - row_count, row_count) + row_first[edge]
+
+    #y of the edge at the row position, same operations in the same order as the per edge loop
+    row_pos = row * pixel_size
+    x_start, x_end, y_start, y_end = x_start[edge], x_end[edge], y_start[edge], y_end[edge]
+    inside = (row_pos >= x_start) & (row_pos <= x_end)
+    y_pos = (y_end - y_start) * ((row_pos - x_start) / (x_end - x_start)) + y_start
+    column = np.trunc(y_pos / pixel_size)
+    inside &= (row >= 0) & (row < height) & (column >= 0) & (column < width)
+
+    #crossings on the same pixel cancel out
+    flat = row[inside] * width + column[inside].astype(np.int64)
+    flat, counts = np.unique(flat, return_counts=True)
+    return flat[counts % 2 == 1]
+
+
+def Spans(flat, width: int):
+    """Returns (row, first column, column after the last) of every filled span from sorted crossings,
+    each crossing flips the fill, the pixel of the crossing takes the new state"""
+    row = flat // width
+    column = flat % width
+    #position of every crossing within its row
+    first_of_row = np.ones(len(flat), dtype=bool)
+    first_of_row[1:] = row[1:] != row[:-1]
+    row_start = np.flatnonzero(first_of_row)
+    index_in_row = np.arange(len(flat)) - np.repeat(row_start, np.diff(np.append(row_start, len(flat))))
+    opening = index_in_row % 2 == 0
+    #a span ends at the next crossing of the row, or at the end of the row
+    closing_column = np.full(len(flat), width, dtype=np.int64)
+    same_row_next = np.zeros(len(flat), dtype=bool)
+    same_row_next[:-1] = row[1:] == row[:-1]
+    closing_column[:-1][same_row_next[:-1]] = column[1:][same_row_next[:-1]]
+    return row[opening], column[opening], closing_column[opening]
+
+
+def FillPolygons(polygons, height: int, width: int, pixel_size: float, out=None):
+    """Fills the polygons (arrays of x,y in mm) even-odd in a height by width array of pixel size mm,
+    returns the array, a new uint8 array if out is not given"""
+    if out is None:
+        out = np.zeros((height, width), dtype=np.uint8)
+    flat = Crossings(polygons, height, width, pixel_size)
+    for row, first, last in zip(*Spans(flat, width)):
+        out[row, first:last] = 1
+    return out
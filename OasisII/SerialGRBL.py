@@ -25,11 +25,36 @@
 #-add endstops to pistons, not to home, but to check end (0) reached
 #-Change new layer so the last motion is always up, to increase repeatability
 
+#There are two ways of sending lines (streaming_mode):
+#0: send a line, wait for its ok, send the next (send-response). ? is sent as a line and waits for ok too
+#1: character counting, lines are sent as long as they fit in the 128 byte RX buffer of GRBL
+#   every ok or error frees the oldest line sent. ? is sent as a real time command, outside of the count
+
+#Reading and writing the serial is done by the shared serial reactor (ReadSerial and Pump), which only wakes
+#when data arrives or something is added to the buffer. Other threads wait on response_condition (WaitForIdle)
+
 import serial
 import threading
 import time
+import collections
+from SerialReactor import GetReactor
+from CommandQueue import CommandQueue
+from LineFramer import LineFramer, TraceRecord
+from GrblStatus import GrblStatusParser
+from Metrics import GetMetrics, FILL_BUCKETS
+from Tracer import GetTracer
 #import CameraCapture
 
+
+def StreamRoom(temp_rx_buffer_size, temp_sent_chars, temp_in_flight, temp_next_line):
+    """returns how many characters fit in the GRBL RX buffer with character counting, next_line is the
+    oldest line not sent (None if none), with nothing in flight it is sent even if too long. Shared with the PrintSimulator"""
+    temp_room = temp_rx_buffer_size - temp_sent_chars
+    if (temp_in_flight == 0 and temp_next_line is not None):
+        temp_room = max(temp_room, len(temp_next_line))
+    return temp_room
+
+
 class GRBL(serial.Serial):
     def __init__(self):
         self.ser = serial.Serial() #make an instance of serial connection
@@ -49,10 +74,8 @@ class GRBL(serial.Serial):
         self.homed_state = 0 #if printer is homed
         
         self.send_get_status = 0 #whether to send ?
-        self.motion_x_pos = 0.0
-        self.motion_y_pos = 0.0
-        self.motion_z_pos = 0.0
-        self.motion_a_pos = 0.0
+        self.status_parser = GrblStatusParser()
+        self.status = self.status_parser.status #snapshot of the last status report, replaced as a whole
         
         self.printer_size_x = 388.0 #x total size
         self.printer_size_y = 422.0 #y total size
@@ -82,8 +105,36 @@ class GRBL(serial.Serial):
         
         self.grbl_version = 0.0 #version of grbl
         
-        self.gcode_buffer = []
-        self.gcode_buffer_left = 0
+        self.reactor = GetReactor() #runs the serial reading and writing
+        
+        #lines waiting to be sent, producers block at the high watermark until it drained to the low watermark
+        self.gcode_buffer_high_watermark = 4096
+        self.gcode_buffer_low_watermark = 2048
+        self.gcode_buffer = CommandQueue(self.gcode_buffer_high_watermark, self.gcode_buffer_low_watermark)
+        self.gcode_buffer.on_put = self.reactor.Wake #something to send
+        
+        self.streaming_mode = 0 #0 for send-response, 1 for character counting
+        self.rx_buffer_size = 127 #bytes of the GRBL serial RX buffer that can be filled (128 - 1)
+        self.sent_lines = collections.deque() #lines sent to GRBL that still wait for an ok or error
+        self.sent_chars = 0 #characters of the lines in sent_lines
+        self.sent_times = collections.deque() #send times of the newest lines in sent_lines, only while metrics are on
+        self.error_line = "" #the line that caused the last error
+        
+        self.framer = LineFramer() #cuts the serial read data in lines
+        self.read_trace = None #file every read is recorded to (for bench_serial.py), None for off
+        self.response_condition = threading.Condition() #notified on every response from GRBL
+        
+        #metrics, only recorded while enabled (see Metrics.py)
+        self.metrics = GetMetrics()
+        self.metric_lines_sent = self.metrics.Counter('grbl_lines_sent_total', 'Lines sent to GRBL')
+        self.metric_bytes_read = self.metrics.Counter('grbl_bytes_read_total', 'Bytes read from GRBL')
+        self.metric_errors = self.metrics.Counter('grbl_errors_total', 'Error responses of GRBL')
+        self.metric_ack_seconds = self.metrics.Histogram('grbl_ack_seconds', 'Seconds from sending a line to its ok or error')
+        self.metric_rx_used = self.metrics.Histogram('grbl_rx_used_bytes', 'Bytes of the GRBL RX buffer in use after a write', FILL_BUCKETS)
+        self.metric_planner_free = self.metrics.Gauge('grbl_planner_free_blocks', 'Free planner blocks in the last status report')
+        self.metric_queue_lines = self.metrics.Gauge('grbl_queue_lines', 'Lines waiting to be sent to GRBL')
+        self.tracer = GetTracer() #timeline of the serial lines and motion, only recorded while on (see Tracer.py)
+        self.nl_trace_start = 0.0 #perf_counter when the new layer in progress was queued
         
         #self.temp_cam = CameraCapture.CameraCapture()
         
@@ -109,9 +160,14 @@ class GRBL(serial.Serial):
                 self.ok_state = 1 
                 self.error_state = 0 
                 self.homed_state = 0 
+                self.sent_lines.clear()
+                self.sent_chars = 0
+                self.sent_times.clear()
+                self.framer.Clear()
+                self.status_parser.Reset()
+                self.gcode_buffer.Open()
                 self._stop_event = threading.Event()
-                self.update_thread = threading.Thread(target=self.Update)
-                self.update_thread.start()
+                self.reactor.Register(self)
                 self.status_thread = threading.Thread(target=self.GetStatus)
                 self.status_thread.start()
                 return 1
@@ -122,134 +178,159 @@ class GRBL(serial.Serial):
         """close the connection to GRBL"""
         if (self.connection_state == 1):
             self._stop_event.set()
+            self.gcode_buffer.Close() #release producers waiting for room
+            self.reactor.Unregister(self)
             self.ser.close()
             print("Closing grbl connection")
             self.connection_state = 0
+            with self.response_condition:
+                self.response_condition.notify_all() #wake anyone waiting on a response
             return 0
         
-    def Update(self):
-        """Preforms all continous tasts required for GRBL connection"""
-        time.sleep(0.05)
-        read_buffer = "" #used to store Serial read data
-        while not self._stop_event.is_set():
-            #get code
-            temp_success = 0 #success value
-            try: #attempt to read serial
-                if (self.ser.in_waiting > 0):
-                    temp_read = self.ser.read(self.ser.in_waiting) #add serial to read buffer
-                    temp_read = str(temp_read.decode('utf-8'))
-                    temp_success = 1
-            except:
-                print("Read error") #some mistake, otherwise ignore quietly
-                break
-            if temp_success == 1: 
-                read_buffer += temp_read
-                #print(read_buffer)
-                #add line to read buffer
-            
-            temp_decode = read_buffer.partition('\n') #check for EOL conditions
-            if (temp_decode[1] == '\n'): #if '\n' 
-                read_buffer = temp_decode[2] #write remainder to buffer
-                read_line = str(temp_decode[0])
-                read_line = read_line.lower() #make all lower case for checking 
-                read_line = read_line.rstrip() #remove carriage return
-                #print("reading line: " + str(read_line)) 
-                #check purpose of response
-                if (read_line.startswith('ok')): #if ok was found,
-                    self.ok_state = 1 #set ok state to 1
-                    if (self.homed_state == 2):
-                        self.homed_state = 1 #first OK after homing is homing done, set to 1
-                        #print("Is homed")
-                    #print("OK found, setting ok state")
-                if (read_line.startswith('error')): #if error was found,
-                    self.window_input_buffer += str(read_line) #add to the window buffer
-                    self.error_state = 1
-                    print("error found, getting error type")
-                if (read_line.startswith('[')): #if message was found,
-                    self.window_input_buffer += str(read_line) #add to the window buffer
-                    print("message found, getting message")
-                    #self.Home()
-                if (read_line.startswith('<')): #if status was found,
-                    #print("status found, getting status")
-                    read_line = read_line.partition(',')#partition till |, compare options
-                    temp_line = read_line[0].lstrip('<') #get value
-                    read_line = read_line[2] #set remainder
-                    self.motion_state = str(temp_line) #set status
-                    self.motion_state_index += 1 #add one to index
-                    if (self.motion_state_index > self.motion_state_index_limit): 
-                        self.motion_state_index = 0 #reset index after reaching max
-                    read_line = read_line.partition(':')
-                    temp_line = read_line[0]
-                    read_line = read_line[2]
-                    if (temp_line == "wpos"):
-                        read_line = read_line.partition(',')
-                        temp_line = read_line[0] #get x
-                        self.motion_x_pos = float(temp_line)
-                        read_line = read_line[2]
-                        
-                        read_line = read_line.partition(',')
-                        temp_line = read_line[0] #get y
-                        self.motion_y_pos = float(temp_line)
-                        read_line = read_line[2]
-                        
-                        read_line = read_line.partition(',')
-                        temp_line = read_line[0] #get z
-                        self.motion_z_pos = float(temp_line)
-                        read_line = read_line[2]
-                        
-                        read_line = read_line.partition(',')
-                        temp_line = read_line[0] #get a
-                        self.motion_a_pos = float(temp_line)
-                        read_line = read_line[2]
-                    
-                    #print("Status: " + self.motion_state)
-                if (read_line.startswith('grbl')): #if grbl was found,
-                    self.started_state = 1
-                    print("grbl found, getting version")
-                    read_line = read_line.partition(' ') #strip grbl from file
-                    read_line = read_line[2].partition('f ') #strip instructions past version number
-                    if (read_line[1] == 'k '):
-                        self.window_input_buffer += str(read_line) #add to the window buffer
-                        self.grbl_version = float(read_line[0])
-                        print("GRBL Version: " + str(self.grbl_version))
-                        
-                        
-                
-            #is ok state is 1, and line buffered, send new line
-            if (self.ok_state == 1 and self.started_state == 1):
-                if (self.send_get_status == 1): 
-                    self.ok_state = 0 #set ok state to 0
-                    self.SerialWriteRaw("?\r",0) #send ?
-                    self.send_get_status = 0 #set get status to 0
-                    #print("Getting status")
-                elif (self.BufferLeft() > 0): #if there are lines left to print
-                    self.ok_state = 0 #set ok state to 0
-                    self.BufferNext() #print next line in buffer to serial
-                    
-            #check if new layer is done
-            if (self.nl_state == 0): #if new layer is in progress
-                if (self.motion_state == 'idle'): #if printer is not moving
-                    #if position is withing the bounds of the target
-                    if (self.motion_x_pos > self.nl_front_pos_x - self.nl_end_tolerance and self.motion_x_pos < self.nl_front_pos_x + self.nl_end_tolerance):
-                        self.nl_state = 1 #set new layer to 1 (done)
-                        print("new layer done")
-                
+    def ReadSerial(self):
+        """Reads what arrived on the serial and handles every complete line,
+        returns 0 if the serial could not be read"""
+        try: #attempt to read serial
+            temp_read = self.ser.read(max(1, self.ser.in_waiting)) #add serial to read buffer
+        except:
+            print("Read error") #some mistake, otherwise ignore quietly
+            return 0
+        if (len(temp_read) > 0):
+            self.metric_bytes_read.Inc(len(temp_read))
+            if (self.read_trace is not None):
+                TraceRecord(self.read_trace, temp_read)
+            for temp_line in self.framer.Feed(temp_read): #every complete line
+                self.ParseLine(temp_line.decode('utf-8', 'replace'))
+            with self.response_condition:
+                self.response_condition.notify_all()
+        return 1
+        
+    def ParseLine(self, read_line):
+        """Handles a single line received from GRBL"""
+        self.tracer.Serial('GRBL serial', 'rx', read_line)
+        read_line = read_line.lower() #make all lower case for checking 
+        read_line = read_line.rstrip() #remove carriage return
+        #print("reading line: " + str(read_line)) 
+        #check purpose of response
+        if (read_line.startswith('ok')): #if ok was found,
+            self.ok_state = 1 #set ok state to 1
+            temp_acked_line = self.AckLine()
+            if (self.homed_state == 2):
+                if (self.streaming_mode == 0 or temp_acked_line.startswith('$h')):
+                    self.homed_state = 1 #the OK of the home command is homing done, set to 1
+                #print("Is homed")
+            #print("OK found, setting ok state")
+        if (read_line.startswith('error')): #if error was found,
+            self.error_line = self.AckLine().rstrip() #the oldest line sent caused the error
+            self.window_input_buffer += str(read_line) + " (" + self.error_line + ")\n" #add to the window buffer
+            self.error_state = 1
+            self.metric_errors.Inc()
+            print("error found: " + str(read_line) + " on line: " + self.error_line)
+        if (read_line.startswith('[')): #if message was found,
+            self.window_input_buffer += str(read_line) #add to the window buffer
+            print("message found, getting message")
+            #self.Home()
+        if (read_line.startswith('<')): #if status was found,
+            #print("status found, getting status")
+            temp_status = self.status_parser.Parse(read_line)
+            if (temp_status is not None):
+                if (temp_status.state != self.motion_state):
+                    self.tracer.Instant(temp_status.state, 'motion', 'GRBL motion')
+                self.status = temp_status #one assignment, readers see all of this report or all of the last
+                self.motion_state = temp_status.state #set status
+                self.metric_planner_free.Set(temp_status.planner_free)
+                self.motion_state_index += 1 #add one to index
+                if (self.motion_state_index > self.motion_state_index_limit): 
+                    self.motion_state_index = 0 #reset index after reaching max
+            #print("Status: " + self.motion_state)
+        if (read_line.startswith('grbl')): #if grbl was found,
+            self.started_state = 1
+            print("grbl found, getting version")
+            read_line = read_line.partition(' ') #strip grbl from file
+            read_line = read_line[2].partition('f ') #strip instructions past version number
+            if (read_line[1] == 'k '):
+                self.window_input_buffer += str(read_line) #add to the window buffer
+                self.grbl_version = float(read_line[0])
+                print("GRBL Version: " + str(self.grbl_version))
+        
+    def Pump(self):
+        """Sends what can be sent and checks if the new layer is done, called by the reactor"""
+        if (self.streaming_mode == 1 and self.started_state == 1):
+            #? is a real time command, does not use the RX buffer and gets no ok
+            if (self.send_get_status == 1):
+                self.SerialWriteRaw("?",0) #send ?
+                self.send_get_status = 0 #set get status to 0
+            #send as many lines as fit in the GRBL RX buffer
+            if (self.BufferLeft() > 0):
+                self.BufferNextStreaming()
+        #is ok state is 1, and line buffered, send new line
+        elif (self.ok_state == 1 and self.started_state == 1):
+            if (self.send_get_status == 1): 
+                self.ok_state = 0 #set ok state to 0
+                self.SerialWriteTracked("?\r") #send ?, the \r is an empty line that gets an ok
+                self.send_get_status = 0 #set get status to 0
+                #print("Getting status")
+            elif (self.BufferLeft() > 0): #if there are lines left to print
+                self.ok_state = 0 #set ok state to 0
+                self.BufferNext() #print next line in buffer to serial
+
+        #check if new layer is done
+        if (self.nl_state == 0): #if new layer is in progress
+            if (self.motion_state == 'idle'): #if printer is not moving
+                #if position is withing the bounds of the target
+                if (self.motion_x_pos > self.nl_front_pos_x - self.nl_end_tolerance and self.motion_x_pos < self.nl_front_pos_x + self.nl_end_tolerance):
+                    self.nl_state = 1 #set new layer to 1 (done)
+                    self.tracer.Complete('new layer', 'motion', self.nl_trace_start, time.perf_counter(), 'GRBL motion')
+                    print("new layer done")
+        self.metric_queue_lines.Set(self.BufferLeft())
         
     def SerialWriteRaw(self, input_string, temp_priority):
         """prints a line to the GRBL (no checks)
         priority is 0 for not send to output, and 1 for sent to output"""
         if (temp_priority == 1):
             self.window_output_buffer += input_string #add to the window buffer
+        self.tracer.Serial('GRBL serial', 'tx', input_string)
         self.ser.write(input_string.encode('utf-8'))
         
+    def SerialWriteTracked(self, input_string, temp_priority=0):
+        """prints a line to the GRBL and remembers it until its ok or error arrives"""
+        self.sent_lines.append(input_string)
+        self.sent_chars += len(input_string)
+        self.TrackSent(1)
+        self.SerialWriteRaw(input_string, temp_priority)
+        
+    def TrackSent(self, temp_count):
+        """Counts the lines just sent and remembers when, for the ok latency (only while metrics are on)"""
+        if (self.metrics.enabled):
+            self.metric_lines_sent.Inc(temp_count)
+            self.metric_rx_used.Observe(self.sent_chars)
+            self.sent_times.extend([time.perf_counter()] * temp_count)
+        
+    def AckLine(self):
+        """removes the oldest line that waits for a response (ok or error) and returns it"""
+        if (len(self.sent_lines) > 0):
+            if (len(self.sent_times) == len(self.sent_lines)): #the oldest line has a send time
+                self.metric_ack_seconds.Observe(time.perf_counter() - self.sent_times.popleft())
+            temp_line = self.sent_lines.popleft()
+            self.sent_chars -= len(temp_line)
+            return temp_line.lower()
+        return ""
+        
+    def SetStreamingMode(self, temp_mode):
+        """Sets how lines are sent, 0 for send-response, 1 for character counting"""
+        self.streaming_mode = int(temp_mode)
+        
     def SerialWriteBufferRaw(self, input_string):
         """Adds a line to the input buffer""" 
         if (self.connection_state == 1): #only work when connected
-            self.gcode_buffer.append(str(input_string) + '\r') #add string to buffer
-            self.gcode_buffer_left += 1 #add one to left value
+            self.gcode_buffer.Put(str(input_string) + '\r') #add string to buffer, waits if full
     
     def SerialGotoXY(self, temp_x, temp_y, temp_f=''):
         """move to the given X/Y position at feedrate in mm/min"""
+        self.SerialWriteBufferRaw(self.GotoLine(temp_x, temp_y, temp_f))
+        
+    def GotoLine(self, temp_x, temp_y, temp_f=''):
+        """returns the line that moves to the given X/Y position at feedrate in mm/min"""
         temp_string = "G1 X"
         temp_string += str(temp_x)
         temp_string += " Y"
@@ -257,7 +338,7 @@ class GRBL(serial.Serial):
         if (temp_f):
             temp_string += " F"
             temp_string += str(temp_f)
-        self.SerialWriteBufferRaw(temp_string)
+        return temp_string
         
     def SerialGotoHome(self, temp_f):
         """move the printer to the home position, does NOT home the printer"""
@@ -316,81 +397,106 @@ class GRBL(serial.Serial):
         before idle.
         All piston movements are done by relative motion, not absolute"""
         if(self.homed_state == 1):
-            #calculate piston movements
             if (temp_override_build == 0):
                 print("Normal new layer")
-                temp_b_feed_distance = temp_thickness - self.nl_piston_clearance - self.nl_piston_hysteresis
             else:
                 print("Only feed")
-                temp_b_feed_distance =  (self.nl_piston_clearance * -1) - self.nl_piston_hysteresis
-            temp_f_feed_distance = (temp_thickness * self.nl_piston_feed_overfill * -1) - self.nl_piston_clearance - self.nl_piston_hysteresis
-            temp_hysteresis_clearance =  self.nl_piston_clearance - self.nl_piston_hysteresis
-            
-            #b hysteresis = 1
-            #thickness = 0.25
-            #clearance = 0.5
-            #b moves down 1, moves up 0.25-0.5-1 = -1.25 (nett -0.25)
-            #b moves down 1, moves down 0.5-1 = -0.5 (nett 0.5)
-            
-            self.SerialGotoXY(self.nl_back_pos_x, self.nl_back_pos_y, self.nl_travel_speed) #move gantry to back position
-            
-            #try to take picture
-            #self.StatusIndexSet()
-            #while (self.StatusIndexChanged() == 0):
-            #    time.sleep(0.005)
-            #print("Halt exited, state: " + self.motion_state)
-            #try:
-                #time.sleep(0.5)
-                #self.temp_cam.CaptureImage(self.motion_z_pos)
-                #time.sleep(0.5)
-            #except:
-            #    pass
-            
-            self.SerialWriteBufferRaw("G91") #set motion to relative
-            self.SerialWriteBufferRaw("G1 Z" + str(self.nl_piston_hysteresis) + " F" + str(self.nl_piston_speed))#move hysteresis down
-            self.SerialWriteBufferRaw("G1 Z" + str(temp_b_feed_distance) + " F" + str(self.nl_piston_speed)) #Lower build piston to build position
-            self.SerialWriteBufferRaw("G1 A" + str(self.nl_piston_hysteresis) + " F" + str(self.nl_piston_speed)) #move hysteresis down
-            self.SerialWriteBufferRaw("G1 A" + str(temp_f_feed_distance) + " F" + str(self.nl_piston_speed)) #raise feed piston to feed position
-            
-            
-            self.SerialWriteBufferRaw("G90") #set motion to absolute
-            self.SpreaderSet(1) #start spreader
-            self.SerialGotoXY(self.nl_front_pos_x, self.nl_back_pos_y, self.nl_feed_speed) #move gantry to overshoot
-            self.SpreaderSet(0) #stop spreader
-            self.SerialWriteBufferRaw("G91") #set motion to relative
-            self.SerialWriteBufferRaw("G1 Z" + str(self.nl_piston_hysteresis) + " F" + str(self.nl_piston_speed)) #move hysteresis down
-            self.SerialWriteBufferRaw("G1 Z" + str(temp_hysteresis_clearance) + " F" + str(self.nl_piston_speed)) #move build pistons down clearance amount
-            self.SerialWriteBufferRaw("G1 A" + str(self.nl_piston_hysteresis) + " F" + str(self.nl_piston_speed)) #move hysteresis down
-            self.SerialWriteBufferRaw("G1 A" + str(temp_hysteresis_clearance) + " F" + str(self.nl_piston_speed)) #move feed pistons down clearance amount
-            self.SerialWriteBufferRaw("G90") #set motion to absolute
-            
+            self.nl_trace_start = time.perf_counter()
+            for temp_line in self.NewLayerLines(temp_thickness, temp_override_build):
+                self.SerialWriteBufferRaw(temp_line)
+            self.spreader_state = 0 #the spreader is stopped at the end of the new layer
             
             #wait till state is not idle anymore
             self.StatusIndexSet()
-            while (self.StatusIndexChanged() == 0):
-                time.sleep(0.005)
+            self.WaitForStatusChanged()
             #print("Halt exited, state: " + self.motion_state)
             
             self.nl_state = 0 #set new layer state to in progress
         
+    def NewLayerLines(self, temp_thickness, temp_override_build = 0):
+        """Returns the lines of a new layer, without sending them.
+        Used by NewLayer and by the print simulator"""
+        #calculate piston movements
+        if (temp_override_build == 0):
+            temp_b_feed_distance = temp_thickness - self.nl_piston_clearance - self.nl_piston_hysteresis
+        else:
+            temp_b_feed_distance =  (self.nl_piston_clearance * -1) - self.nl_piston_hysteresis
+        temp_f_feed_distance = (temp_thickness * self.nl_piston_feed_overfill * -1) - self.nl_piston_clearance - self.nl_piston_hysteresis
+        temp_hysteresis_clearance =  self.nl_piston_clearance - self.nl_piston_hysteresis
+        
+        #b hysteresis = 1
+        #thickness = 0.25
+        #clearance = 0.5
+        #b moves down 1, moves up 0.25-0.5-1 = -1.25 (nett -0.25)
+        #b moves down 1, moves down 0.5-1 = -0.5 (nett 0.5)
+        
+        temp_lines = []
+        temp_lines.append(self.GotoLine(self.nl_back_pos_x, self.nl_back_pos_y, self.nl_travel_speed)) #move gantry to back position
+        
+        #try to take picture
+        #self.StatusIndexSet()
+        #while (self.StatusIndexChanged() == 0):
+        #    time.sleep(0.005)
+        #print("Halt exited, state: " + self.motion_state)
+        #try:
+            #time.sleep(0.5)
+            #self.temp_cam.CaptureImage(self.motion_z_pos)
+            #time.sleep(0.5)
+        #except:
+        #    pass
+        
+        temp_lines.append("G91") #set motion to relative
+        temp_lines.append("G1 Z" + str(self.nl_piston_hysteresis) + " F" + str(self.nl_piston_speed))#move hysteresis down
+        temp_lines.append("G1 Z" + str(temp_b_feed_distance) + " F" + str(self.nl_piston_speed)) #Lower build piston to build position
+        temp_lines.append("G1 A" + str(self.nl_piston_hysteresis) + " F" + str(self.nl_piston_speed)) #move hysteresis down
+        temp_lines.append("G1 A" + str(temp_f_feed_distance) + " F" + str(self.nl_piston_speed)) #raise feed piston to feed position
+        
+        
+        temp_lines.append("G90") #set motion to absolute
+        temp_lines.append("M4") #start spreader
+        temp_lines.append(self.GotoLine(self.nl_front_pos_x, self.nl_back_pos_y, self.nl_feed_speed)) #move gantry to overshoot
+        temp_lines.append("M5") #stop spreader
+        temp_lines.append("G91") #set motion to relative
+        temp_lines.append("G1 Z" + str(self.nl_piston_hysteresis) + " F" + str(self.nl_piston_speed)) #move hysteresis down
+        temp_lines.append("G1 Z" + str(temp_hysteresis_clearance) + " F" + str(self.nl_piston_speed)) #move build pistons down clearance amount
+        temp_lines.append("G1 A" + str(self.nl_piston_hysteresis) + " F" + str(self.nl_piston_speed)) #move hysteresis down
+        temp_lines.append("G1 A" + str(temp_hysteresis_clearance) + " F" + str(self.nl_piston_speed)) #move feed pistons down clearance amount
+        temp_lines.append("G90") #set motion to absolute
+        return temp_lines
         
     def BufferLeft(self):
         """returns how many lines are left in the buffer"""
-        return self.gcode_buffer_left
+        return len(self.gcode_buffer)
     
     def BufferNext(self):
         """Writes the next line in the buffer to the serial"""
-        if (self.BufferLeft() > 0): #if there are lines left in the buffer
-            self.gcode_buffer_left -= 1 #subtract 1 from left value
-            self.SerialWriteRaw(self.gcode_buffer[0],1) #print to GRBL
-            del self.gcode_buffer[0] #remove the written line
+        temp_line = self.gcode_buffer.Get(False) #take the next line
+        if (temp_line is not None): #if there was a line left in the buffer
+            self.SerialWriteTracked(temp_line,1) #print to GRBL
+    
+    def BufferNextStreaming(self):
+        """Writes as many lines from the buffer as fit in the GRBL RX buffer in one write"""
+        temp_room = StreamRoom(self.rx_buffer_size, self.sent_chars, len(self.sent_lines), self.gcode_buffer.Peek())
+        temp_lines = self.gcode_buffer.GetMany(self.BufferLeft(), temp_room)
+        if (len(temp_lines) > 0):
+            self.sent_lines.extend(temp_lines)
+            self.sent_chars += sum(len(temp_line) for temp_line in temp_lines)
+            self.TrackSent(len(temp_lines))
+            self.SerialWriteRaw(''.join(temp_lines),1) #print to GRBL
     
     def Home(self):
         """Homes the printer and sets the coordinates
         Because homing only sends the ok after the home, it suffices
         to simply send the move to home ('$H') and then 
         G92 X# Y#. The ok buffer will take care of the rest"""
-        self.SerialWriteBufferRaw('$h') #buffer home command
+        for temp_line in self.HomeLines():
+            self.SerialWriteBufferRaw(temp_line) #buffer home and G92 command
+        self.homed_state = 2 #set homed state to 2 (homing in progress)
+        self.motion_state = "home" #set status
+    
+    def HomeLines(self):
+        """Returns the lines of a home, the home command and the G92 that sets the coordinates"""
+        temp_lines = ['$h'] #home command
         #calculate x and y home based on home dir and length
         if (self.printer_homing_dir_x == -1):
             temp_x = self.printer_homing_pulloff
@@ -402,9 +508,8 @@ class GRBL(serial.Serial):
         else:
             temp_y = self.printer_size_y -self.printer_homing_pulloff
         
-        self.SerialWriteBufferRaw('G92 X' + str(temp_x) + ' Y' + str(temp_y))#buffer G92 command
-        self.homed_state = 2 #set homed state to 2 (homing in progress)
-        self.motion_state = "home" #set status
+        temp_lines.append('G92 X' + str(temp_x) + ' Y' + str(temp_y)) #G92 command
+        return temp_lines
     
     def GetStatus(self):
         """periodically sends a ? to get status"""
@@ -412,6 +517,7 @@ class GRBL(serial.Serial):
         while not self._stop_event.is_set():
             time.sleep(0.1) #wait for 0.1 seconds
             self.send_get_status = 1
+            self.reactor.Wake()
             
     def GetWindowOutput(self):
         """returns the entire string of what was sent since the 
@@ -427,6 +533,26 @@ class GRBL(serial.Serial):
         self.window_input_buffer = "" #clear buffer
         return temp_return #return response
         
+    @property
+    def motion_x_pos(self):
+        """X work position of the last status report"""
+        return self.status.wpos[0]
+        
+    @property
+    def motion_y_pos(self):
+        """Y work position of the last status report"""
+        return self.status.wpos[1]
+        
+    @property
+    def motion_z_pos(self):
+        """Z (build piston) work position of the last status report"""
+        return self.status.wpos[2]
+        
+    @property
+    def motion_a_pos(self):
+        """A (feed piston) work position of the last status report"""
+        return self.status.wpos[3]
+        
     def StatusIndexSet(self):
         """Sets the current status index value, so later function will know if it changed"""
         self.motion_state_changed = 0
@@ -446,6 +572,23 @@ class GRBL(serial.Serial):
                 return 1 #return 1 if the values are the not same
         else:
             return 1 #return 1 if value was already marked as changed
+            
+    def WaitForStatusChanged(self, temp_timeout=None):
+        """Blocks until StatusIndexChanged, returns 1 if it did, 0 on timeout or disconnect"""
+        with self.response_condition:
+            self.response_condition.wait_for(lambda: self.connection_state == 0 or self.StatusIndexChanged() == 1, temp_timeout)
+            return int(self.connection_state == 1 and self.StatusIndexChanged() == 1)
+            
+    def WaitForIdle(self, temp_new_status=0, temp_timeout=None):
+        """Blocks until GRBL reports idle, with temp_new_status 1 the status also
+        has to have changed since StatusIndexSet. Returns 1 if idle, 0 on timeout or disconnect"""
+        def temp_idle():
+            if (temp_new_status == 1 and self.StatusIndexChanged() == 0):
+                return False
+            return self.motion_state == 'idle'
+        with self.response_condition:
+            self.response_condition.wait_for(lambda: self.connection_state == 0 or temp_idle(), temp_timeout)
+            return int(self.connection_state == 1 and temp_idle())
 
 if __name__ == '__main__':
     printer = GRBL()
@@ -467,3 +610,4 @@ if __name__ == '__main__':
 #ok
 #error:#
 #<Idle|WPos:0.000,250.000,0.000|Bf:15,127|FS:0,0>
+#status reports are parsed in GrblStatus.py
@@ -26,6 +26,10 @@
 # for now, focus is set on making it work. 1000 lines is plenty for most shapes
 # in the spirit of first make it work, the print function will cap at 900 or so, and split sweeps if the cap is reached
 # also python sucks at high speed stuff, mark for future reference just how bad it is for me (I suspect 50% PEBKAC)
+# (Update now streams with credits: the free space from the last BWL reply minus the lines sent after it,
+# with several commands in flight and the lines written in bulk. See BufferCredits)
+# (Reading and writing is done by the shared serial reactor (ReadSerial and Pump) which only wakes on data
+# or on new lines in the buffer, so it no longer competes with the other threads for python)
 
 #-Send a list of settings to the printhead upon connection. DPI and density is not sent here right now when the head is not connected
 # 
@@ -33,14 +37,36 @@
 import serial
 import threading
 import time
+import collections
 import B64
 import logging
+from SerialReactor import GetReactor
+from CommandQueue import CommandQueue
+from LineFramer import LineFramer, TraceRecord
+from Metrics import GetMetrics, FILL_BUCKETS
+from Tracer import GetTracer
 
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                     filename='OasisII.log', level=logging.DEBUG)
 
 
+def CreditsLeft(temp_writeleft, temp_sent_total, temp_sent_at_bwl, temp_margin):
+    """returns how many lines can be sent before the HP45 buffer reaches the margin,
+    the free space of the last BWL reply minus the lines sent after it was requested"""
+    return temp_writeleft - (temp_sent_total - temp_sent_at_bwl) - temp_margin
+
+
+def LinesToSend(temp_queued, temp_in_flight, temp_max_in_flight, temp_credits, temp_bwl_pending):
+    """returns (lines, bwl), how many of the queued lines can be sent now, and bwl 1 if none can
+    because the credits ran out and a BWL reply would give new ones. Shared with the PrintSimulator"""
+    temp_lines = min(temp_queued, temp_max_in_flight - temp_in_flight, temp_credits)
+    if (temp_lines > 0):
+        return temp_lines, 0
+    temp_bwl = temp_queued > 0 and temp_credits <= 0 and temp_bwl_pending == 0 and temp_in_flight < temp_max_in_flight
+    return 0, int(temp_bwl)
+
+
 class HP45(serial.Serial):
     def __init__(self):
         self.ser = serial.Serial() #make an instance of serial connection
@@ -65,12 +91,49 @@ class HP45(serial.Serial):
         self.inkjet_dpi = 300 #the DPI of the printhead
         self.inkjet_density = 190 #the density of the printhead
         
-        self.code_buffer = []
-        self.code_buffer_left = 0
+        self.reactor = GetReactor() #runs the serial reading and writing
+        
+        #lines waiting to be sent, producers block at the high watermark until it drained to the low watermark
+        self.code_buffer = CommandQueue(32768, 16384)
+        self.code_buffer.on_put = self.reactor.Wake #something to send
+        
+        #flow control of the HP45 line buffer
+        self.inkjet_buffer_margin = 50 #lines kept free in the HP45 buffer
+        self.inkjet_max_in_flight = 8 #commands sent without having received their OK
+        self.inkjet_ok_timeout = 1.0 #seconds without OK before commands in flight are considered lost
+        self.lines_in_flight = 0 #commands sent, OK not yet received
+        self.lines_sent_total = 0 #buffer lines sent since connecting
+        self.lines_sent_at_bwl = 0 #lines sent when the last BWL reply was requested
+        self.lines_sent_at_bwl_request = 0 #lines sent when the pending BWL was requested
+        self.bwl_pending = 0 #whether a BWL is waiting for a reply
+        self.bwl_interval = 0.01 #minimum time between BWL requests when out of credits
+        self.bwl_time = 0.0 #time of the last BWL request
+        self.last_ok_time = 0.0 #time of the last OK
+        self.sent_times = collections.deque() #send times of the newest commands in flight, only while metrics are on
+        
+        #streaming metric
+        self.inkjet_lines_per_second = 0.0 #lines sent per second, over the last second
+        self.line_rate_time = 0.0
+        self.line_rate_count = 0
+        
+        #metrics, only recorded while enabled (see Metrics.py)
+        self.metrics = GetMetrics()
+        self.metric_lines_sent = self.metrics.Counter('hp45_lines_sent_total', 'Buffer lines sent to the HP45')
+        self.metric_bytes_read = self.metrics.Counter('hp45_bytes_read_total', 'Bytes read from the HP45')
+        self.metric_bwl_requests = self.metrics.Counter('hp45_bwl_requests_total', 'BWL requests, one per refill of the credits')
+        self.metric_ok_timeouts = self.metrics.Counter('hp45_ok_timeouts_total', 'Times the commands in flight were considered lost')
+        self.metric_ack_seconds = self.metrics.Histogram('hp45_ack_seconds', 'Seconds from sending a command to its OK')
+        self.metric_buffer_free = self.metrics.Histogram('hp45_buffer_free_lines', 'Free lines of the HP45 buffer in the BWL replies', FILL_BUCKETS)
+        self.metric_queue_lines = self.metrics.Gauge('hp45_queue_lines', 'Lines waiting to be sent to the HP45')
+        self.tracer = GetTracer() #timeline of the serial lines, only recorded while on (see Tracer.py)
         
         self.window_output_buffer = "" #holds a buffer of what was sent out
         self.window_input_buffer = "" #holds a buffer of what was received
         
+        self.framer = LineFramer() #cuts the serial read data in lines
+        self.read_trace = None #file every read is recorded to (for bench_serial.py), None for off
+        self.response_condition = threading.Condition() #notified on every response and bulk write
+        
     def Connect(self, serial_port):
         """Attempt to connect to the HP45 controller"""
         self.com_port_raw = str(serial_port) #get value from set_com
@@ -94,9 +157,14 @@ class HP45(serial.Serial):
                 self.ok_state = 1 
                 self.error_state = 0 
                 self.homed_state = 0 
+                self.lines_in_flight = 0
+                self.sent_times.clear()
+                self.bwl_pending = 0
+                self.last_ok_time = time.time()
+                self.framer.Clear()
+                self.code_buffer.Open()
                 self._stop_event = threading.Event()
-                self.update_thread = threading.Thread(target=self.Update)
-                self.update_thread.start()
+                self.reactor.Register(self)
                 self.status_thread = threading.Thread(target=self.GetStatus)
                 self.status_thread.start()
                 logging.info("Connection successfully")
@@ -108,127 +176,201 @@ class HP45(serial.Serial):
         """close the connection to HP45"""
         if (self.connection_state == 1):
             self._stop_event.set()
+            self.code_buffer.Close() #release producers waiting for room
+            self.reactor.Unregister(self)
             self.ser.close()
             print("Closing grbl connection")
             logging.info("Disconected")
             self.connection_state = 0
+            with self.response_condition:
+                self.response_condition.notify_all() #wake anyone waiting on the buffer
             return 0
             
-    def Update(self):
-        """Preforms all continous tasks required for HP45 connection"""
-        time.sleep(0.05)
-        read_buffer = "" #used to store Serial read data
-        while not self._stop_event.is_set():
-            #get code
-            temp_success = 0 #success value
-            try: #attempt to read serial
-                if (self.ser.in_waiting > 0):
-                    temp_read = self.ser.read(self.ser.in_waiting) #add serial to read buffer
-                    temp_read = str(temp_read.decode('utf-8'))
-                    temp_success = 1
-                    logging.debug('Read: %r' % temp_read)
-            except:
-                print("Read error") #some mistake, otherwise ignore quietly
-                break
-            if temp_success == 1: 
-                read_buffer += temp_read
-                #print(read_buffer)
-                #add line to read buffer
-                
-            temp_decode = read_buffer.partition('\n') #check for EOL conditions
-            if (temp_decode[1] == '\n'): #if '\n' 
-                read_buffer = temp_decode[2] #write remainder to buffer
-                read_line = str(temp_decode[0])
-                #read_line = read_line.lower() #make all lower case for checking #(DONT!!!)
-                read_line = read_line.rstrip() #remove carriage return
-                #print("reading line: " + str(read_line)) 
-                #check purpose of response
-                logging.debug("Read line complete: %r " % read_line)
-                if (read_line.startswith('OK')): #if ok was found,
-                    self.ok_state = 1 #set ok state to 1
-                    #print("OK found, setting ok state")
-                    logging.debug("Ok found, setting ok state")
-                if (read_line.startswith('GTP:')):
-                    #print("getting temperature")
-                    read_line = read_line.partition(':') #split at :
-                    read_line = read_line[2] #get end
-                    temp_return_string = B64.B64FromSingle(read_line)
-                    self.inkjet_temperature = float(temp_return_string)
-                    self.inkjet_temperature /= 10.0 #get whole degrees
-                    logging.debug('Getting temperature: %f' % (self.inkjet_temperature))
-                if (read_line.startswith('GEP:')):
-                    #print("getting position")
-                    read_line = read_line.partition(':') #split at :
-                    read_line = read_line[2] #get end
-                    #print("Decoding: " + read_line)
-                    temp_return_string = B64.B64FromSingle(read_line)
-                    #print("position found: " + str(temp_return_string))
-                    self.inkjet_x_pos = float(temp_return_string)
-                    self.inkjet_x_pos /= 1000.0 #get millimeters
-                    logging.debug('Getting position: %f' % (self.inkjet_x_pos))
-                if (read_line.startswith('BWL:')):
-                    #print("getting buffer write left")
-                    read_line = read_line.partition(':') #split at :
-                    read_line = read_line[2] #get end
-                    temp_return_string = B64.B64FromSingle(read_line)
-                    self.inkjet_writeleft = int(temp_return_string)
-                    logging.debug('Getting Buffer write left: %f' % (self.inkjet_writeleft))
-                if (read_line.startswith('THD:')): 
-                    #print("decoding test results")
-                    read_line = read_line.partition(':') #split at :
-                    read_line = read_line[2] #get end
-                    #print("Decoding: " + read_line)
-                    temp_return_string = B64.B64FromTestArray(read_line)
-                    temp_total_nozzle = 0
-                    temp_working_nozzles = 0
-                    for n in temp_return_string:
-                        #print(n)
-                        temp_total_nozzle += 1
-                        if (n == 1):
-                            temp_working_nozzles += 1
-                    self.inkjet_total_nozzles = temp_total_nozzle
-                    self.inkjet_working_nozzles = temp_working_nozzles
+    def ReadSerial(self):
+        """Reads what arrived on the serial and handles every complete line,
+        returns 0 if the serial could not be read"""
+        try: #attempt to read serial
+            temp_read = self.ser.read(max(1, self.ser.in_waiting)) #add serial to read buffer
+        except:
+            print("Read error") #some mistake, otherwise ignore quietly
+            return 0
+        if (len(temp_read) > 0):
+            logging.debug('Read: %r', temp_read)
+            self.metric_bytes_read.Inc(len(temp_read))
+            if (self.read_trace is not None):
+                TraceRecord(self.read_trace, temp_read)
+            for temp_line in self.framer.Feed(temp_read): #every complete line
+                self.ParseLine(temp_line.decode('utf-8', 'replace'))
+            with self.response_condition:
+                self.response_condition.notify_all()
+        return 1
         
-            #is ok state is 1, and line buffered, send new line
-            if (self.ok_state == 1):
-                if (self.send_get_status == 1): 
-                    #print("sending status")
-                    self.ok_state = 0 #set ok state to 0
-                    self.SerialWriteRaw(self.send_status_buffer + "\r",0) #send status request
-                    self.send_get_status = 0 #set get status to 0
-                    #print("Getting status")
-                elif (self.BufferLeft() > 0): #if there are lines left to print
-                    logging.debug("There are lines to print")
-                    logging.debug("inkjet_writeleft is: %r" % (self.inkjet_writeleft))
-                    if (self.inkjet_writeleft > 50): #only send if space left in hp45 buffer
-                        #print(self.BufferLeft())
-                        self.ok_state = 0 #set ok state to 0
-                        self.BufferNext() #print next line in buffer to serial            
-                        self.inkjet_writeleft -= 1 #subtract 1 from line left (estimate)
+    def ParseLine(self, read_line):
+        """Handles a single line received from the HP45"""
+        self.tracer.Serial('HP45 serial', 'rx', read_line)
+        #read_line = read_line.lower() #make all lower case for checking #(DONT!!!)
+        read_line = read_line.rstrip() #remove carriage return
+        #print("reading line: " + str(read_line)) 
+        #check purpose of response
+        logging.debug("Read line complete: %r ", read_line)
+        if (read_line.startswith('OK')): #if ok was found,
+            self.ok_state = 1 #set ok state to 1
+            self.last_ok_time = time.time()
+            if (self.lines_in_flight > 0):
+                if (len(self.sent_times) == self.lines_in_flight): #the oldest command has a send time
+                    self.metric_ack_seconds.Observe(time.perf_counter() - self.sent_times.popleft())
+                self.lines_in_flight -= 1 #one command less in flight
+            #print("OK found, setting ok state")
+            logging.debug("Ok found, setting ok state")
+        if (read_line.startswith('GTP:')):
+            #print("getting temperature")
+            read_line = read_line.partition(':') #split at :
+            read_line = read_line[2] #get end
+            temp_return_string = B64.B64FromSingle(read_line)
+            self.inkjet_temperature = float(temp_return_string)
+            self.inkjet_temperature /= 10.0 #get whole degrees
+            logging.debug('Getting temperature: %f', self.inkjet_temperature)
+        if (read_line.startswith('GEP:')):
+            #print("getting position")
+            read_line = read_line.partition(':') #split at :
+            read_line = read_line[2] #get end
+            #print("Decoding: " + read_line)
+            temp_return_string = B64.B64FromSingle(read_line)
+            #print("position found: " + str(temp_return_string))
+            self.inkjet_x_pos = float(temp_return_string)
+            self.inkjet_x_pos /= 1000.0 #get millimeters
+            logging.debug('Getting position: %f', self.inkjet_x_pos)
+        if (read_line.startswith('BWL:')):
+            #print("getting buffer write left")
+            read_line = read_line.partition(':') #split at :
+            read_line = read_line[2] #get end
+            temp_return_string = B64.B64FromSingle(read_line)
+            self.inkjet_writeleft = int(temp_return_string)
+            self.lines_sent_at_bwl = self.lines_sent_at_bwl_request #the reply counts all lines sent before the request
+            self.bwl_pending = 0
+            self.metric_buffer_free.Observe(self.inkjet_writeleft)
+            logging.debug('Getting Buffer write left: %f', self.inkjet_writeleft)
+        if (read_line.startswith('THD:')): 
+            #print("decoding test results")
+            read_line = read_line.partition(':') #split at :
+            read_line = read_line[2] #get end
+            #print("Decoding: " + read_line)
+            temp_return_string = B64.B64FromTestArray(read_line)
+            temp_total_nozzle = 0
+            temp_working_nozzles = 0
+            for n in temp_return_string:
+                #print(n)
+                temp_total_nozzle += 1
+                if (n == 1):
+                    temp_working_nozzles += 1
+            self.inkjet_total_nozzles = temp_total_nozzle
+            self.inkjet_working_nozzles = temp_working_nozzles
+    
+    def Pump(self):
+        """Sends status requests and buffered lines as far as the credits allow, called by the reactor"""
+        #if no OK arrives for a while, consider the commands in flight lost
+        if (self.lines_in_flight > 0 and time.time() - self.last_ok_time > self.inkjet_ok_timeout):
+            logging.warning("No OK for %d commands in flight, resetting" % (self.lines_in_flight))
+            self.lines_in_flight = 0
+            self.sent_times.clear()
+            self.bwl_pending = 0
+            self.last_ok_time = time.time()
+            self.metric_ok_timeouts.Inc()
+
+        #send status requests and buffered lines, several commands can be in flight at once
+        if (self.send_get_status == 1 and self.lines_in_flight < self.inkjet_max_in_flight):
+            if (self.send_status_buffer != "BWL" or self.bwl_pending == 0): #only one BWL at a time
+                self.SerialStatusRequest(self.send_status_buffer)
+            self.send_get_status = 0 #set get status to 0
+        temp_lines, temp_bwl = LinesToSend(self.BufferLeft(), self.lines_in_flight, self.inkjet_max_in_flight,
+                                           self.BufferCredits(), self.bwl_pending)
+        if (temp_lines > 0):
+            self.BufferNextBulk(temp_lines) #write as many lines as fit in one go
+        elif (temp_bwl == 1 and time.time() - self.bwl_time > self.bwl_interval):
+            self.SerialStatusRequest("BWL") #out of credits, ask for the free space right away
+        self.UpdateLineRate()
+        self.metric_queue_lines.Set(self.BufferLeft())
+    
+    def SerialStatusRequest(self, temp_request):
+        """Sends a status request (GTP, GEP, BWL) to the HP45"""
+        if (temp_request == "BWL"):
+            self.bwl_pending = 1
+            self.bwl_time = time.time()
+            self.lines_sent_at_bwl_request = self.lines_sent_total
+            self.metric_bwl_requests.Inc()
+        self.ok_state = 0 #set ok state to 0
+        self.lines_in_flight += 1
+        self.TrackSent(1)
+        self.SerialWriteRaw(temp_request + "\r",0) #send status request
+    
+    def TrackSent(self, temp_count):
+        """Remembers when the commands just put in flight were sent, for the OK latency (only while metrics are on)"""
+        if (self.metrics.enabled):
+            self.sent_times.extend([time.perf_counter()] * temp_count)
+    
+    def BufferCredits(self):
+        """returns the credits left on this connection, see CreditsLeft"""
+        return CreditsLeft(self.inkjet_writeleft, self.lines_sent_total, self.lines_sent_at_bwl, self.inkjet_buffer_margin)
+    
+    def UpdateLineRate(self):
+        """updates the lines per second metric once every second"""
+        temp_now = time.time()
+        if (temp_now - self.line_rate_time >= 1.0):
+            self.inkjet_lines_per_second = (self.lines_sent_total - self.line_rate_count) / (temp_now - self.line_rate_time)
+            self.line_rate_time = temp_now
+            self.line_rate_count = self.lines_sent_total
+    
+    def GetLinesPerSecond(self):
+        """returns the sustained amount of lines sent per second"""
+        return self.inkjet_lines_per_second
     
     def SerialWriteRaw(self, input_string, temp_priority):
         """prints a line to the HP45 (no checks)
         priority is 0 for not send to output, and 1 for sent to output"""
         if (temp_priority == 1):
             self.window_output_buffer += input_string #add to the window buffer
+        self.tracer.Serial('HP45 serial', 'tx', input_string)
         self.ser.write(input_string.encode('utf-8'))
         
     def SerialWriteBufferRaw(self, input_string):
         """Adds a line to the input buffer""" 
         if (self.connection_state == 1): #only work when connected
-            self.code_buffer.append(str(input_string) + '\r') #add string to buffer
-            self.code_buffer_left += 1 #add one to left value
+            self.code_buffer.Put(str(input_string) + '\r') #add string to buffer, waits if full
+    
+    def SerialWriteBufferBulk(self, temp_lines):
+        """Adds a list of lines to the input buffer"""
+        if (self.connection_state == 1): #only work when connected
+            self.code_buffer.PutMany([str(temp_line) + '\r' for temp_line in temp_lines]) #add strings to buffer, waits if full
     
     def BufferLeft(self):
         """returns how many lines are left in the buffer"""
-        return self.code_buffer_left
+        return len(self.code_buffer)
     
     def BufferNext(self):
         """Writes the next line in the buffer to the serial"""
-        if (self.BufferLeft() > 0): #if there are lines left in the buffer
-            self.code_buffer_left -= 1 #subtract 1 from left value
-            self.SerialWriteRaw(self.code_buffer[0],0) #print to HP45
-            del self.code_buffer[0] #remove the written line
+        temp_line = self.code_buffer.Get(False) #take the next line
+        if (temp_line is not None): #if there was a line left in the buffer
+            self.SerialWriteRaw(temp_line,0) #print to HP45
+    
+    def BufferNextBulk(self, temp_lines):
+        """Writes the next lines in the buffer to the serial in a single write"""
+        temp_lines = self.code_buffer.GetMany(temp_lines) #take the lines
+        if (len(temp_lines) > 0):
+            self.ok_state = 0 #set ok state to 0
+            self.lines_in_flight += len(temp_lines)
+            self.lines_sent_total += len(temp_lines)
+            self.metric_lines_sent.Inc(len(temp_lines))
+            self.TrackSent(len(temp_lines))
+            self.SerialWriteRaw(''.join(temp_lines),0) #print to HP45
+            with self.response_condition:
+                self.response_condition.notify_all()
+    
+    def WaitForBufferLeft(self, temp_lines=0, temp_timeout=None):
+        """Blocks until no more than temp_lines are left in the buffer,
+        returns 1 if so, 0 on timeout or disconnect"""
+        with self.response_condition:
+            self.response_condition.wait_for(lambda: self.connection_state == 0 or self.BufferLeft() <= temp_lines, temp_timeout)
+            return int(self.connection_state == 1 and self.BufferLeft() <= temp_lines)
     
     def GetStatus(self):
         """periodically sends a get status command"""
@@ -245,6 +387,7 @@ class HP45(serial.Serial):
                 self.send_status_buffer = "BWL" #Get write left
                 #print("Ask for WL from HP45")
             self.send_get_status = 1
+            self.reactor.Wake()
             self.status_state += 1
             if (self.status_state > 2): #reset state
                 self.status_state = 0
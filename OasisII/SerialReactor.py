@@ -0,0 +1,171 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+#The serial reactor runs the I/O of all serial connections (GRBL and HP45) in a single thread
+#that sleeps until a port has data to read or a driver has something new to write (Wake)
+#A driver needs a ser (pyserial port), ReadSerial() to read and parse what arrived
+#(returns 0 when the port failed) and Pump() to write what can be written.
+#Pump is also called every tick so drivers can handle timeouts.
+#Ports that can not be selected on (Windows) get their own thread blocking in a read with a short timeout
+
+import io
+import selectors
+import socket
+import threading
+import traceback
+
+
+class SerialReactor:
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        #self pipe, a byte written here wakes the select
+        self.wake_read, self.wake_write = socket.socketpair()
+        self.wake_read.setblocking(False)
+        self.wake_write.setblocking(False)
+        self.selector.register(self.wake_read, selectors.EVENT_READ, None)
+
+        self.tick = 0.05 #seconds between pumps when nothing happens
+        self.poll_timeout = 0.01 #read timeout of ports that can not be selected on
+
+        self.lock = threading.Lock()
+        self.changes = [] #drivers to add or remove, applied by the reactor thread
+        self.selected = [] #drivers waited on by select
+        self.polled = {} #drivers with their own polling thread
+        self.thread = None
+
+    def Register(self, driver):
+        """Starts handling the I/O of a driver with an open port"""
+        with self.lock:
+            self.changes.append((1, driver, None))
+            if (self.thread is None):
+                self.thread = threading.Thread(target=self.Run, name='serial reactor', daemon=True)
+                self.thread.start()
+        self.Wake()
+
+    def Unregister(self, driver):
+        """Stops handling the I/O of a driver, returns once the port is no longer used,
+        so it can be closed right after"""
+        temp_done = threading.Event()
+        with self.lock:
+            temp_thread = self.thread
+            self.changes.append((0, driver, temp_done))
+        if (temp_thread is None or temp_thread is threading.current_thread()):
+            return
+        self.Wake()
+        temp_done.wait(1.0)
+
+    def Wake(self):
+        """Wakes the reactor so it pumps all drivers, call after adding something to write"""
+        try:
+            self.wake_write.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass #the pipe is full, a wake is pending already
+
+    def Run(self):
+        """Waits for events and handles them until no drivers are left"""
+        while True:
+            if (self.ApplyChanges() == 0):
+                return
+            if (len(self.selected) > 0):
+                temp_events = self.selector.select(self.tick)
+            else:
+                temp_events = self.selector.select() #only polled drivers, sleep until changes
+            for temp_key, temp_mask in temp_events:
+                temp_driver = temp_key.data
+                if (temp_driver is None):
+                    self.DrainWake()
+                elif (temp_driver in self.selected):
+                    if (self.Call(temp_driver.ReadSerial) == 0):
+                        self.Remove(temp_driver)
+            for temp_driver in list(self.selected):
+                self.Call(temp_driver.Pump)
+
+    def Call(self, temp_function):
+        """Calls a driver function, a mistake in one driver should not stop the others"""
+        try:
+            return temp_function()
+        except Exception:
+            traceback.print_exc()
+            return 1
+
+    def ApplyChanges(self):
+        """Adds and removes the drivers asked for, returns 0 when the thread should stop"""
+        with self.lock:
+            temp_changes = self.changes
+            self.changes = []
+            for temp_add, temp_driver, temp_done in temp_changes:
+                if (temp_add == 1):
+                    self.Add(temp_driver)
+                else:
+                    self.Remove(temp_driver)
+                    if (temp_driver in self.polled):
+                        self.polled.pop(temp_driver).join(1.0)
+                    temp_done.set()
+            if (len(self.selected) == 0 and len(self.polled) == 0):
+                self.thread = None
+                return 0
+        return 1
+
+    def Add(self, driver):
+        """Waits on the port of a driver, or polls it from its own thread if it can not be selected on"""
+        if (driver in self.selected or driver in self.polled):
+            return
+        try:
+            driver.ser.timeout = 0 #non blocking reads
+            self.selector.register(driver.ser.fileno(), selectors.EVENT_READ, driver)
+            self.selected.append(driver)
+        except (AttributeError, ValueError, OSError, io.UnsupportedOperation):
+            temp_thread = threading.Thread(target=self.PollLoop, args=(driver,), daemon=True)
+            self.polled[driver] = temp_thread
+            temp_thread.start()
+
+    def Remove(self, driver):
+        """Stops waiting on the port of a driver"""
+        if (driver in self.selected):
+            self.selected.remove(driver)
+            try:
+                self.selector.unregister(driver.ser.fileno())
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def PollLoop(self, driver):
+        """Fallback for ports that can not be selected on, blocks in a read with a short timeout"""
+        driver.ser.timeout = self.poll_timeout
+        while (driver in self.polled):
+            if (self.Call(driver.ReadSerial) == 0):
+                break
+            self.Call(driver.Pump)
+
+    def DrainWake(self):
+        """Empties the self pipe"""
+        try:
+            while (self.wake_read.recv(4096)):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+
+_reactor = None
+_reactor_lock = threading.Lock()
+
+
+def GetReactor():
+    """Returns the reactor shared by all serial connections"""
+    global _reactor
+    with _reactor_lock:
+        if (_reactor is None):
+            _reactor = SerialReactor()
+        return _reactor
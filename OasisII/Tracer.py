@@ -0,0 +1,212 @@
+#This file is part of Oasis controller.
+
+#Oasis controller is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#Oasis controller is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with Oasis controller.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+
+#Timeline of a print job in the Chrome trace format (chrome://tracing or ui.perfetto.dev).
+#Spans (page render, threshold, planning, HP45 fill, moves, new layer) and instant events (every
+#serial read and write) are kept in memory while the tracer is on, and written with Save.
+#Events of a thread go on the track of that thread. Events of something that is not a thread, like
+#the serial lines or the gantry, go on a named track. Off by default, every call then returns at the
+#first check. Timestamps are perf_counter, one clock for all processes, so spans recorded in the
+#worker processes of the page pipeline (TracedCall) line up with the printer in the main process
+
+import collections
+import json
+import os
+import threading
+import time
+
+TRACK_BASE = 1000000 #thread ids of named tracks start here, far above real thread ids of the trace
+
+
+class NullSpan:
+    """The span given while the tracer is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    """Records a complete event from enter to exit"""
+
+    def __init__(self, tracer, name: str, category: str, args: dict = None, track: str = None):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.track = track
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        self.tracer.Complete(self.name, self.category, self.start, time.perf_counter(), self.track, self.args)
+        return False
+
+
+#the result of a call traced in a worker process, with the events recorded there
+TracedResult = collections.namedtuple('TracedResult', ('value', 'events'))
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.path = None #file Save writes to
+        self.max_events = 2000000 #events after this are counted, not kept
+        self.data_limit = 120 #characters of serial data kept per event
+        self.events = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.threads = {} #thread ids named in the metadata
+        self.tracks = {} #track name: thread id
+
+    def Enable(self, path: str = None) -> None:
+        """Starts recording, path is the file Save writes to"""
+        self.path = path
+        self.enabled = True
+
+    def Disable(self) -> None:
+        self.enabled = False
+
+    def Clear(self) -> None:
+        with self.lock:
+            self.events = []
+            self.dropped = 0
+            self.threads = {}
+            self.tracks = {}
+
+    def Thread(self, track: str = None) -> int:
+        """Returns the thread id of a named track, or of the calling thread, naming it the first time"""
+        if track is None:
+            temp_id = threading.get_ident()
+            if temp_id not in self.threads:
+                with self.lock:
+                    self.threads[temp_id] = threading.current_thread().name
+            return temp_id
+        if track not in self.tracks:
+            with self.lock:
+                self.tracks.setdefault(track, TRACK_BASE + len(self.tracks))
+        return self.tracks[track]
+
+    def Add(self, event: dict) -> None:
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        self.events.append(event) #one append, safe without the lock
+
+    def Span(self, name: str, category: str, args: dict = None, track: str = None):
+        """Returns a context manager recording its block as a span"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args, track)
+
+    def Complete(self, name: str, category: str, start: float, end: float, track: str = None, args: dict = None) -> None:
+        """Records a span from start to end, in perf_counter seconds"""
+        if not self.enabled:
+            return
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': start * 1e6, 'dur': max(end - start, 0.0) * 1e6,
+                 'pid': os.getpid(), 'tid': self.Thread(track)}
+        if args:
+            event['args'] = args
+        self.Add(event)
+
+    def Instant(self, name: str, category: str, track: str = None, args: dict = None) -> None:
+        """Records an event without duration, now"""
+        if not self.enabled:
+            return
+        event = {'name': name, 'cat': category, 'ph': 'i', 's': 't', 'ts': time.perf_counter() * 1e6,
+                 'pid': os.getpid(), 'tid': self.Thread(track)}
+        if args:
+            event['args'] = args
+        self.Add(event)
+
+    def Serial(self, track: str, name: str, data: str) -> None:
+        """Records a serial read (rx) or write (tx), with the start of the data without the line end"""
+        if not self.enabled:
+            return
+        self.Instant(name, 'serial', track, {'bytes': len(data), 'data': data.rstrip()[:self.data_limit]})
+
+    def Metadata(self) -> list:
+        """Returns the names of the process and of the tracks as metadata events"""
+        temp_pid = os.getpid()
+        with self.lock:
+            names = list(self.threads.items()) + [(tid, name) for name, tid in self.tracks.items()]
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': temp_pid, 'args': {'name': 'OasisII %d' % temp_pid}}]
+        for tid, name in names:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': temp_pid, 'tid': tid, 'args': {'name': name}})
+        return events
+
+    def Take(self) -> list:
+        """Returns the metadata and the events recorded so far, and forgets the events"""
+        with self.lock:
+            events, self.events = self.events, []
+        return self.Metadata() + events
+
+    def Merge(self, events) -> None:
+        """Adds events recorded in another process"""
+        for event in events:
+            self.Add(event)
+
+    def Save(self, path: str = None) -> None:
+        """Writes all events as a Chrome trace json file"""
+        path = path or self.path
+        if path is None:
+            return
+        with self.lock:
+            events = list(self.events)
+        trace = {'traceEvents': self.Metadata() + events, 'displayTimeUnit': 'ms',
+                 'otherData': {'dropped_events': self.dropped}}
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as file_object:
+            json.dump(trace, file_object)
+        os.replace(temp_path, path)
+
+
+_tracer = Tracer()
+
+
+def GetTracer() -> Tracer:
+    """Returns the tracer shared by the whole program"""
+    return _tracer
+
+
+def TracedCall(function, *args):
+    """Runs function in a worker process with the tracer on, returns a TracedResult
+    with its return value and the events recorded during the call"""
+    tracer = GetTracer()
+    tracer.Enable()
+    try:
+        value = function(*args)
+    finally:
+        tracer.Disable() #the next call in this worker may not be traced
+    return TracedResult(value, tracer.Take())
+
+
+def Untraced(result):
+    """Returns the value of a worker result, merging the events of a traced call"""
+    if isinstance(result, TracedResult):
+        GetTracer().Merge(result.events)
+        return result.value
+    return result
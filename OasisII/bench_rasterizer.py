@@ -0,0 +1,82 @@
+"""Benchmark of the SVG layer rasterizer, per pixel toggles against the scanline fill,
+checked pixel for pixel on every layer.
+
+Run from this folder after building the extension (python setup.py build_ext -i), with
+Slic3r SVG files as arguments, or without to use a generated Slic3r style file.
+"""
+
+import math
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from ImageConverter import ImageConverter
+
+
+def make_slic3r_svg(path: str, layers: int = 40, seed: int = 45) -> None:
+    """Write a Slic3r style SVG: per layer a few contours, some with a hole"""
+    rng = np.random.RandomState(seed)
+    with open(path, 'w') as file_object:
+        file_object.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n')
+        file_object.write('<svg width="80" height="60" xmlns="http://www.w3.org/2000/svg" '
+                          'xmlns:svg="http://www.w3.org/2000/svg" xmlns:slic3r="http://slic3r.org/namespaces/slic3r">\n')
+        for layer in range(layers):
+            file_object.write('  <g id="layer%d" slic3r:z="%.9f">\n' % (layer, (layer + 1) * 2e-7))
+            for contour in range(rng.randint(1, 6)):
+                cx, cy, r = rng.uniform(10, 70), rng.uniform(10, 50), rng.uniform(2, 10)
+                for kind, scale in (('contour', 1.0), ('hole', 0.4))[:rng.randint(1, 3)]:
+                    count = rng.randint(4, 80)
+                    angles = np.linspace(0, 2 * math.pi, count, endpoint=False)
+                    wobble = 1 + 0.3 * np.sin(3 * angles + layer * 0.1)
+                    points = ' '.join('%.6f,%.6f' % (cx + scale * r * w * math.cos(a), cy + scale * r * math.sin(a))
+                                      for a, w in zip(angles, wobble))
+                    file_object.write('    <polygon slic3r:type="%s" points="%s" style="fill: white" />\n' % (kind, points))
+            file_object.write('  </g>\n')
+        file_object.write('</svg>\n')
+
+
+def bench(path: str, dpi: int = 300, packed_mode: int = 0) -> bool:
+    converter = ImageConverter()
+    converter.SetDPI(dpi)
+    converter.packed_mode = packed_mode
+    converter.SetLayerCacheBudget(0) #time the rendering, not the cache
+    converter.file_path = path
+    converter.file_type = 2
+    converter.SVGGetData()
+
+    pixel_time = scanline_time = 0.0
+    same = True
+    for layer in range(converter.svg_layers):
+        starttime = time.time()
+        converter.SVGLayerToArrayPixel(layer)
+        pixel_time += time.time() - starttime
+        reference = np.asarray(converter.GetArray()).copy()
+
+        starttime = time.time()
+        converter.SVGLayerToArray(layer)
+        scanline_time += time.time() - starttime
+        if not np.array_equal(reference, np.asarray(converter.GetArray())):
+            print("Layer %d differs in %d pixels" % (layer, int((reference != converter.GetArray()).sum())))
+            same = False
+
+    layers = max(converter.svg_layers, 1)
+    print("%s, %d layers at %d DPI, %s" % (os.path.basename(path), converter.svg_layers, dpi,
+                                           ('array', 'bit packed')[packed_mode]))
+    print("Per pixel: %.1f ms/layer" % (pixel_time * 1000 / layers))
+    print("Scanline:  %.1f ms/layer" % (scanline_time * 1000 / layers))
+    print("Speedup:   %.1fx, same output: %r" % (pixel_time / scanline_time, same))
+    return same
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for svg_path in sys.argv[1:]:
+            bench(svg_path, 300, 0)
+            bench(svg_path, 300, 1)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            svg_path = os.path.join(temp_dir, 'slic3r.svg')
+            make_slic3r_svg(svg_path)
+            bench(svg_path, 300, 0)
+            bench(svg_path, 300, 1)
@@ -0,0 +1,120 @@
+"""Benchmark of parsing serial responses, replaying recorded read traces.
+
+Compares the old framing (string concatenation and one partition per line)
+with the LineFramer, then replays the trace through the ReadSerial of the driver.
+Traces are recorded by setting read_trace of a driver to an open file.
+
+Run from this folder: python bench_serial.py [trace files]
+"""
+
+import contextlib
+import glob
+import io
+import logging
+import os
+import sys
+import time
+from LineFramer import LineFramer, TraceLoad
+from SerialGRBL import GRBL
+from SerialHP45 import HP45
+
+TRACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traces')
+
+
+class ReplayPort:
+    """Stands in for the serial port, every read returns the next recorded read"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.index = 0
+
+    @property
+    def in_waiting(self) -> int:
+        if self.index < len(self.chunks):
+            return len(self.chunks[self.index])
+        return 0
+
+    def read(self, size: int) -> bytes:
+        if self.index >= len(self.chunks):
+            return b''
+        self.index += 1
+        return self.chunks[self.index - 1]
+
+    def write(self, data) -> None:
+        pass
+
+
+def legacy_lines(chunks) -> int:
+    """Frames like the old Update loops did, one partition per line"""
+    read_buffer = ""
+    count = 0
+    for chunk in chunks:
+        read_buffer += str(chunk.decode('utf-8'))
+        decode = read_buffer.partition('\n')
+        while decode[1] == '\n':
+            read_buffer = decode[2]
+            read_line = str(decode[0]).rstrip()
+            count += 1
+            decode = read_buffer.partition('\n')
+    return count
+
+
+def framer_lines(chunks) -> int:
+    """Frames with the LineFramer, decoding every line"""
+    framer = LineFramer()
+    count = 0
+    for chunk in chunks:
+        for line in framer.Feed(chunk):
+            read_line = line.decode('utf-8', 'replace').rstrip()
+            count += 1
+    return count
+
+
+def driver_replay(driver, chunks) -> None:
+    """Feeds the reads through ReadSerial, framing and parsing"""
+    driver.ser = ReplayPort(chunks)
+    with contextlib.redirect_stdout(io.StringIO()): #the drivers print some responses
+        for chunk in chunks:
+            driver.ReadSerial()
+
+
+def rechunk(chunks, size: int) -> list:
+    """Cuts the trace in reads of a fixed size, like a burst after the reader stalled"""
+    data = b''.join(chunks)
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def timed(function, *args) -> float:
+    starttime = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - starttime
+
+
+def bench(path: str, repeat: int = 20, burst: int = 0) -> None:
+    chunks = TraceLoad(path) * repeat
+    if burst > 0:
+        chunks = rechunk(chunks, burst)
+    megabytes = sum(len(chunk) for chunk in chunks) / 1e6
+    lines = framer_lines(chunks)
+    assert lines == legacy_lines(chunks), "framers disagree"
+
+    legacy_time = timed(legacy_lines, chunks)
+    framer_time = timed(framer_lines, chunks)
+    if os.path.basename(path).startswith('grbl'):
+        driver = GRBL()
+    else:
+        driver = HP45()
+    driver_time = timed(driver_replay, driver, chunks)
+
+    print("%s%s: %d reads, %d lines, %.2f MB" % (os.path.basename(path), " in %d byte reads" % burst if burst else "", len(chunks), lines, megabytes))
+    print("Old framing:  %.2f Mlines/s" % (lines / legacy_time / 1e6))
+    print("LineFramer:   %.2f Mlines/s (%.1fx)" % (lines / framer_time / 1e6, legacy_time / framer_time))
+    print("ReadSerial:   %.2f Mlines/s, framing and parsing" % (lines / driver_time / 1e6))
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO) #the HP45 debug log would measure the disk, not the parsing
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(TRACE_PATH, '*.trace')))
+    for path in paths:
+        bench(path)
+        bench(path, burst=65536)
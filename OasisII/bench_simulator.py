@@ -0,0 +1,55 @@
+"""Predicted job time, idle gaps and HP45 underruns of a page for a range of print settings.
+
+Runs the print simulator on a document of bench_planner.py, changing one setting at a time from
+the defaults: the print speed, the travel speed, the sweep size and the HP45 buffer margin, then
+the baudrate of the HP45 connection. Run from this folder, needs no printer, extension or display:
+python bench_simulator.py [letter|form|labels|delivery note]
+"""
+
+import sys
+import time
+import numpy as np
+from bench_planner import DOCUMENTS, PageImage
+from PrintPlanner import PrintPlanner
+from PrintSimulator import PrintSimulator
+
+
+SETTINGS = [
+    ('print_speed', 'planner', [3000.0, 6000.0, 9000.0, 12000.0]),
+    ('travel_speed', 'planner', [10000.0, 20000.0, 30000.0]),
+    ('sweep_size', 'planner', [50, 100, 0]),
+    ('inkjet_buffer_margin', 'inkjet', [10, 50, 200]),
+    ('inkjet_baudrate', 'simulator', [115200, 250000, 1000000]),
+]
+
+
+def simulate(simulator, image):
+    """Plans the page with the current settings and simulates printing it"""
+    plan = simulator.planner.Compile(image, 70.0, 275.0)
+    return simulator.Run(plan)
+
+
+def report(name='letter'):
+    make = dict(DOCUMENTS)[name]
+    page = make(np.random.RandomState(45))
+    planner = PrintPlanner()
+    planner.pack_bands = 1
+    simulator = PrintSimulator(planner)
+    print("%-22s %9s %7s %7s %9s %9s" % ('setting', 'value', 'sweeps', 'job s', 'idle s', 'underruns'))
+    for setting, owner, values in SETTINGS:
+        target = {'planner': planner, 'inkjet': simulator.inkjet_driver, 'simulator': simulator}[owner]
+        default = getattr(target, setting)
+        for value in values:
+            setattr(target, setting, value)
+            result = simulate(simulator, PageImage(page))
+            print("%-22s %9s %7d %7.1f %9.1f %9d" % (setting, value, len(result.sweeps), result.job_time,
+                                                    result.IdleTime(), result.Underruns()))
+        setattr(target, setting, default)
+
+    starttime = time.time()
+    result = simulate(simulator, PageImage(page))
+    print("Simulated %.1fs of printing in %.2fs" % (result.job_time, time.time() - starttime))
+
+
+if __name__ == '__main__':
+    report(sys.argv[1] if len(sys.argv) > 1 else 'letter')
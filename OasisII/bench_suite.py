@@ -0,0 +1,379 @@
+"""Benchmark suite of the whole pipeline, stage by stage on fixed fixtures, checked against a baseline.
+
+Stages: rasterizing a pdf, opening, thresholding and rendering a page in the ImageConverter,
+rasterizing SVG layers, planning sweeps, B64 encoding bursts, parsing the recorded serial traces
+and streaming to an emulated GRBL and HP45 through the drivers. The fixtures are made from fixed
+seeds in a temporary folder: a 300 DPI letter page as png and pdf and a Slic3r style SVG.
+
+Every stage runs repeat times, the best time counts. A stage more than the tolerance slower than in
+the baseline is a regression, the tolerance is --tolerance or set per stage in the baseline file.
+Stages whose dependencies are missing (the extension, pdftoppm) are skipped.
+The results are written as json, the same format as the baseline, and the exit code is 1
+on a regression or a failed stage. Run from this folder:
+python bench_suite.py [--stages plan,b64] [--repeat 5] [--tolerance 0.25] [--output file]
+                      [--baseline file] [--update-baseline]
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import traceback
+import numpy as np
+import B64
+from bench_planner import DOCUMENTS, PageImage, letter
+from PrintPlanner import PrintPlanner
+
+FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(FILE_PATH, 'bench_baseline.json')
+RESULTS_PATH = os.path.join(FILE_PATH, 'bench_results.json')
+DEFAULT_TOLERANCE = 0.25 #25% slower than the baseline is a regression
+
+DPI = 300
+THRESHOLD = 160
+PDF_PAGES = 2
+SVG_LAYERS = 20
+STREAM_LINES = 1000
+
+
+class Skipped(Exception):
+    """A stage can not run here, a dependency is missing"""
+
+
+def wait_until(condition, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise RuntimeError("timed out waiting for the device")
+        time.sleep(0.001)
+
+
+def qt_application():
+    """Returns the Qt application pixmaps need, made without a display"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+def write_pdf(path: str, pages, dpi: int = DPI, cell: int = 10) -> None:
+    """Write a pdf with a page per array, every row of cell x cell pixels is drawn as black
+    rectangles over the runs of cells with ink, so the pdf is vector like a real document"""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None]
+    kids = []
+    scale = 72.0 * cell / dpi #points per cell
+    for page in pages:
+        height, width = page.shape[0] // cell, page.shape[1] // cell
+        cells = page[:height * cell, :width * cell].reshape(height, cell, width, cell).any(axis=(1, 3))
+        edges = np.diff(np.pad(cells.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+        rectangles = []
+        for row in range(height):
+            starts = np.flatnonzero(edges[row] == 1)
+            ends = np.flatnonzero(edges[row] == -1)
+            y = (height - row - 1) * scale
+            rectangles += ['%.2f %.2f %.2f %.2f re' % (start * scale, y, (end - start) * scale, scale)
+                           for start, end in zip(starts, ends)]
+        stream = '0 g\n' + '\n'.join(rectangles) + '\nf\n'
+        objects.append('<< /Length %d >>\nstream\n%sendstream' % (len(stream), stream))
+        objects.append('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R >>'
+                       % (width * scale, height * scale, len(objects)))
+        kids.append('%d 0 R' % len(objects))
+    objects[1] = '<< /Type /Pages /Kids [%s] /Count %d >>' % (' '.join(kids), len(kids))
+
+    data = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += ('%d 0 obj\n%s\nendobj\n' % (number, body)).encode('ascii')
+    xref = len(data)
+    data += ('xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)).encode('ascii')
+    data += ''.join('%010d 00000 n \n' % offset for offset in offsets).encode('ascii')
+    data += ('trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)).encode('ascii')
+    with open(path, 'wb') as file_object:
+        file_object.write(data)
+
+
+def make_fixtures(path: str) -> dict:
+    """Writes the fixtures to path, returns their paths by name"""
+    rng = np.random.RandomState(45)
+    pages = [letter(rng) for page in range(PDF_PAGES)]
+    fixtures = {'pdf': os.path.join(path, 'letter.pdf'), 'png': os.path.join(path, 'letter.png'),
+                'svg': os.path.join(path, 'slic3r.svg')}
+    write_pdf(fixtures['pdf'], pages)
+
+    from PyQt5.QtGui import QImage
+    gray = np.ascontiguousarray(255 - 255 * pages[0], dtype=np.uint8) #ink is black
+    image = QImage(gray.data, gray.shape[1], gray.shape[0], gray.shape[1], QImage.Format_Grayscale8)
+    image.save(fixtures['png'])
+
+    try:
+        from bench_rasterizer import make_slic3r_svg #loads the extension
+        make_slic3r_svg(fixtures['svg'], SVG_LAYERS)
+    except ImportError:
+        del fixtures['svg']
+    return fixtures
+
+
+def image_converter():
+    try:
+        from ImageConverter import ImageConverter
+    except ImportError:
+        raise Skipped("ImageConverter extension is not built (python setup.py build_ext -i)")
+    converter = ImageConverter()
+    converter.SetDPI(DPI)
+    return converter
+
+
+def opened_page(fixtures):
+    converter = image_converter()
+    converter.OpenFile(fixtures['png'], 0)
+    return converter, converter.image_array_width * converter.image_array_height / 1e6
+
+
+@contextlib.contextmanager
+def stage_pdf_rasterize(fixtures):
+    from PDFConverter import can_render_in_memory, render_pages
+    if not can_render_in_memory():
+        raise Skipped("pdftoppm not found")
+    yield lambda: render_pages(fixtures['pdf'], 1, PDF_PAGES, DPI), PDF_PAGES, 'pages'
+
+
+@contextlib.contextmanager
+def stage_open_file(fixtures):
+    converter, megapixels = opened_page(fixtures)
+    yield lambda: converter.OpenFile(fixtures['png'], 0), megapixels, 'MP'
+
+
+@contextlib.contextmanager
+def stage_threshold(fixtures):
+    converter, megapixels = opened_page(fixtures)
+    yield lambda: converter.Threshold(THRESHOLD), megapixels, 'MP'
+
+
+@contextlib.contextmanager
+def stage_array_to_image(fixtures):
+    application = qt_application()
+    converter, megapixels = opened_page(fixtures)
+    converter.Threshold(THRESHOLD)
+    yield lambda: converter.ArrayToImage(0), megapixels, 'MP'
+
+
+@contextlib.contextmanager
+def stage_svg_rasterize(fixtures):
+    converter = image_converter()
+    converter.SetLayerCacheBudget(0) #time the rendering, not the cache
+    converter.file_path = fixtures['svg']
+    converter.file_type = 2
+    converter.SVGGetData()
+
+    def run():
+        for layer in range(converter.svg_layers):
+            converter.SVGLayerToArray(layer)
+    yield run, converter.svg_layers, 'layers'
+
+
+@contextlib.contextmanager
+def stage_plan(fixtures):
+    rng = np.random.RandomState(45)
+    pages = [make(rng) for name, make in DOCUMENTS]
+    planner = PrintPlanner()
+    planner.pack_bands = 1
+
+    def run():
+        for page in pages:
+            planner.Compile(PageImage(page, DPI), 70.0, 275.0) #a new image, the occupancy index counts
+    yield run, len(pages), 'pages'
+
+
+@contextlib.contextmanager
+def stage_b64(fixtures):
+    #every column of every sweep band of a letter is a burst, encoded with its position
+    page = letter(np.random.RandomState(45))
+    sweep_size = int(DPI / 2)
+    bands = [page[start:start + sweep_size].T for start in range(0, page.shape[0] - sweep_size + 1, sweep_size)]
+    positions = np.arange(page.shape[1]) * 25.4 / DPI * 1000
+
+    def run():
+        for band in bands:
+            B64.B64ToArrayBatch(band)
+            B64.B64ToSingleBatch(positions)
+    yield run, len(bands) * page.shape[1], 'bursts'
+
+
+@contextlib.contextmanager
+def stage_serial_parse(fixtures):
+    from bench_serial import TRACE_PATH, driver_replay, framer_lines
+    from LineFramer import TraceLoad
+    from SerialGRBL import GRBL
+    from SerialHP45 import HP45
+    traces = [(GRBL, TraceLoad(os.path.join(TRACE_PATH, 'grbl_stream.trace'))),
+              (HP45, TraceLoad(os.path.join(TRACE_PATH, 'hp45_sweep.trace')))]
+
+    def run():
+        for driver, chunks in traces:
+            driver_replay(driver(), chunks)
+    yield run, sum(framer_lines(chunks) for driver, chunks in traces), 'lines'
+
+
+@contextlib.contextmanager
+def stage_grbl_stream(fixtures):
+    from DeviceEmulator import GrblEmulator
+    from SerialGRBL import GRBL
+    device = GrblEmulator()
+    grbl = GRBL()
+    try:
+        if grbl.Connect(device.Start()) != 1:
+            raise RuntimeError("could not connect to the emulated GRBL")
+        wait_until(lambda: grbl.started_state == 1)
+        grbl.SetStreamingMode(1)
+
+        def run():
+            for line in range(STREAM_LINES):
+                grbl.SerialWriteBufferRaw('G4 P0')
+            wait_until(lambda: grbl.BufferLeft() == 0 and len(grbl.sent_lines) == 0)
+        yield run, STREAM_LINES, 'lines'
+    finally:
+        grbl.Disconnect()
+        device.Stop()
+
+
+@contextlib.contextmanager
+def stage_hp45_stream(fixtures):
+    from DeviceEmulator import HP45Emulator
+    from SerialHP45 import HP45
+    #the lines of the first sweeps of a letter, the head of the emulator is never in the way
+    plan = PrintPlanner().Compile(PageImage(letter(np.random.RandomState(45)), DPI), 70.0, 275.0)
+    lines = [line for sweep in plan.sweeps for line in sweep.lines][:STREAM_LINES]
+    device = HP45Emulator(encoder_speed=1e6)
+    inkjet = HP45()
+    try:
+        if inkjet.Connect(device.Start()) != 1:
+            raise RuntimeError("could not connect to the emulated HP45")
+
+        def run():
+            printed = device.Stats()['lines_printed'] + len(lines)
+            inkjet.SerialWriteBufferBulk(lines)
+            wait_until(lambda: device.Stats()['lines_printed'] >= printed)
+        yield run, len(lines), 'lines'
+    finally:
+        inkjet.Disconnect()
+        device.Stop()
+
+
+STAGES = [
+    ('pdf_rasterize', stage_pdf_rasterize),
+    ('open_file', stage_open_file),
+    ('threshold', stage_threshold),
+    ('array_to_image', stage_array_to_image),
+    ('svg_rasterize', stage_svg_rasterize),
+    ('plan', stage_plan),
+    ('b64', stage_b64),
+    ('serial_parse', stage_serial_parse),
+    ('grbl_stream', stage_grbl_stream),
+    ('hp45_stream', stage_hp45_stream),
+]
+
+
+def run_stage(stage, fixtures, repeat: int) -> dict:
+    """Runs a stage repeat times after a warm up run, returns its timings"""
+    with stage(fixtures) as (run, units, unit):
+        run()
+        runs = []
+        for index in range(repeat):
+            starttime = time.perf_counter()
+            run()
+            runs.append(time.perf_counter() - starttime)
+    best = min(runs)
+    return {'best': best, 'median': float(np.median(runs)), 'runs': runs,
+            'units': units, 'unit': unit, 'rate': units / best if best > 0 else 0.0}
+
+
+def run_suite(names=None, repeat: int = 5) -> dict:
+    """Runs the stages in names, or all, returns the results"""
+    results = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+               'machine': platform.platform(), 'repeat': repeat, 'stages': {}, 'skipped': {}, 'failed': {}}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fixtures = make_fixtures(temp_dir)
+        for name, stage in STAGES:
+            if names is not None and name not in names:
+                continue
+            try:
+                results['stages'][name] = run_stage(stage, fixtures, repeat)
+            except (Skipped, ImportError) as e:
+                results['skipped'][name] = str(e)
+            except Exception:
+                results['failed'][name] = traceback.format_exc(limit=3)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = None) -> list:
+    """Returns the stages slower than in the baseline by more than their tolerance,
+    stages missing from either are not compared"""
+    if tolerance is None:
+        tolerance = baseline.get('tolerance', DEFAULT_TOLERANCE)
+    regressions = []
+    for name, result in results['stages'].items():
+        if name not in baseline.get('stages', {}):
+            continue
+        limit = baseline.get('tolerances', {}).get(name, tolerance)
+        reference = baseline['stages'][name]['best']
+        if result['best'] > reference * (1.0 + limit):
+            regressions.append({'stage': name, 'best': result['best'], 'baseline': reference,
+                                'ratio': result['best'] / reference, 'tolerance': limit})
+    return regressions
+
+
+def report(results: dict, baseline: dict) -> None:
+    print("%-15s %10s %10s %8s %16s" % ('stage', 'best ms', 'base ms', 'change', 'rate'))
+    for name, result in results['stages'].items():
+        reference = baseline.get('stages', {}).get(name)
+        print("%-15s %10.2f %10s %8s %10.1f %s/s" % (name, result['best'] * 1000,
+              '%.2f' % (reference['best'] * 1000) if reference else '-',
+              '%+.0f%%' % (100.0 * (result['best'] / reference['best'] - 1)) if reference else '-',
+              result['rate'], result['unit']))
+    for name, reason in results['skipped'].items():
+        print("%-15s skipped: %s" % (name, reason))
+    for name, error in results['failed'].items():
+        print("%-15s failed:\n%s" % (name, error))
+    for regression in results['regressions']:
+        print("Regression: %s is %.2fx the baseline, the tolerance is %.0f%%" % (regression['stage'],
+              regression['ratio'], regression['tolerance'] * 100))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages against a stored baseline")
+    parser.add_argument('--stages', help="comma separated stages, all by default: " + ','.join(name for name, stage in STAGES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, help="allowed slowdown, 0.25 is 25%%, overrides the baseline")
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO) #the HP45 debug log would measure the disk
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file_object:
+            baseline = json.load(file_object)
+    results = run_suite(args.stages.split(',') if args.stages else None, args.repeat)
+    results['regressions'] = compare(results, baseline, args.tolerance)
+    report(results, baseline)
+
+    with open(args.output, 'w') as file_object:
+        json.dump(results, file_object, indent=1)
+    if args.update_baseline:
+        results['regressions'] = []
+        results['tolerance'] = baseline.get('tolerance', DEFAULT_TOLERANCE)
+        results['tolerances'] = baseline.get('tolerances', {})
+        with open(args.baseline, 'w') as file_object:
+            json.dump(results, file_object, indent=1)
+        return 0 if not results['failed'] else 1
+    return 1 if results['regressions'] or results['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
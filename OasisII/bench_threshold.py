@@ -0,0 +1,58 @@
+"""Benchmark of the ImageConverter threshold, per pixel against vector version.
+
+Run from this folder after building the extension (python setup.py build_ext -i).
+"""
+
+import sys
+import time
+import numpy as np
+from PyQt5.QtGui import QImage
+from ImageConverter import ImageConverter, QImageToArray
+
+
+def make_page(width: int, height: int) -> QImage:
+    """Make a reproducible ARGB32 test page with noise and transparency"""
+    image = QImage(width, height, QImage.Format_ARGB32)
+    rng = np.random.RandomState(45)
+    bits = image.bits()
+    bits.setsize(image.bytesPerLine() * height)
+    pixels = np.frombuffer(bits, dtype=np.uint32).reshape(height, -1)[:, :width]
+    pixels[:] = rng.randint(0, 2 ** 32, size=(height, width), dtype=np.uint64).astype(np.uint32)
+    return image
+
+
+def make_converter(image: QImage) -> ImageConverter:
+    """Load an image in an ImageConverter without needing a display"""
+    converter = ImageConverter()
+    converter.file_type = 1
+    converter.conversion_image = image
+    converter.image_array_width = image.width()
+    converter.image_array_height = image.height()
+    converter.image_array = np.zeros((image.height(), image.width()))
+    return converter
+
+
+def bench(width: int, height: int, threshold: int = 160) -> None:
+    image = make_page(width, height)
+    megapixels = width * height / 1e6
+
+    pixel = make_converter(image)
+    starttime = time.time()
+    pixel.ThresholdPixel(threshold)
+    pixel_time = time.time() - starttime
+
+    vector = make_converter(image)
+    starttime = time.time()
+    vector.Threshold(threshold)
+    vector_time = time.time() - starttime
+
+    same = np.array_equal(np.asarray(pixel.image_array), np.asarray(vector.image_array))
+    print("%dx%d (%.2f MP)" % (width, height, megapixels))
+    print("Per pixel: %.1f ms/MP" % (pixel_time * 1000 / megapixels))
+    print("Vector:    %.1f ms/MP" % (vector_time * 1000 / megapixels))
+    print("Speedup:   %.1fx, same output: %r" % (pixel_time / vector_time, same))
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    bench(size, size)
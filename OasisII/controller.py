@@ -28,16 +28,23 @@ from Interface import Interface
 import os
 from ImageConverter import ImageConverter
 from PDFConverter import PDFConverter
+from PrintPlanner import PrintPlanner
+from LayerPrecompute import LayerPrecompute
+from PagePipeline import PagePipeline
+from Metrics import GetMetrics
+from Tracer import GetTracer
 import B64
 from numpy import *
 import threading
 import time
-import glob
+import math
 
 #a small note on threading. It is used so some of the functions update automatically (serial GRBL and inkjet)
 #however, it is a bit of a lie. If python is busy in one thread, it will quietly ignore the others
 #sleep commands will give enough room that python works on other threads.
 #this is the reason why sending inkjet while moving is difficult. Will fix later, with another attempt
+#(the serial connections now share one reactor thread that sleeps until there is data, and the print
+#thread blocks on the GRBL response condition instead of spinning, so they no longer starve each other)
 
 class MainWindow(QtWidgets.QMainWindow):
     def __init__(self):
@@ -47,11 +54,34 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.show()
 
         self.grbl = GRBL()
+        #0 for send-response, 1 for character counting, keeps the GRBL RX buffer full (opt in with OASIS_GRBL_STREAMING=1)
+        self.grbl.SetStreamingMode(int(os.environ.get('OASIS_GRBL_STREAMING') or 0))
         self.inkjet = HP45()
         self.imageconverter = ImageConverter()
         self.pdfconverter = PDFConverter()
-        # list of png pages pdf
-        self.pdflistpng = list()
+        self.planner = PrintPlanner()
+        self.planner.bidirectional = 0 #1 prints every other sweep on the way back, calibrate planner.reverse_offset first
+        self.planner.pack_bands = 1 #start every sweep at the next inked row
+        self.layer_precompute = LayerPrecompute() #renders and plans svg layers ahead in worker processes
+        self.layer_precompute.start_position = self.LayerStartPosition
+        self.layer_precompute.on_progress = self.LayerPrecomputeProgress
+        self.svg_layer = 0 #layer of the svg that is shown and printed
+        self.page_pipeline = PagePipeline(3) #converts pdf pages in worker processes, 3 pages ahead of the printer
+
+        #print metrics, only recorded while enabled (see Metrics.py)
+        self.metrics = GetMetrics()
+        self.metric_plan_seconds = self.metrics.Histogram('plan_seconds', 'Seconds to plan an image, cached plans not counted')
+        self.metric_job_seconds = self.metrics.Histogram('print_job_seconds', 'Seconds to print a plan, from homing to the last sweep')
+        self.metric_sweep_seconds = self.metrics.Histogram('print_sweep_seconds', 'Seconds per sweep')
+        self.metric_fill_seconds = self.metrics.Histogram('print_hp45_fill_seconds', 'Seconds waiting for the HP45 to take the lines of a sweep')
+        self.metric_motion_seconds = self.metrics.Histogram('print_motion_wait_seconds', 'Seconds waiting for the gantry to be idle')
+        self.metric_sweeps = self.metrics.Counter('print_sweeps_total', 'Sweeps printed')
+        self.metric_sweep_lines = self.metrics.Counter('print_sweep_lines_total', 'HP45 lines of the sweeps printed')
+
+        #timeline of the print job, only recorded while on (see Tracer.py)
+        self.tracer = GetTracer()
+        self.trace_gantry_free = 0.0 #perf_counter when the moves traced so far end
+        self.trace_gantry_pos = (0.0, 0.0) #x and y where the moves traced so far end
 
         self.printing_state = 0 #whether the printer is printing
         self.printing_abort_flag = 0
@@ -111,13 +141,18 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.pause_button.clicked.connect(self.PausePrint)
         self.ui.abort_button.clicked.connect(self.AbortPrint)
         #self.ui.file_print_button.clicked.connect(self.RenderRGB)
-        # self.ui.layer_slider.valueChanged.connect(self.UpdateLayer)
+        self.ui.layer_slider.valueChanged.connect(self.UpdateLayer)
 
         #self.ui.save_png.clicked.connect(self.SavePng)
-        self.ready_for_print = list()
-        self.flag_finish_pages = False
+
+        self.preview_size = 300 #size of the input and output windows, output is only rendered this big
 
         self.print_right_side = 1
+        #0 to wait for idle and set the printhead position before every sweep
+        #1 to queue each sweep while the one before still prints, the printhead position is only set once.
+        #The HP45 then holds the lines of the next sweep during the travel back, this assumes the firmware
+        #only fires lines in the direction they were queued for. Not validated on hardware, opt in with OASIS_PRINT_PIPELINED=1
+        self.print_pipelined = int(os.environ.get('OASIS_PRINT_PIPELINED') or 0)
 
         self.right_y_start = 275.0
         self.right_x_start = 70.0
@@ -168,10 +203,11 @@ class MainWindow(QtWidgets.QMainWindow):
 
             #update state and coordinates
             self.ui.motion_state.setText(self.grbl.motion_state)
-            self.ui.motion_x_pos.setText(str(self.grbl.motion_x_pos))
-            self.ui.motion_y_pos.setText(str(self.grbl.motion_y_pos))
-            self.ui.motion_b_pos.setText(str(self.grbl.motion_z_pos))
-            self.ui.motion_f_pos.setText(str(self.grbl.motion_a_pos))
+            temp_pos = self.grbl.status.wpos #one snapshot, all axes from the same report
+            self.ui.motion_x_pos.setText(str(temp_pos[0]))
+            self.ui.motion_y_pos.setText(str(temp_pos[1]))
+            self.ui.motion_b_pos.setText(str(temp_pos[2]))
+            self.ui.motion_f_pos.setText(str(temp_pos[3]))
 
             time.sleep(0.2)
 
@@ -314,6 +350,8 @@ class MainWindow(QtWidgets.QMainWindow):
             if (temp_success == 1):
                 #print("adding new layer: " + str(temp_layer_thickness_val))
                 self.grbl.NewLayer(temp_layer_thickness_val)
+                if (self.file_loaded == 4 and self.svg_layer + 1 < self.imageconverter.svg_layers):
+                    self.ui.layer_slider.setValue(self.svg_layer + 1) #next layer, precomputed while this one printed
 
     def GRBLPrimeLayer(self):
         """add a new layer"""
@@ -342,32 +380,10 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             return 0
 
-    def open_png_pages_pdf(self) -> int:
-        """Open de png files pages using ImageConverter
-
-        Returns
-        -------
-        1 if successfull
-        0 if failed
-        """
-        list_for_files = glob.glob(os.path.join(
-            self.pdfconverter.working_dir, '*.jpg'))
-        list_for_files.sort()
-
-        if len(list_for_files) != self.pdfconverter.number_of_pages:
-            return 0
-
-        for pages in list_for_files:
-            buff = ImageConverter()
-            buff.OpenFile(pages)
-            self.pdflistpng.append(buff)
-            del buff
-        return 1
-
-
     def OpenFile(self, temp_input_file = ""):
         """Opens a file dialog, takes the filepath, and passes it to the image converter"""
         temp_response = 0
+        self.layer_precompute.Cancel()
         if (temp_input_file):
             temp_response = self.imageconverter.OpenFile(temp_input_file)
         else:
@@ -383,12 +399,39 @@ class MainWindow(QtWidgets.QMainWindow):
             self.file_loaded = 1
         elif(temp_response == 3):
             self.file_loaded = 3
-            # TODO: poner esto en un cartel
-            print('A PDF file is processing please wait ...')
-            self.pdfconverter.convert_pdf_to_png()
-            if not self.open_png_pages_pdf():
-                print('Error on the open of PDF file')
-            print("Processing finished. Ready to print :-)")
+            #pages are converted while printing, by the page pipeline
+            print("PDF file with " + str(self.pdfconverter.number_of_pages) + " pages. Ready to print :-)")
+        elif(temp_response == 2):
+            self.file_loaded = 4
+            self.svg_layer = 0
+            self.ui.layer_slider.blockSignals(True)
+            self.ui.layer_slider.setMaximum(max(self.imageconverter.svg_layers - 1, 0))
+            self.ui.layer_slider.setValue(0)
+            self.ui.layer_slider.blockSignals(False)
+            self.ui.layer_slider_value.setText("Layer: 0")
+            self.RenderOutput()
+            self.layer_precompute.Start(self.imageconverter, self.planner, self.svg_layer)
+
+    def UpdateLayer(self, temp_layer):
+        """Shows the given layer of the svg, from the layer cache if it was precomputed"""
+        if (self.file_loaded == 4 and self.printing_state == 0):
+            self.svg_layer = int(temp_layer)
+            self.imageconverter.SVGLayerToArray(self.svg_layer)
+            self.ui.layer_slider_value.setText("Layer: " + str(self.svg_layer))
+            self.RenderOutput()
+            self.layer_precompute.SetCurrentLayer(self.svg_layer)
+
+    def LayerStartPosition(self, temp_layer):
+        """Returns the start position a layer will print at, the side changes after every print"""
+        temp_side = self.print_right_side
+        if ((temp_layer - self.svg_layer) % 2 == 1):
+            temp_side *= -1
+        return self.GetStartPosition(temp_side)
+
+    def LayerPrecomputeProgress(self, temp_ready, temp_total):
+        """Reports the precompute progress, called from a background thread"""
+        if (temp_ready == temp_total or temp_ready % 10 == 0):
+            print("Layers ready: " + str(temp_ready) + "/" + str(temp_total))
 
 
     def PausePrint(self):
@@ -421,14 +464,14 @@ class MainWindow(QtWidgets.QMainWindow):
         if (self.file_loaded == 1 or self.file_loaded == 3):
             temp_threshold = self.ui.threshold_slider.value()
             self.imageconverter.Threshold(temp_threshold)
-            self.imageconverter.ArrayToImage()
+            self.imageconverter.ArrayToImage(self.preview_size)
             self.output_image_display = self.imageconverter.output_image
             if (self.output_image_display.width() > 300 and self.output_image_display.height() > 300):
                 self.output_image_display = self.output_image_display.scaled(300,300, QtCore.Qt.KeepAspectRatio)
             self.ui.output_window.setPixmap(self.output_image_display)
 
-        if (self.file_loaded == 2):
-            self.imageconverter.ArrayToImage()
+        if (self.file_loaded == 2 or self.file_loaded == 4): #svg layers need no threshold
+            self.imageconverter.ArrayToImage(self.preview_size)
             self.output_image_display = self.imageconverter.output_image
             if (self.output_image_display.width() > 300 and self.output_image_display.height() > 300):
                 self.output_image_display = self.output_image_display.scaled(300,300, QtCore.Qt.KeepAspectRatio)
@@ -453,88 +496,104 @@ class MainWindow(QtWidgets.QMainWindow):
 
         if (self.file_loaded == 1):
             self._printing_stop_event = threading.Event()
-            self.printing_thread = threading.Thread(target=self.PrintArray)
+            self.printing_thread = threading.Thread(target=self.PrintArray, name='printer')
             self.printing_thread.start()
             self.printing_thread.join()
         if (self.file_loaded == 3):
             self._printing_stop_event = threading.Event()
-            self.printing_thread = threading.Thread(target=self.IronPrintPDF)
+            self.printing_thread = threading.Thread(target=self.IronPrintPDF, name='printer')
+            self.printing_thread.start()
+            self.printing_thread.join()
+        if (self.file_loaded == 4):
+            self._printing_stop_event = threading.Event()
+            self.printing_thread = threading.Thread(target=self.PrintLayer, name='printer')
             self.printing_thread.start()
             self.printing_thread.join()
+        if (self.tracer.enabled):
+            self.tracer.Save() #the trace of all jobs so far
+
+    def PrintLayer(self):
+        """Prints the current svg layer, with the precomputed plan if it was planned for this side"""
+        temp_plan = self.layer_precompute.GetPlan(self.svg_layer) #waits if a worker is on this layer
+        if (temp_plan is None or (temp_plan.settings.get('x_start_pos'), temp_plan.settings.get('y_start_pos'))
+                != self.GetStartPosition(self.print_right_side)):
+            print("Layer " + str(self.svg_layer) + " not precomputed, planning it now")
+            temp_plan = self.GetPrintPlan(self.imageconverter, self.imageconverter.threshold,
+                                          self.print_right_side, self.imageconverter.file_path)
+        self.PrintArray(temp_plan)
 
     def IronPrintPDF(self) -> None:
-        """Manager of Processing and printers Thread
+        """Prints the pages of the pdf in order, each page as soon as the page pipeline has planned it,
+        while the pages after it are converted
         """
-        tr = threading.Thread(target=self.thread_renderizer)
-        tp = threading.Thread(target=self.thread_printer)
-        
-        tr.start()
-        tp.start()
-
-        tr.join()
-        tp.join()
-        
-        print("Finish PDF printing")
-        self.pdfconverter.remove_working_dir()
-
-    def thread_renderizer(self) -> None:
-        """This thread take the imageconverter pdf from self.pdflistpng
-        and send to renderized. Push to self.ready_for_print
-        """
-        self.pdflistpng = self.pdflistpng[::-1]
         temp_threshold = self.ui.threshold_slider.value()
+        temp_side = self.print_right_side #PrintArray changes side after every page
+        self.page_pipeline.on_progress = self.PagePipelineProgress
+        self.page_pipeline.Start(self.pdfconverter, self.planner, temp_threshold,
+                                 lambda temp_page: self.PageStartPosition(temp_side, temp_page))
         while True:
-            if not len(self.pdflistpng):
-                print("No more page. Bye")
-                self.flag_finish_pages = True
-                return 0
-            page = self.pdflistpng.pop()
-            print("Processing %r" % (page))
-            page.Threshold(temp_threshold)
-            page.ArrayToImage()
-            self.ready_for_print.append(page)
-            time.sleep(3)
-
-    def thread_printer(self) -> None:
-        """This thread take the imageconvert pdf file on self.ready_for_print
-        and send it to print.
-        """
-        while True:
-            if self.flag_finish_pages and not len(self.ready_for_print):
-                print("Finished to print")
-                self.flag_finish_pages = False 
-                return 0
-            if not len(self.ready_for_print) and not self.flag_finish_pages:
-                print("Nothing to print I will sleep")
-                time.sleep(1)
+            temp_page, temp_plan = self.page_pipeline.Get()
+            if temp_page is None:
+                break
+            if self.printing_abort_flag == 1:
+                print("PDF printing aborted")
+                self.page_pipeline.Cancel()
+                break
+            if temp_plan is None: #conversion failed, the side still changes so the next pages line up
+                self.print_right_side *= -1
                 continue
-            self.imageconverter = self.ready_for_print[0]
-            del self.ready_for_print[0]
-            print("Will print %r" % (self.imageconverter))
-            self.PrintArray()
-            time.sleep(1)
-
-
-    def PrintPDF(self) -> None:
-        """Print PDF files
+            print("Printing page %d" % (temp_page + 1))
+            if (self.PrintArray(temp_plan) == 0): #the side did not change, the pages after it were planned for the other side
+                print("Page %d did not print, PDF printing stopped" % (temp_page + 1))
+                self.page_pipeline.Cancel()
+                break
 
-        This use the PrintSVG method
-        """
-        print("Start with PDF Printing")
-        number_pages = len(self.pdflistpng)
-        print("PDF file has %d pages" % number_pages)
-        for page, num_page in zip(self.pdflistpng, range(1, number_pages + 1)):
-            self.imageconverter = page
-            print("Processing Page number %d" % num_page)
-            self.RenderOutput()
-            print("Printing Page number %d" % num_page)
-            self.PrintArray()
-                
+        self.page_pipeline.Join()
         print("Finish PDF printing")
         self.pdfconverter.remove_working_dir()
 
-    def PrintArray(self):
-        """Prints the current converted image array, only works if both inkjet and motion are connected"""
+    def PageStartPosition(self, temp_first_side, temp_page):
+        """Returns (x, y, side) a pdf page prints at, the side changes after every page"""
+        temp_side = temp_first_side * (-1) ** temp_page
+        temp_x_start_pos, temp_y_start_pos = self.GetStartPosition(temp_side)
+        return temp_x_start_pos, temp_y_start_pos, temp_side
+
+    def PagePipelineProgress(self, temp_converted, temp_total):
+        """Reports the pdf conversion progress, called from the page pipeline thread"""
+        print("Pages converted: " + str(temp_converted) + "/" + str(temp_total))
+
+    def GetStartPosition(self, temp_side):
+        """Returns the x and y start position (in millimeters) of the given side, 1 right, -1 left"""
+        if temp_side == 1:
+            # XXX: Lado derecho
+            return self.right_x_start, self.right_y_start
+        else:
+            # XXX: Lado Izquierdo
+            return self.left_x_start, self.left_y_start
+
+    def GetPrintPlan(self, temp_imageconverter, temp_threshold, temp_side, temp_file_path, temp_page=0):
+        """Returns the print plan of an image, from the plan cache if the same file was planned before
+        with the same settings, otherwise the image is converted and planned"""
+        temp_x_start_pos, temp_y_start_pos = self.GetStartPosition(temp_side)
+        temp_key = ''
+        if (temp_imageconverter.file_type == 1 and os.path.isfile(temp_file_path)): #svg layers are not cached
+            temp_key = self.planner.PlanKey(temp_file_path, temp_page, temp_imageconverter.GetDPI(), temp_threshold,
+                                            temp_side, temp_x_start_pos, temp_y_start_pos)
+            temp_plan = self.planner.LoadCached(temp_key)
+            if (temp_plan is not None):
+                print("Print plan loaded from cache")
+                return temp_plan
+
+        if (temp_imageconverter.file_type == 1 and temp_imageconverter.threshold != temp_threshold):
+            temp_imageconverter.Threshold(temp_threshold)
+        with self.metric_plan_seconds.Time(), self.tracer.Span('plan', 'plan'):
+            temp_plan = self.planner.Compile(temp_imageconverter, temp_x_start_pos, temp_y_start_pos, temp_key)
+        self.planner.SaveCached(temp_plan)
+        return temp_plan
+
+    def PrintArray(self, temp_plan=None):
+        """Prints the given print plan, or the current converted image array when no plan is given,
+        only works if both inkjet and motion are connected. Returns 1 if the job was printed, 0 if not"""
         #y is sweep direction, x is gantry direction
         #Width is Y direction, height is X direction
         print("estoy en print array")
@@ -542,215 +601,168 @@ class MainWindow(QtWidgets.QMainWindow):
         #check if printhead and motion are connected
         if (self.grbl_connection_state == 0): #do not continue if motion is not connected
             print("GRBL not CONNECTED")
-            return
+            return 0
         #inkjet is ignored for now
 
-
-        #make universal variables
-        self.inkjet_line_buffer = [] #buffer storing the print lines
-        self.inkjet_lines_left = 0 #the number of lines in buffer
-        self.inkjet_line_history = "" #the last burst line sent to buffer
-        self.travel_speed = 20000.0
-        self.print_speed = 9000.0
+        if (temp_plan is None):
+            temp_plan = self.GetPrintPlan(self.imageconverter, self.imageconverter.threshold,
+                                          self.print_right_side, self.imageconverter.file_path)
+        print("Print plan: " + str(len(temp_plan.sweeps)) + " sweeps, " + str(temp_plan.LineCount()) + " lines")
+        if (temp_plan.settings.get('pack_bands', 0) == 1):
+            temp_fixed_sweeps = temp_plan.settings.get('fixed_sweeps', len(temp_plan.sweeps))
+            print("Band packing saved " + str(temp_fixed_sweeps - len(temp_plan.sweeps)) + " of "
+                  + str(temp_fixed_sweeps) + " sweeps")
+        temp_uni_time, temp_bi_time = self.planner.CompareDirections(temp_plan)
+        print("Estimated motion time: " + str(round(temp_uni_time, 1)) + "s unidirectional, "
+              + str(round(temp_bi_time, 1)) + "s bidirectional")
 
         self.inkjet.ClearBuffer() #clear inkjet buffer on HP45
 
+        temp_job_start = time.perf_counter()
         self.grbl.Home() #home gantry
 
+        with self.tracer.Span('print job', 'print', {'sweeps': len(temp_plan.sweeps)}):
+            if (self.print_pipelined == 1):
+                temp_done = self.PrintSweepsPipelined(temp_plan)
+            else:
+                temp_done = self.PrintSweeps(temp_plan)
+        if (temp_done == 0):
+            return 0
 
-        #look for X-min and X-max in image
-        self.sweep_x_min = 0
-        self.sweep_x_max = 0
-        temp_break_loop = 0
-        #loop through image
-        for h in range(0,self.imageconverter.image_array_height):
-            for w in range(0,self.imageconverter.image_array_width):
-                if (self.imageconverter.image_array[h][w] != 0):
-                    self.sweep_x_min = h
-                    temp_break_loop = 1
-                    print("X-min on row: " + str(h))
-                    break
-            if (temp_break_loop == 1):
-                break
-        temp_break_loop = 0
-        for h in reversed(range(0,self.imageconverter.image_array_height)):
-            for w in range(0,self.imageconverter.image_array_width):
-                if (self.imageconverter.image_array[h][w] != 0):
-                    self.sweep_x_max = h
-                    temp_break_loop = 1
-                    print("X-max on row: " + str(h))
-                    break
-            if (temp_break_loop == 1):
-                break
-
-        #set X start pixel, X pixel step (using current DPI)
-        self.sweep_size = int(self.imageconverter.GetDPI() / 2) #get sweep size (is halve of DPI)
-        print("Sweep size: " + str(self.sweep_size))
-        #determine pixel to position multiplier (in millimeters)
-        self.pixel_to_pos_multiplier = 25.4 / self.imageconverter.GetDPI()
-        #determine x and y start position (in millimeters)
-        if self.print_right_side == 1:
-            # XXX: Lado derecho
-            self.y_start_pos = self.right_y_start
-            self.x_start_pos = self.right_x_start
-        else:
-            # XXX: Lado Izquierdo
-            self.y_start_pos = self.left_y_start
-            self.x_start_pos = self.left_x_start
-
-        self.y_acceleration_distance = 10.0
+        print("Printing done")
+        self.metric_job_seconds.Observe(time.perf_counter() - temp_job_start)
+        self.print_right_side *= -1
+        self.grbl.SerialGotoXY(5, 410, '20000')
+        return 1
 
-        self.sweep_x_min_pos = self.sweep_x_min
+    def PrintSweeps(self, temp_plan):
+        """Prints the sweeps one by one, waiting for idle and setting the printhead position before each,
+        returns 0 if GRBL disconnected"""
         ###loop through all sweeps
-        temp_sweep_stop = 0
-        while (temp_sweep_stop == 0):
-            #determine if there still is a sweep left
-            #determine X-start and X end of sweep
-            if (self.sweep_x_min_pos + self.sweep_size <= self.sweep_x_max):
-                self.sweep_x_max_pos = self.sweep_x_min_pos + self.sweep_size
-            else:
-                self.sweep_x_max_pos = self.sweep_x_max #set max of image as max pos
-                temp_sweep_stop = 1 #mark last loop
-            print("Sweep from: " + str(self.sweep_x_min_pos) + ", to: " + str(self.sweep_x_max_pos))
-
-
-            #Look for Y min and Y max in sweep
-            self.sweep_y_min = 0
-            self.sweep_y_max = 0
-            #get Y min
-            temp_break_loop = 0
-            for w in range(self.imageconverter.image_array_width):
-                for h in range(self.sweep_x_min_pos, self.sweep_x_max_pos):
-                    if (self.imageconverter.image_array[h][w] != 0):
-                        self.sweep_y_min = w
-                        temp_break_loop = 1
-                        break
-                if (temp_break_loop == 1):
-                    break
-            #get Y max
-            temp_break_loop = 0
-            for w in reversed(range(self.imageconverter.image_array_width)):
-                for h in range(self.sweep_x_min_pos, self.sweep_x_max_pos):
-                    if (self.imageconverter.image_array[h][w] != 0):
-                        self.sweep_y_max = w
-                        temp_break_loop = 1
-                        break
-                if (temp_break_loop == 1):
-                    break
-            print("sweep Y min: " + str(self.sweep_y_min) +", Y max: " + str(self.sweep_y_max))
-
-            #determine printing direction (if necessary)
-            self.printing_direction = 1 #only 1 for now
-
-            #Set Y at starting and end position
-            if (self.printing_direction == 1):
-                self.y_printing_start_pos = self.sweep_y_min * self.pixel_to_pos_multiplier
-                self.y_printing_start_pos += self.y_start_pos - self.y_acceleration_distance
-                self.y_printing_end_pos = self.sweep_y_max * self.pixel_to_pos_multiplier
-                self.y_printing_end_pos += self.y_start_pos + self.y_acceleration_distance
-                print("Sweep ranges from: " + str(self.y_printing_start_pos) + "mm, to: " + str(self.y_printing_end_pos) + "mm")
-
-            #set X position
-            self.x_printing_pos = self.sweep_x_min_pos * self.pixel_to_pos_multiplier
-            self.x_printing_pos += self.x_start_pos
-            #check if connected before sending
-               
- 
-            #fill local print buffer with lines
-            print("Filling local buffer with inkjet")
-            temp_line_history = ""
-            temp_line_string = ""
-            temp_line_array = zeros(self.sweep_size)
-            temp_line_history = B64.B64ToArray(temp_line_array) #make first history 0
-            temp_line_string = temp_line_history #make string also 0
-
-            #add all of starter cap at the front
-            if (self.printing_direction == 1):
-                temp_pos = ((self.sweep_y_min - 1) * self.pixel_to_pos_multiplier) + self.y_start_pos
-                temp_pos *= 1000 #printhead pos is in microns
-                temp_b64_pos = B64.B64ToSingle(temp_pos) #make position value
-                self.inkjet_line_buffer.append("SBR " + str(temp_b64_pos) + " " + str(temp_line_string))
-                self.inkjet_lines_left += 1
-
-            for w in range(self.sweep_y_min,self.sweep_y_max):
-                #print("Parsing line: " + str(w))
-                temp_line_changed = 0 #reset changed
-                temp_counter = 0
-                for h in range(self.sweep_x_min_pos, self.sweep_x_max_pos):
-                    #loop through all pixels to make a new burst
-                    temp_line_array[temp_counter] = self.imageconverter.image_array[h][w] #write array value to temp
-
-                    temp_counter += 1
-                temp_line_string = B64.B64ToArray(temp_line_array) #convert to string
-                if (temp_line_string != temp_line_history):
-                    #print("line changed on pos: " + str(w))
-                    temp_line_history = temp_line_string
-                    #add line to buffer
-                    temp_pos = (w * self.pixel_to_pos_multiplier) + self.y_start_pos
-                    temp_pos *= 1000 #printhead pos is in microns
-                    temp_b64_pos = B64.B64ToSingle(temp_pos) #make position value
-                    self.inkjet_line_buffer.append("SBR " + str(temp_b64_pos) + " " + str(temp_line_string))
-                    self.inkjet_lines_left += 1
-
-            #add all off cap at the end of the image
-            temp_line_array = zeros(self.sweep_size)
-            temp_line_string = B64.B64ToArray(temp_line_array)
-            if (self.printing_direction == 1):
-                temp_pos = ((self.sweep_y_max + 1) * self.pixel_to_pos_multiplier) + self.y_start_pos
-                temp_pos *= 1000 #printhead pos is in microns
-                temp_b64_pos = B64.B64ToSingle(temp_pos) #make position value
-                self.inkjet_line_buffer.append("SBR " + str(temp_b64_pos) + " " + str(temp_line_string))
-                self.inkjet_lines_left += 1
-
-            print("Making printing buffer done: ")
+        for temp_sweep in temp_plan.sweeps:
+            print("Sweep from: " + str(temp_sweep.band_start) + ", to: " + str(temp_sweep.band_end))
+            print("Sweep ranges from: " + str(temp_sweep.y_start_pos) + "mm, to: " + str(temp_sweep.y_end_pos) + "mm")
 
             #wait till the head is idle
-            while (self.grbl.motion_state != 'idle'):
-                nothing = 0
+            with self.metric_motion_seconds.Time(), self.tracer.Span('wait idle', 'print'):
+                if (self.grbl.WaitForIdle() == 0):
+                    print("GRBL disconnected while printing")
+                    return 0
+            self.TraceGantryIdle()
+            temp_sweep_start = time.perf_counter()
             print("break from idle, moving to filling buffers")
 
             #match inkjet and printer pos
             self.InkjetSetPosition()
 
-            #Fill inkjet buffer with with sweep lines
+            #Fill inkjet buffer with with sweep lines, the HP45 streams them as its buffer has space
             print("Filling inkjet buffer")
-            #start filling the inkjet buffer on the HP45 lines
-            temp_lines_sent = 0
-            count_lines = 0
-            while(True):
-                if (self.inkjet_lines_left > 0):
-                    self.inkjet.SerialWriteBufferRaw(self.inkjet_line_buffer[0])
-                    # if count_lines > 900:
-                    #     time.sleep(0.001)
-                    #     count_lines = 0
-                    time.sleep(0.001) #this is a good replacement for print, but takes forever
-                    print(str(self.inkjet_line_buffer[0])) #some sort of delay is required, else the function gets filled up too quickly. Will move to different buffer later
-                    del self.inkjet_line_buffer[0] #remove sent line
-                    self.inkjet_lines_left -= 1
-                    temp_lines_sent += 1
-                    # count_lines += 1
-                else:
-                    break
+            with self.tracer.Span('HP45 fill', 'print', {'lines': len(temp_sweep.lines)}):
+                self.inkjet.SerialWriteBufferBulk(temp_sweep.lines)
 
             #send motion lines
             print("Filling motion buffer")
-            self.grbl.SerialGotoXY(self.x_printing_pos, self.y_printing_start_pos, self.travel_speed)
-            self.grbl.SerialGotoXY(self.x_printing_pos, self.y_printing_end_pos, self.print_speed)
+            for temp_x, temp_y, temp_f in temp_sweep.moves:
+                self.grbl.SerialGotoXY(temp_x, temp_y, temp_f)
             self.grbl.StatusIndexSet() #set current status index
+            self.TraceMoves(temp_sweep.moves)
+
+            with self.metric_motion_seconds.Time(), self.tracer.Span('wait idle', 'print'):
+                if (self.grbl.WaitForIdle(1) == 0): #wait for a new status that is idle
+                    print("GRBL disconnected while printing")
+                    return 0
+            temp_now = time.perf_counter()
+            self.metric_sweep_seconds.Observe(temp_now - temp_sweep_start)
+            self.tracer.Complete('sweep', 'print', temp_sweep_start, temp_now, 'sweeps', {'rows': [temp_sweep.band_start, temp_sweep.band_end]})
+            self.metric_sweeps.Inc()
+            self.metric_sweep_lines.Inc(len(temp_sweep.lines))
+            print("break conditions for print while loop")
+            print("Inkjet lines per second: " + str(self.inkjet.GetLinesPerSecond()))
+        return 1
 
-            while (True):
-                if (self.grbl.StatusIndexChanged() == 1 and self.grbl.motion_state == 'idle'):
-                    print("break conditions for print while loop")
-                    break #break if exit conditions met
+    def PrintSweepsPipelined(self, temp_plan):
+        """Prints the sweeps back to back. The lines of the next sweep go to the HP45 while the
+        current one prints, its moves are queued once all its lines are in the HP45 (or the gantry
+        is idle, when a sweep has more lines than fit the HP45 buffer), so GRBL never stops between sweeps.
+        Returns 0 if GRBL disconnected"""
+        #wait till the head is idle after homing, match inkjet and printer pos once
+        with self.metric_motion_seconds.Time(), self.tracer.Span('wait idle', 'print'):
+            if (self.grbl.WaitForIdle() == 0):
+                print("GRBL disconnected while printing")
+                return 0
+        self.TraceGantryIdle()
+        self.InkjetSetPosition()
+
+        temp_sweep_start = None #when the moves of the sweep before were queued
+        temp_sweep_rows = None
+        for temp_sweep in temp_plan.sweeps:
+            print("Sweep from: " + str(temp_sweep.band_start) + ", to: " + str(temp_sweep.band_end))
+
+            #the HP45 streams the lines as its buffer frees up while the sweep before prints
+            with self.metric_fill_seconds.Time(), self.tracer.Span('HP45 fill', 'print', {'lines': len(temp_sweep.lines)}):
+                self.inkjet.SerialWriteBufferBulk(temp_sweep.lines)
+                while (self.inkjet.connection_state == 1 and self.inkjet.WaitForBufferLeft(0, 0.05) == 0):
+                    if (self.grbl.connection_state == 0):
+                        print("GRBL disconnected while printing")
+                        return 0
+                    if (self.grbl.StatusIndexChanged() == 1 and self.grbl.motion_state == 'idle'):
+                        break #the gantry is done with the sweep before, only moving frees the HP45 buffer
+
+            #queue the moves behind the sweep still printing
+            for temp_x, temp_y, temp_f in temp_sweep.moves:
+                self.grbl.SerialGotoXY(temp_x, temp_y, temp_f)
+            self.grbl.StatusIndexSet() #idle is only true again after these moves
+            self.TraceMoves(temp_sweep.moves)
+            #sweeps follow each other, a sweep lasts from queueing its moves to queueing the next
+            temp_now = time.perf_counter()
+            if (temp_sweep_start is not None):
+                self.metric_sweep_seconds.Observe(temp_now - temp_sweep_start)
+                self.tracer.Complete('sweep', 'print', temp_sweep_start, temp_now, 'sweeps', temp_sweep_rows)
+            temp_sweep_start = temp_now
+            temp_sweep_rows = {'rows': [temp_sweep.band_start, temp_sweep.band_end]}
+            self.metric_sweeps.Inc()
+            self.metric_sweep_lines.Inc(len(temp_sweep.lines))
+            print("Inkjet lines per second: " + str(self.inkjet.GetLinesPerSecond()))
+
+        with self.metric_motion_seconds.Time(), self.tracer.Span('wait idle', 'print'):
+            if (self.grbl.WaitForIdle(1) == 0): #wait for the last sweep to end
+                print("GRBL disconnected while printing")
+                return 0
+        if (temp_sweep_start is not None): #the last sweep ends at idle
+            temp_now = time.perf_counter()
+            self.metric_sweep_seconds.Observe(temp_now - temp_sweep_start)
+            self.tracer.Complete('sweep', 'print', temp_sweep_start, temp_now, 'sweeps', temp_sweep_rows)
+        return 1
 
-            self.sweep_x_min_pos += self.sweep_size
-        
-        print("Printing done")
-        self.print_right_side *= -1
-        self.grbl.SerialGotoXY(5, 410, '20000')
+    def TraceMoves(self, temp_moves):
+        """Adds the moves of a sweep just queued to the trace, on the gantry track. GRBL does not report
+        when a move starts, so they are timed with the planner estimate, one after the other"""
+        if (not self.tracer.enabled):
+            return
+        temp_start = time.perf_counter()
+        if (self.trace_gantry_free > temp_start): #the moves traced before are still running
+            temp_start = self.trace_gantry_free
+        for temp_index, (temp_x, temp_y, temp_f) in enumerate(temp_moves):
+            temp_distance = math.hypot(temp_x - self.trace_gantry_pos[0], temp_y - self.trace_gantry_pos[1])
+            temp_end = temp_start + self.planner.MoveTime(temp_distance, temp_f)
+            self.tracer.Complete(('G1 travel', 'G1 print')[temp_index == len(temp_moves) - 1], 'motion',
+                                 temp_start, temp_end, 'gantry (estimated)', {'x': temp_x, 'y': temp_y, 'f': temp_f})
+            temp_start = temp_end
+            self.trace_gantry_pos = (temp_x, temp_y)
+        self.trace_gantry_free = temp_start
+
+    def TraceGantryIdle(self):
+        """The gantry is idle, the next traced moves start when queued, from the reported position"""
+        if (self.tracer.enabled):
+            self.trace_gantry_free = 0.0
+            self.trace_gantry_pos = (self.grbl.motion_x_pos, self.grbl.motion_y_pos)
 
 
 if __name__ == '__main__':
+    if (os.environ.get('OASIS_METRICS')): #path the metrics snapshots are written to (.json and .prom), off when not set
+        GetMetrics().Enable(os.environ['OASIS_METRICS'])
+    if (os.environ.get('OASIS_TRACE')): #path of the Chrome trace written after every print, off when not set
+        GetTracer().Enable(os.environ['OASIS_TRACE'])
     app = QtWidgets.QApplication(sys.argv)
     gui = MainWindow()
     sys.exit(app.exec_())
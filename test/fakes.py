@@ -0,0 +1,17 @@
+import numpy as np
+
+
+class FakeImage:
+    """The parts of ImageConverter the planner uses, without Qt"""
+    def __init__(self, image_array, dpi=300):
+        self.image_array = np.asarray(image_array)
+        self.image_array_height, self.image_array_width = self.image_array.shape
+        self.dpi = dpi
+        self.occupancy = None
+        self.file_type = 1
+
+    def GetDPI(self):
+        return self.dpi
+
+    def GetBand(self, start, end):
+        return (self.image_array[start:end] != 0).astype(np.uint8)
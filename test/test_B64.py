@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+import B64
+
+
+class TestB64(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(45)
+
+    def test_to_array_batch(self):
+        for nozzles in (1, 5, 6, 7, 150, 300):
+            bursts = (self.rng.rand(40, nozzles) > 0.5).astype(float)
+            self.assertEqual(B64.B64ToArrayBatch(bursts), [B64.B64ToArray(b) for b in bursts])
+
+    def test_to_array_inverted_b6(self):
+        self.assertEqual(B64.B64ToArray([0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1]), 'AB')
+        self.assertEqual(B64.B64ToArrayBatch([[0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1]]), ['AB'])
+
+    def test_to_single_batch(self):
+        values = [0, 1, 63, 64, -129, 275000, -275000.7, 422000.9, 2 ** 40]
+        values += list(self.rng.randint(-10 ** 7, 10 ** 7, size=200))
+        self.assertEqual(B64.B64ToSingleBatch(values), [B64.B64ToSingle(v) for v in values])
+
+    def test_to_single_batch_exact(self):
+        # integers past 2**53 are not rounded through float64
+        values = [2 ** 53 + 1, -(2 ** 53 + 1), 2 ** 63 - 1, -(2 ** 63 - 1)]
+        self.assertEqual(B64.B64ToSingleBatch(values), [B64.B64ToSingle(v) for v in values])
+        self.assertEqual(B64.B64ToSingleBatch(np.array(values, dtype=np.int64)), [B64.B64ToSingle(v) for v in values])
+
+    def test_to_single_batch_rejects(self):
+        for values in ([2 ** 63], [-2 ** 63], np.array([1e19]), np.array([2 ** 64 - 1], dtype=np.uint64)):
+            self.assertRaises(ValueError, B64.B64ToSingleBatch, values)
+        for values in ([float('nan')], np.array([1.0, np.nan]), np.array([np.inf])):
+            self.assertRaises(ValueError, B64.B64ToSingleBatch, values)
+        self.assertRaises(OverflowError, B64.B64ToSingleBatch, [float('inf')])  # the same as int()
+
+    def test_from_single_batch(self):
+        strings = ['A', 'BA', '-BA', 'ah9', '-CB', '', 'AB\r', '////']
+        self.assertEqual(B64.B64FromSingleBatch(strings), [B64.B64FromSingle(s) for s in strings])
+        values = list(self.rng.randint(-10 ** 7, 10 ** 7, size=200))
+        self.assertEqual(B64.B64FromSingleBatch(B64.B64ToSingleBatch(values)), values)
+
+    def test_from_single_batch_long(self):
+        # 10 digits still fit in int64, 11 and more are decoded as python ints like B64FromSingle
+        strings = ['/' * 10, '-' + '/' * 10, '/' * 11, 'B' + 'A' * 10, '-' + '/' * 20]
+        self.assertEqual(B64.B64FromSingleBatch(strings), [B64.B64FromSingle(s) for s in strings])
+        self.assertEqual(B64.B64FromSingleBatch(['/' * 11]), [64 ** 11 - 1])
+        self.assertEqual(B64.B64FromSingleBatch(['/' * 10]), [64 ** 10 - 1])
+
+    def test_from_test_array_batch(self):
+        strings = ['////B', 'A', 'gAB/', 'Q+9']
+        self.assertEqual(B64.B64FromTestArrayBatch(strings), [B64.B64FromTestArray(s) for s in strings])
+
+
+if __name__ == '__main__':
+    unittest.main()
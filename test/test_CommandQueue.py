@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+from CommandQueue import CommandQueue
+
+
+class TestCommandQueue(unittest.TestCase):
+    def test_fifo_and_bytes(self):
+        queue = CommandQueue()
+        queue.PutMany(["G1 X1\r", "G1 X22\r", "G1 X333\r"])
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.Bytes(), 6 + 7 + 8)
+        self.assertEqual(queue.Peek(), "G1 X1\r")
+        self.assertEqual(queue.Get(), "G1 X1\r")
+        self.assertEqual(queue.Bytes(), 7 + 8)
+        self.assertEqual(queue.GetMany(10), ["G1 X22\r", "G1 X333\r"])
+        self.assertEqual(queue.Bytes(), 0)
+        self.assertIsNone(queue.Get(False))
+
+    def test_get_many_limits(self):
+        queue = CommandQueue()
+        queue.PutMany(["abcd"] * 10)
+        self.assertEqual(queue.GetMany(3), ["abcd"] * 3)
+        self.assertEqual(queue.GetMany(10, 9), ["abcd"] * 2)
+        self.assertEqual(queue.GetMany(10, 3), [])
+        self.assertEqual(len(queue), 5)
+
+    def test_watermarks(self):
+        queue = CommandQueue(4, 1)
+        self.assertEqual(queue.PutMany(["a"] * 6, block=False), 4)
+        self.assertFalse(queue.Put("b", timeout=0.01))
+        queue.GetMany(2)  # 2 left, still above the low watermark
+        self.assertFalse(queue.Put("b", block=False))
+        queue.Get()  # 1 left, released
+        self.assertTrue(queue.Put("b", block=False))
+
+    def test_blocked_producer(self):
+        queue = CommandQueue(10, 5)
+        woken = []
+        queue.on_put = lambda: woken.append(len(queue))
+        producer = threading.Thread(target=queue.PutMany, args=(["line"] * 30,))
+        producer.start()
+        taken = []
+        while len(taken) < 30:
+            lines = queue.GetMany(3)
+            self.assertLessEqual(len(queue), 10)
+            taken.extend(lines)
+            if not lines:
+                time.sleep(0.001)
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        self.assertTrue(woken)  # the consumer was woken before the producer blocked
+
+    def test_close_releases(self):
+        queue = CommandQueue(1, 0)
+        queue.Put("a")
+        result = []
+        producer = threading.Thread(target=lambda: result.append(queue.Put("b")))
+        producer.start()
+        time.sleep(0.01)
+        queue.Close()
+        producer.join(1)
+        self.assertEqual(result, [False])
+        self.assertEqual(queue.Get(), "a")  # what is queued can still be taken
+        self.assertIsNone(queue.Get(timeout=1))  # closed and empty, no wait
+        queue.Open()
+        self.assertTrue(queue.Put("c", block=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import os
+import sys
+import time
+import unittest
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+import B64
+from DeviceEmulator import GrblEmulator, HP45Emulator
+from Kinematics import ProfileTime
+from Metrics import GetMetrics
+from Tracer import GetTracer
+from SerialGRBL import GRBL
+from SerialHP45 import HP45
+
+
+def enable_metrics(test):
+    metrics = GetMetrics()
+    metrics.Enable()
+    test.addCleanup(metrics.Disable)
+    test.addCleanup(metrics.Reset)  # cleanups run last in, first out
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class TestGrblEmulator(unittest.TestCase):
+    def setUp(self):
+        self.device = GrblEmulator(homing_time=0.2)
+        self.grbl = GRBL()
+        self.assertEqual(self.grbl.Connect(self.device.Start()), 1)
+        self.assertTrue(wait_until(lambda: self.grbl.started_state == 1))
+
+    def tearDown(self):
+        self.grbl.Disconnect()
+        self.device.Stop()
+
+    def status(self):
+        index = self.grbl.motion_state_index
+        self.grbl.SerialWriteRaw('?', 0)
+        self.assertTrue(wait_until(lambda: self.grbl.motion_state_index != index))
+        return self.grbl.status
+
+    def test_stream(self):
+        self.grbl.SetStreamingMode(1)
+        for index in range(200):
+            self.grbl.SerialWriteBufferRaw('G4 P0')
+        self.assertTrue(wait_until(lambda: self.grbl.BufferLeft() == 0 and len(self.grbl.sent_lines) == 0))
+        stats = self.device.Stats()
+        self.assertEqual(stats['lines'], 200)
+        self.assertEqual(stats['rx_overflows'], 0)
+        self.assertLessEqual(stats['rx_peak'], 128)
+
+    def test_metrics(self):
+        enable_metrics(self)
+        self.grbl.SetStreamingMode(1)
+        for index in range(50):
+            self.grbl.SerialWriteBufferRaw('G4 P0')
+        self.assertTrue(wait_until(lambda: self.grbl.BufferLeft() == 0 and len(self.grbl.sent_lines) == 0))
+        self.assertEqual(self.grbl.metric_lines_sent.value, 50)
+        self.assertEqual(self.grbl.metric_ack_seconds.count, 50)  # every line got its ok
+        self.assertLessEqual(self.grbl.metric_rx_used.max, 127)
+        self.assertEqual(len(self.grbl.sent_times), 0)
+
+    def test_trace(self):
+        tracer = GetTracer()
+        tracer.Enable()
+        self.addCleanup(tracer.Clear)
+        self.addCleanup(tracer.Disable)
+        self.grbl.SetStreamingMode(1)
+        self.grbl.SerialGotoXY(5, 0, 6000)
+        self.assertTrue(wait_until(lambda: self.device.Stats()['lines'] == 1))
+        self.assertTrue(wait_until(lambda: self.status().state == 'idle'))
+        events = tracer.Take()
+        names = {event['tid']: event['args']['name'] for event in events if event['ph'] == 'M' and 'tid' in event}
+        serial = [(event['name'], event['args']['data']) for event in events
+                  if event['ph'] == 'i' and names[event['tid']] == 'GRBL serial']
+        self.assertIn(('tx', 'G1 X5 Y0 F6000'), serial)
+        self.assertIn(('rx', 'ok'), serial)
+        states = [event['name'] for event in events if event['ph'] == 'i' and names[event['tid']] == 'GRBL motion']
+        self.assertEqual(states[-2:], ['run', 'idle'])
+
+    def test_move_timing(self):
+        self.grbl.SerialGotoXY(10, 0, 6000)  # 10 mm at 100 mm/s never reaches full speed
+        start = time.time()
+        self.assertTrue(wait_until(lambda: self.device.Stats()['lines'] == 1))
+        self.assertEqual(self.status().state, 'run')
+        self.assertTrue(wait_until(lambda: self.status().state == 'idle'))
+        self.assertAlmostEqual(time.time() - start, ProfileTime(10.0, 100.0, 500.0), delta=0.1)
+        self.assertEqual(self.status().wpos, (10.0, 0.0, 0.0, 0.0))
+
+    def test_home_and_offset(self):
+        self.grbl.printer_homing_pulloff = 2
+        self.grbl.Home()
+        self.assertTrue(wait_until(lambda: self.grbl.homed_state == 1))
+        self.assertTrue(wait_until(lambda: self.grbl.BufferLeft() == 0 and len(self.grbl.sent_lines) == 0))
+        self.assertEqual(self.status().wpos[:2], (2.0, 420.0))
+        self.grbl.Jog('Y', 5, 3000)
+        self.assertTrue(wait_until(lambda: self.device.Stats()['lines'] == 5 and self.status().state == 'idle'))
+        self.assertEqual(self.status().wpos[:2], (2.0, 425.0))
+        self.assertEqual(self.device.Position()[:2], (0.0, 5.0))
+
+    def test_errors(self):
+        self.grbl.SetStreamingMode(1)  # send-response stops at the first error
+        self.grbl.SerialWriteBufferRaw('G1 X5')  # no feed rate yet
+        self.assertTrue(wait_until(lambda: self.grbl.error_state == 1))
+        self.assertEqual(self.grbl.error_line, 'g1 x5')
+        self.grbl.SerialWriteBufferRaw('G38.2 X5 F100')
+        self.grbl.SerialWriteBufferRaw('$Q')
+        self.assertTrue(wait_until(lambda: self.device.Stats()['errors'] == 3))
+        self.assertIn('error:20', self.grbl.GetWindowInput())
+
+
+class TestHP45Emulator(unittest.TestCase):
+    def setUp(self):
+        self.device = HP45Emulator(buffer_size=200, encoder_speed=1000.0, temperature=31.5, dead_nozzles=(3, 100))
+        self.inkjet = HP45()
+        self.inkjet.inkjet_buffer_margin = 10
+        self.assertEqual(self.inkjet.Connect(self.device.Start()), 1)
+
+    def tearDown(self):
+        self.inkjet.Disconnect()
+        self.device.Stop()
+
+    def request(self, command):
+        self.inkjet.send_status_buffer = command
+        self.inkjet.send_get_status = 1
+        self.inkjet.reactor.Wake()
+        self.assertTrue(wait_until(lambda: self.inkjet.send_get_status == 0 and self.inkjet.lines_in_flight == 0))
+
+    def test_status(self):
+        self.request('GTP')
+        self.assertEqual(self.inkjet.inkjet_temperature, 31.5)
+        self.inkjet.SetPosition(12000)
+        self.assertTrue(wait_until(lambda: self.inkjet.BufferLeft() == 0 and self.inkjet.lines_in_flight == 0))
+        self.request('GEP')
+        self.assertEqual(self.inkjet.inkjet_x_pos, 12.0)
+        self.request('BWL')
+        self.assertEqual(self.inkjet.inkjet_writeleft, 200)
+        self.inkjet.TestPrinthead()
+        self.assertTrue(wait_until(lambda: self.inkjet.inkjet_working_nozzles == 298))
+        self.assertEqual(self.inkjet.inkjet_total_nozzles, 300)
+
+    def test_stream(self):
+        # three times the buffer, the driver only sends what the BWL replies leave room for
+        burst = B64.B64ToArray([1] * 300)
+        lines = ['SBR ' + B64.B64ToSingle(position * 100) + ' ' + burst for position in range(600)]
+        self.inkjet.SerialWriteBufferBulk(lines)
+        self.assertTrue(wait_until(lambda: self.device.Stats()['lines_printed'] == 600, 10.0))
+        stats = self.device.Stats()
+        self.assertEqual(stats['overflows'], 0)
+        self.assertLessEqual(stats['buffer_peak'], 200)
+        self.assertEqual(stats['unknown'], 0)
+
+    def test_metrics(self):
+        enable_metrics(self)
+        lines = ['SBR ' + B64.B64ToSingle(position * 100) + ' ' + B64.B64ToArray([1] * 300) for position in range(300)]
+        self.inkjet.SerialWriteBufferBulk(lines)
+        self.assertTrue(wait_until(lambda: self.device.Stats()['lines_printed'] == 300, 10.0))
+        self.assertTrue(wait_until(lambda: self.inkjet.lines_in_flight == 0))
+        self.assertEqual(self.inkjet.metric_lines_sent.value, 300)
+        requests = self.inkjet.metric_bwl_requests.value
+        self.assertGreater(requests, 0)  # 300 lines do not fit in the credits of one reply
+        self.assertEqual(self.inkjet.metric_ack_seconds.count, 300 + requests)
+        self.assertEqual(self.inkjet.metric_buffer_free.count, requests)
+        self.assertLessEqual(self.inkjet.metric_buffer_free.max, 200)
+
+    def test_encoder(self):
+        # the lines only leave the buffer when the encoder passes them
+        position = [0.0]
+        self.device.encoder = lambda: position[0]
+        self.inkjet.SerialWriteBufferBulk(['SBR ' + B64.B64ToSingle(1000 * mm) + ' A' for mm in (1, 2, 3)])
+        self.assertTrue(wait_until(lambda: self.device.Stats()['lines_received'] == 3))
+        position[0] = 2.5
+        self.assertTrue(wait_until(lambda: self.device.Stats()['lines_printed'] == 2))
+        self.assertEqual(self.device.Stats()['buffer_used'], 1)
+        position[0] = 3.0
+        self.assertTrue(wait_until(lambda: self.device.Stats()['buffer_used'] == 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import unittest
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+from GrblGcode import GrblModal, ParseLine
+from Kinematics import ProfileTime
+from SerialGRBL import GRBL
+
+
+class TestParseLine(unittest.TestCase):
+    def test_kinds(self):
+        self.assertEqual(ParseLine('$H'), ('sync', 'home', None))
+        self.assertEqual(ParseLine('$$'), ('other', '$$', None))
+        self.assertEqual(ParseLine('G1X10.5Y-2F3000'), ('move', 'gcode', {'G': [1.0], 'X': 10.5, 'Y': -2.0, 'F': 3000.0}))
+        self.assertEqual(ParseLine('G4P0.5')[0], 'sync')
+        self.assertEqual(ParseLine('M4')[0], 'sync')
+        self.assertEqual(ParseLine('G92X0Y0')[0], 'other')
+        self.assertEqual(ParseLine('')[0], 'other')
+
+    def test_errors(self):
+        self.assertEqual(ParseLine('$Q')[1], 3)
+        self.assertEqual(ParseLine('G1X5%')[1], 1)
+        self.assertEqual(ParseLine('G1X-')[1], 2)
+        self.assertEqual(ParseLine('G38.2X5')[1], 20)
+        self.assertEqual(ParseLine('G1B5')[1], 20)
+
+    def test_driver_lines(self):
+        # every line the driver sends is accepted
+        grbl = GRBL()
+        lines = grbl.HomeLines() + grbl.NewLayerLines(0.1) + [grbl.GotoLine(10, 20, 3000), grbl.GotoLine(10, 20)]
+        for line in lines:
+            self.assertNotIsInstance(ParseLine(line.replace(' ', '').upper())[1], int, line)
+
+
+class TestGrblModal(unittest.TestCase):
+    def setUp(self):
+        self.modal = GrblModal()
+
+    def execute(self, line):
+        return self.modal.Execute(ParseLine(line)[2], 30000.0, 500.0)
+
+    def test_move(self):
+        error, block = self.execute('G0X30Y40')
+        self.assertEqual(error, 0)
+        self.assertEqual(block.end, (30.0, 40.0, 0.0, 0.0))
+        self.assertEqual((block.distance, block.speed), (50.0, 500.0))
+        self.assertEqual(block.duration, ProfileTime(50.0, 500.0, 500.0))
+        error, block = self.execute('G91G1Y-10F600')
+        self.assertEqual((block.start, block.end, block.speed), ((30.0, 40.0, 0.0, 0.0), (30.0, 30.0, 0.0, 0.0), 10.0))
+        self.assertEqual(self.execute('G1Y0')[1], None)  # relative, no distance
+
+    def test_feed_and_offset(self):
+        self.assertEqual(self.execute('G1X5'), (22, None))
+        self.assertEqual(self.modal.target, [0.0] * 4)
+        self.execute('G0X5')
+        self.assertEqual(self.execute('G92X0'), (0, None))
+        self.assertEqual(self.execute('G0X10')[1].end[0], 15.0)
+        self.modal.Reset((0.0, 0.0, 0.0, 0.0))
+        self.assertEqual((self.modal.absolute, self.modal.motion, self.modal.wco[0]), (1, 0, 5.0))
+
+    def test_dwell_and_spindle(self):
+        self.execute('G0X5')
+        error, block = self.execute('G4P0.25')
+        self.assertEqual((block.start, block.end, block.distance, block.duration),
+                         ((5.0, 0.0, 0.0, 0.0), (5.0, 0.0, 0.0, 0.0), 0.0, 0.25))
+        self.execute('M4')
+        self.assertEqual(self.modal.spindle, 4)
+        self.execute('M5')
+        self.assertEqual(self.modal.spindle, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
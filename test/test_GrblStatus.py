@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+from GrblStatus import GrblStatusParser, EMPTY_STATUS
+
+
+class TestGrblStatus(unittest.TestCase):
+    def setUp(self):
+        self.parser = GrblStatusParser()
+
+    def test_grbl_11_report(self):
+        status = self.parser.Parse('<Run|MPos:10.000,250.500,-1.250,3.000|Bf:12,96|FS:9000,0|Ln:42|Pn:xz>')
+        self.assertEqual(status.state, 'run')
+        self.assertEqual(status.substate, -1)
+        self.assertEqual(status.mpos, (10.0, 250.5, -1.25, 3.0))
+        self.assertEqual(status.wpos, status.mpos)  # no WCO seen yet
+        self.assertEqual((status.planner_free, status.rx_free), (12, 96))
+        self.assertEqual((status.feed, status.spindle), (9000.0, 0.0))
+        self.assertEqual(status.line, 42)
+        self.assertEqual(status.pins, 'XZ')
+
+    def test_work_offset_is_kept(self):
+        self.parser.Parse('<Idle|MPos:5.000,5.000,0.000,0.000|FS:0,0|WCO:1.100,2.000,0.000,0.000>')
+        status = self.parser.Parse('<Hold:0|MPos:6.200,7.000,0.000,0.000|FS:0,0>')
+        self.assertEqual(status.state, 'hold')
+        self.assertEqual(status.substate, 0)
+        self.assertEqual(status.wco, (1.1, 2.0, 0.0, 0.0))
+        self.assertEqual(status.wpos, (5.1, 5.0, 0.0, 0.0))
+        self.assertEqual(status.planner_free, -1)
+        self.assertEqual(status.pins, '')  # not reported means no pin active
+
+    def test_work_position_report(self):
+        self.parser.Parse('<Idle|WPos:0,0,0|WCO:1.000,1.000,1.000>')
+        status = self.parser.Parse('<Idle|WPos:0.000,250.000,0.000|Bf:15,127|FS:0,0>')
+        self.assertEqual(status.wpos, (0.0, 250.0, 0.0, 0.0))
+        self.assertEqual(status.mpos, (1.0, 251.0, 1.0, 0.0))
+
+    def test_old_comma_format(self):
+        status = self.parser.Parse('<Idle,MPos:1.000,2.000,3.000,WPos:4.000,5.000,6.000,Buf:0,RX:0>')
+        self.assertEqual(status.state, 'idle')
+        self.assertEqual(status.mpos, (1.0, 2.0, 3.0, 0.0))
+        status = self.parser.Parse('<idle,wpos:1.0,2.0,3.0,4.0>')
+        self.assertEqual(status.wpos, (1.0, 2.0, 3.0, 4.0))
+
+    def test_machine_and_work_position(self):
+        status = self.parser.Parse('<Idle,MPos:10,250,0,WPos:5,245,0>')
+        self.assertEqual(status.mpos, (10.0, 250.0, 0.0, 0.0))
+        self.assertEqual(status.wpos, (5.0, 245.0, 0.0, 0.0))  # as reported, not mpos - wco
+        self.assertEqual(status.wco, (5.0, 5.0, 0.0, 0.0))
+        status = self.parser.Parse('<Run,MPos:11,250,0>')  # the offset is kept for reports without WPos
+        self.assertEqual(status.wpos, (6.0, 245.0, 0.0, 0.0))
+
+    def test_invalid_lines(self):
+        self.assertIsNone(self.parser.Parse('ok'))
+        self.assertIsNone(self.parser.Parse('<Idle|MPos:1.0,abc>'))
+        self.assertIsNone(self.parser.Parse('<Idle|MPos:1.0'))
+        self.assertIs(self.parser.status, EMPTY_STATUS)
+
+    def test_snapshots_are_immutable(self):
+        first = self.parser.Parse('<Idle|MPos:1,2,3,4>')
+        second = self.parser.Parse('<Run|MPos:5,6,7,8>')
+        self.assertEqual(first.mpos, (1.0, 2.0, 3.0, 4.0))
+        self.assertIsNot(first, second)
+        with self.assertRaises(AttributeError):
+            second.state = 'idle'
+
+
+if __name__ == '__main__':
+    unittest.main()
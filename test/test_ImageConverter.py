@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+try:
+    from ImageConverter import ImageConverter  # the cython extension, built with setup.py build_ext -i
+    from PyQt5.QtGui import QImage
+except ImportError:
+    ImageConverter = None
+
+
+def write_png(path, width=37, height=23):
+    """A noisy ARGB image with partly transparent pixels, so alpha and every channel count"""
+    pixels = np.random.RandomState(3).randint(0, 256, size=(height, width, 4)).astype(np.uint32)
+    argb = (pixels[..., 3] << 24) | (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+    image = QImage(argb.tobytes(), width, height, width * 4, QImage.Format_ARGB32)
+    image.save(path)
+
+
+@unittest.skipIf(ImageConverter is None, 'ImageConverter extension is not built')
+class TestImageConverter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.png_path = os.path.join(self.temp_dir.name, 'noise.png')
+        write_png(self.png_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def converter(self, packed):
+        converter = ImageConverter()
+        converter.SetPackedMode(packed)
+        self.assertEqual(converter.OpenFile(self.png_path, 0), 1)
+        return converter
+
+    def test_threshold_pixel_matches(self):
+        expected = self.converter(0)
+        expected.Threshold(128)
+        for packed in (0, 1):
+            converter = self.converter(packed)
+            converter.ThresholdPixel(128)
+            self.assertEqual(converter.IsPacked(), packed)
+            np.testing.assert_array_equal(converter.GetArray(), expected.GetArray())
+
+    def test_packed_matches(self):
+        expected = self.converter(0)
+        expected.Threshold(128)
+        converter = self.converter(1)
+        converter.Threshold(128)
+        self.assertEqual(converter.IsPacked(), 1)
+        np.testing.assert_array_equal(converter.GetArray(), expected.GetArray())
+
+    def test_threshold_replaces(self):
+        for packed in (0, 1):
+            expected = self.converter(packed)
+            expected.Threshold(100)
+            converter = self.converter(packed)
+            converter.Threshold(200)  # inks more dots than 100
+            converter.Threshold(100)
+            np.testing.assert_array_equal(converter.GetArray(), expected.GetArray())
+            converter.ThresholdPixel(200)
+            converter.ThresholdPixel(100)
+            np.testing.assert_array_equal(converter.GetArray(), expected.GetArray())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+from Kinematics import ProfileDistance, ProfileTime, ProfileTimeAt
+
+
+class TestProfile(unittest.TestCase):
+    def test_time(self):
+        # 100 mm/s reached after 20 mm of 500 mm/s^2, both ramps take 0.2 s
+        self.assertAlmostEqual(ProfileTime(100.0, 100.0, 500.0), 1.2)
+        # too short to reach full speed
+        self.assertAlmostEqual(ProfileTime(10.0, 100.0, 500.0), 2.0 * (10.0 / 500.0) ** 0.5)
+        self.assertEqual(ProfileTime(0.0, 100.0, 500.0), 0.0)
+
+    def test_distance(self):
+        total = ProfileTime(100.0, 100.0, 500.0)
+        self.assertEqual(ProfileDistance(100.0, 100.0, 500.0, 0.0), 0.0)
+        self.assertAlmostEqual(ProfileDistance(100.0, 100.0, 500.0, 0.2), 10.0)
+        self.assertAlmostEqual(ProfileDistance(100.0, 100.0, 500.0, total / 2), 50.0)
+        self.assertAlmostEqual(ProfileDistance(100.0, 100.0, 500.0, total - 0.2), 90.0)
+        self.assertEqual(ProfileDistance(100.0, 100.0, 500.0, total + 1.0), 100.0)
+        # continuous and increasing over the whole move
+        samples = [ProfileDistance(10.0, 100.0, 500.0, t * 0.001) for t in range(300)]
+        self.assertTrue(all(b >= a for a, b in zip(samples, samples[1:])))
+
+    def test_time_at(self):
+        for distance in (10.0, 100.0):
+            total = ProfileTime(distance, 100.0, 500.0)
+            for step in range(11):
+                elapsed = total * step / 10
+                covered = ProfileDistance(distance, 100.0, 500.0, elapsed)
+                self.assertAlmostEqual(ProfileTimeAt(distance, 100.0, 500.0, covered), elapsed)
+        self.assertEqual(ProfileTimeAt(100.0, 100.0, 500.0, -1.0), 0.0)
+        self.assertAlmostEqual(ProfileTimeAt(100.0, 100.0, 500.0, 200.0), 1.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
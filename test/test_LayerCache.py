@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+try:
+    from ImageConverter import ImageConverter  # the cython extension, built with setup.py build_ext -i
+except ImportError:
+    ImageConverter = None
+from LayerCache import LayerCache
+
+SVG_PATH = os.path.join(TEST_FILE_PATH, 'data', 'slic3r_layers.svg')
+
+
+def layer(value, size=100):
+    return np.full((size, 1), value, dtype=np.uint8)
+
+
+class TestLayerCache(unittest.TestCase):
+    def test_get_and_put(self):
+        cache = LayerCache(1000)
+        self.assertIsNone(cache.Get(0))
+        self.assertTrue(cache.Put(0, layer(1)))
+        self.assertEqual(cache.Get(0)[0, 0], 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.Bytes(), 100)
+
+    def test_least_recently_used_is_dropped(self):
+        cache = LayerCache(300)
+        for key in range(3):
+            cache.Put(key, layer(key))
+        cache.Get(0)  # 1 is now the least recently used
+        cache.Put(3, layer(3))
+        self.assertNotIn(1, cache)
+        self.assertEqual(sorted(cache.layers), [0, 2, 3])
+        self.assertEqual(cache.Bytes(), 300)
+
+    def test_replace_and_budget(self):
+        cache = LayerCache(300)
+        cache.Put(0, layer(0))
+        cache.Put(0, layer(5, 200))
+        self.assertEqual(cache.Bytes(), 200)
+        self.assertFalse(cache.Put(1, layer(1, 400)))
+        self.assertNotIn(1, cache)
+        cache.SetBudget(100)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.Bytes(), 0)
+
+    def test_disabled(self):
+        cache = LayerCache(0)
+        self.assertFalse(cache.Put(0, layer(0)))
+        self.assertIsNone(cache.Get(0))
+
+
+
+@unittest.skipIf(ImageConverter is None, 'ImageConverter extension is not built')
+class TestLayerIndex(unittest.TestCase):
+    def open(self):
+        converter = ImageConverter()
+        self.assertEqual(converter.OpenFile(SVG_PATH, 0), 2)
+        return converter
+
+    def test_layer_offsets(self):
+        converter = self.open()
+        self.assertEqual(converter.svg_layer_names, ['layer0', 'layer1', 'layer2'])
+        np.testing.assert_allclose(converter.svg_layer_height, [0.2, 0.4, 0.6])
+        with open(SVG_PATH, 'rb') as f:
+            data = f.read()
+        self.assertEqual(len(converter.svg_layer_offsets), 3)
+        for layer, offset in enumerate(converter.svg_layer_offsets):
+            self.assertTrue(data[offset:].startswith(b'  <g id="layer%d"' % layer))
+        polygons = [converter.SVGLayerPolygons(layer) for layer in range(3)]
+        self.assertEqual([len(layer_polygons) for layer_polygons in polygons], [2, 1, 3])
+        self.assertTrue(polygons[1][0].startswith('3.125000,1.875000 '))
+
+    def test_layer_after_reopen(self):
+        converter = self.open()
+        converter.SVGLayerToArray(2)
+        expected = converter.GetArray().copy()
+        self.assertTrue(expected.any())
+        self.assertEqual(converter.OpenFile(SVG_PATH, 0), 2)  # indexes again and drops the cached layers
+        self.assertNotIn((2, converter.dpi), converter.layer_cache)
+        converter.SVGLayerToArray(2)
+        np.testing.assert_array_equal(converter.GetArray(), expected)
+        other = self.open()  # layer 2 read straight from its offset, without reading layer 1
+        other.SVGLayerToArray(2)
+        np.testing.assert_array_equal(other.GetArray(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
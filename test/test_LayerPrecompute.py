@@ -0,0 +1,93 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+try:
+    from ImageConverter import ImageConverter  # the cython extension, built with setup.py build_ext -i
+except ImportError:
+    ImageConverter = None
+from LayerPrecompute import LayerPrecompute
+from PrintPlanner import PrintPlanner
+
+
+def write_svg(path, layers):
+    with open(path, 'w') as f:
+        f.write('<svg width="20" height="10" xmlns:slic3r="http://slic3r.org/namespaces/slic3r">\n')
+        for layer in range(layers):
+            f.write('  <g id="layer%d" slic3r:z="%.9f">\n' % (layer, (layer + 1) * 2e-7))
+            size = 1 + layer
+            f.write('    <polygon slic3r:type="contour" points="2,2 %d,2 %d,%d 2,%d" style="fill: white" />\n'
+                    % (2 + size, 2 + size, 2 + size / 2, 2 + size / 2))
+            f.write('  </g>\n')
+        f.write('</svg>\n')
+
+
+@unittest.skipIf(ImageConverter is None, 'ImageConverter extension is not built')
+class TestLayerPrecompute(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.svg_path = os.path.join(self.temp_dir.name, 'layers.svg')
+        write_svg(self.svg_path, 6)
+        self.converter = ImageConverter()
+        self.converter.SetDPI(150)
+        self.converter.OpenFile(self.svg_path)
+        self.precompute = LayerPrecompute(1)
+        self.precompute.start_position = lambda layer: (70.0, 275.0)
+
+    def tearDown(self):
+        self.precompute.Cancel()
+        self.temp_dir.cleanup()
+
+    def test_layers_and_plans(self):
+        planner = PrintPlanner()
+        progress = []
+        self.precompute.on_progress = lambda ready, total: progress.append((ready, total))
+        self.precompute.Start(self.converter, planner)
+        plan = self.precompute.GetPlan(5, 60)
+        self.assertIsNotNone(plan)
+        self.assertEqual(progress[-1], (6, 6))
+
+        reference = ImageConverter()
+        reference.SetDPI(150)
+        reference.OpenFile(self.svg_path)
+        reference.SetLayerCacheBudget(0)
+        reference.SVGLayerToArray(5)
+        expected = planner.Compile(reference, 70.0, 275.0)
+        self.assertEqual([s.lines for s in plan.sweeps], [s.lines for s in expected.sweeps])
+        self.assertIn((5, 150), self.converter.layer_cache)
+        self.converter.SVGLayerToArray(5)
+        np.testing.assert_array_equal(self.converter.GetArray(), reference.GetArray())
+
+    def test_evicted_layers_again(self):
+        self.precompute.Start(self.converter)
+        self.precompute.GetPlan(2, 60)
+        self.assertTrue(self.precompute.IsReady(2))
+        self.converter.layer_cache.Clear()  # as if the LRU dropped the layers
+        self.assertFalse(self.precompute.IsReady(2))
+        self.precompute.SetCurrentLayer(1)
+        self.precompute.GetPlan(2, 60)
+        self.assertTrue(self.precompute.IsReady(2))
+        self.assertIn((2, 150), self.converter.layer_cache)
+
+    def test_window_and_cancel(self):
+        self.converter.SetLayerCacheBudget(self.converter.image_array_height * 8 * 3)
+        self.precompute.Start(self.converter)
+        self.assertEqual(self.precompute.window, 2)
+        self.assertIsNone(self.precompute.GetPlan(2, 60))  # rendered only, no planner
+        self.assertTrue(self.precompute.IsReady(2))
+        self.assertFalse(self.precompute.IsReady(3))
+        self.precompute.SetCurrentLayer(3)
+        self.precompute.GetPlan(5, 60)
+        self.assertTrue(self.precompute.IsReady(5))
+        self.precompute.Cancel()
+        self.assertEqual(self.precompute.Progress(), (0, 6))
+        self.assertFalse(self.precompute.IsRunning())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import glob
+import io
+import os
+import sys
+import unittest
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+from LineFramer import LineFramer, TraceLoad, TraceRecord
+
+TRACE_PATH = os.path.join(TEST_FILE_PATH, '..', 'OasisII', 'traces')
+
+
+class TestLineFramer(unittest.TestCase):
+    def test_lines_across_reads(self):
+        framer = LineFramer()
+        self.assertEqual(framer.Feed(b'o'), [])
+        self.assertEqual(framer.Feed(b'k\r\nOK\nBW'), [b'ok\r', b'OK'])
+        self.assertEqual(framer.Pending(), 2)
+        self.assertEqual(framer.Feed(b'L:Po\n'), [b'BWL:Po'])
+        self.assertEqual(framer.Pending(), 0)
+        self.assertEqual(framer.Feed(b'\n\n'), [b'', b''])
+
+    def test_every_split_point(self):
+        data = b'ok\r\n<Idle|WPos:1.000,2.000|FS:0,0>\r\nerror:20\r\nok\r\n'
+        for split in range(len(data) + 1):
+            framer = LineFramer()
+            lines = framer.Feed(data[:split]) + framer.Feed(data[split:])
+            self.assertEqual([bytes(line) for line in lines], data.split(b'\n')[:-1])
+
+    def test_garbage_dropped(self):
+        framer = LineFramer(max_line=8)
+        framer.Feed(b'x' * 20)
+        self.assertEqual(framer.Pending(), 0)
+        self.assertEqual(framer.dropped, 20)
+        self.assertEqual(framer.Feed(b'ok\n'), [b'ok'])
+
+    def test_trace_round_trip(self):
+        trace_file = io.StringIO()
+        reads = [b'ok\r\n', b'\x00\xff"\\\n', b'GTP:HE\nOK']
+        for data in reads:
+            TraceRecord(trace_file, data)
+        path = os.path.join(TEST_FILE_PATH, 'round_trip.trace')
+        try:
+            with open(path, 'w') as output:
+                output.write(trace_file.getvalue())
+            self.assertEqual(TraceLoad(path), reads)
+        finally:
+            os.remove(path)
+
+    def test_recorded_traces(self):
+        paths = glob.glob(os.path.join(TRACE_PATH, '*.trace'))
+        self.assertTrue(paths)
+        for path in paths:
+            reads = TraceLoad(path)
+            framer = LineFramer()
+            lines = [bytes(line) for data in reads for line in framer.Feed(data)]
+            self.assertEqual(lines, b''.join(reads).split(b'\n')[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
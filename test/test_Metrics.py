@@ -0,0 +1,88 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+from Metrics import Metrics, FILL_BUCKETS
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.lines = self.metrics.Counter('lines_total', 'Lines sent')
+        self.fill = self.metrics.Histogram('fill_lines', 'Buffer fill', FILL_BUCKETS)
+        self.queue = self.metrics.Gauge('queue_lines')
+
+    def test_disabled(self):
+        self.lines.Inc(5)
+        self.fill.Observe(10)
+        self.queue.Set(3)
+        with self.metrics.Histogram('job_seconds').Time() as timer:
+            self.assertIsNone(timer.start)  # the clock is not read
+        self.assertEqual(self.lines.value, 0)
+        self.assertEqual(self.fill.count, 0)
+        self.assertEqual(self.queue.value, 0)
+        self.assertEqual(self.metrics.Histogram('job_seconds').count, 0)
+
+    def test_values(self):
+        self.metrics.Enable()
+        self.assertIs(self.metrics.Counter('lines_total'), self.lines)  # made once
+        self.lines.Inc()
+        self.lines.Inc(4)
+        for value in (0, 8, 9, 2000):
+            self.fill.Observe(value)
+        with self.metrics.Histogram('job_seconds').Time():
+            pass
+        snapshot = self.metrics.Snapshot()['metrics']
+        self.assertEqual(snapshot['lines_total'], {'value': 5, 'type': 'counter'})
+        self.assertEqual(snapshot['fill_lines']['count'], 4)
+        self.assertEqual((snapshot['fill_lines']['min'], snapshot['fill_lines']['max']), (0, 2000))
+        self.assertEqual(snapshot['fill_lines']['buckets']['0'], 1)
+        self.assertEqual(snapshot['fill_lines']['buckets']['8'], 1)  # upper bounds are inclusive
+        self.assertEqual(snapshot['fill_lines']['buckets']['16'], 1)
+        self.assertEqual(snapshot['fill_lines']['buckets']['+Inf'], 1)
+        self.assertEqual(snapshot['job_seconds']['count'], 1)
+        self.metrics.Reset()
+        self.assertEqual(self.lines.value, 0)
+        self.assertEqual(self.fill.count, 0)
+
+    def test_rates(self):
+        self.metrics.Enable()
+        self.metrics.Snapshot()
+        self.lines.Inc(100)
+        self.metrics.last_time -= 2.0  # as if the snapshot before was 2 seconds ago
+        self.assertAlmostEqual(self.metrics.Snapshot()['rates']['lines_total'], 50.0, delta=1.0)
+
+    def test_prometheus(self):
+        self.metrics.Enable()
+        self.lines.Inc(3)
+        self.fill.Observe(10)
+        self.fill.Observe(100)
+        text = self.metrics.Prometheus()
+        self.assertIn('# HELP lines_total Lines sent\n# TYPE lines_total counter\nlines_total 3.0\n', text)
+        self.assertIn('fill_lines_bucket{le="8.0"} 0\n', text)
+        self.assertIn('fill_lines_bucket{le="16.0"} 1\n', text)  # cumulative
+        self.assertIn('fill_lines_bucket{le="128.0"} 2\n', text)
+        self.assertIn('fill_lines_bucket{le="+Inf"} 2\nfill_lines_sum 110.0\nfill_lines_count 2\n', text)
+        self.assertIn('# TYPE queue_lines gauge\n', text)
+
+    def test_snapshot_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'metrics')
+            self.metrics.Enable(path, 0.01)
+            self.lines.Inc(7)
+            self.metrics.Disable()  # writes the last snapshot
+            self.lines.Inc(1)
+            with open(path + '.json') as file_object:
+                self.assertEqual(json.load(file_object)['metrics']['lines_total']['value'], 7)
+            with open(path + '.prom') as file_object:
+                self.assertIn('lines_total 7.0\n', file_object.read())
+            self.assertEqual(sorted(os.listdir(temp_dir)), ['metrics.json', 'metrics.prom'])
+
+
+if __name__ == '__main__':
+    unittest.main()
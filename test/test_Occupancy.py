@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+from Occupancy import OccupancyIndex
+
+
+def brute_extents(image_array, row_start, row_end):
+    band = image_array[row_start:row_end]
+    columns = np.flatnonzero(band.any(axis=0))
+    if not len(columns):
+        return None
+    return int(columns[0]), int(columns[-1])
+
+
+class TestOccupancy(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(45)
+        self.image_array = (rng.rand(97, 61) > 0.995).astype(float)
+        self.image_array[40:55] = 0  # an empty band in the middle
+        self.index = OccupancyIndex.FromArray(self.image_array)
+
+    def test_row_min_max(self):
+        rows = np.flatnonzero(self.image_array.any(axis=1))
+        self.assertEqual(self.index.RowMin(), rows[0])
+        self.assertEqual(self.index.RowMax(), rows[-1])
+
+    def test_band_extents(self):
+        for row_start in range(0, 97, 3):
+            for row_end in range(row_start, 98, 5):
+                self.assertEqual(self.index.BandExtents(row_start, row_end),
+                                 brute_extents(self.image_array, row_start, row_end))
+
+    def test_empty_band(self):
+        self.assertTrue(self.index.BandEmpty(40, 55))
+        rows = np.flatnonzero(self.image_array.any(axis=1))
+        self.assertEqual(self.index.NextInkedRow(40), rows[rows >= 40][0])
+        self.assertEqual(self.index.NextInkedRow(97), -1)
+
+    def test_empty_image(self):
+        index = OccupancyIndex.FromArray(np.zeros((10, 10)))
+        self.assertTrue(index.IsEmpty())
+        self.assertEqual(index.RowMin(), -1)
+        self.assertIsNone(index.BandExtents(0, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+import numpy as np
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+try:
+    from ImageConverter import ImageConverter  # the cython extension, built with setup.py build_ext -i
+except ImportError:
+    ImageConverter = None
+import PyPDF2
+from PDFConverter import PDFConverter, parse_pgm_stream
+from PagePipeline import PagePipeline
+from PrintPlanner import PrintPlanner
+from Tracer import GetTracer
+
+
+def page_image(page):
+    image = np.full((120, 90), 0xffffffff, dtype=np.uint32)
+    image[10 + 5 * page:60 + 5 * page, 20:70] = 0xff000000
+    return image
+
+
+def fake_rasterize(page_pdf, output_dir, dpi):
+    """Stands in for convert_png, renders a page with a block that moves with the page number"""
+    from PyQt5.QtGui import QImage
+    page = int(os.path.splitext(os.path.basename(page_pdf))[0][len('doc'):])
+    pixels = page_image(page)
+    image = QImage(pixels.tobytes(), 90, 120, 360, QImage.Format_ARGB32)
+    image.save(os.path.join(output_dir, 'page.png'))
+    time.sleep(0.05 * (page % 2))  # odd pages finish later, they still come out in order
+
+
+def fake_render(pdf_path, first_page, last_page, dpi):
+    """Stands in for render_pages, renders pages to gray arrays like pdftoppm -gray"""
+    return [np.where(page_image(page) == 0xff000000, 0, 255).astype(np.uint8) for page in range(first_page, last_page + 1)]
+
+
+def start_position(page):
+    return 70.0, 275.0, 1
+
+
+@unittest.skipIf(ImageConverter is None, 'ImageConverter extension is not built')
+class TestPagePipeline(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        pdf_path = os.path.join(self.temp_dir.name, 'doc.pdf')
+        writer = PyPDF2.PdfFileWriter()
+        for page in range(6):
+            writer.addBlankPage(200, 200)
+        with open(pdf_path, 'wb') as f:
+            writer.write(f)
+        self.pdfconverter = PDFConverter()
+        self.pdfconverter.working_dir = os.path.join(self.temp_dir.name, 'work')
+        self.assertEqual(self.pdfconverter.open_file(pdf_path), 3)
+        self.planner = PrintPlanner()
+        self.planner.cache_dir = os.path.join(self.temp_dir.name, 'plans')
+        self.pipeline = PagePipeline(2, 2)
+
+    def tearDown(self):
+        self.pipeline.Cancel()
+        self.pipeline.Join()
+        self.pdfconverter.pdfFileObj.close()
+        self.temp_dir.cleanup()
+
+    def print_all(self):
+        self.pipeline.Start(self.pdfconverter, self.planner, 160, start_position, fake_rasterize)
+        pages = []
+        while True:
+            page, plan = self.pipeline.Get(60)
+            if page is None:
+                return pages
+            self.assertLessEqual(self.pipeline.held, self.pipeline.window)
+            pages.append((page, plan))
+
+    def test_pages_in_order(self):
+        pages = self.print_all()
+        self.assertEqual([page for page, plan in pages], list(range(6)))
+        for page, plan in pages:
+            converter = ImageConverter()
+            converter.image_array = (page_image(page) == 0xff000000).astype(np.double)
+            converter.image_array_height, converter.image_array_width = 120, 90
+            expected = self.planner.Compile(converter, 70.0, 275.0)
+            self.assertEqual([s.lines for s in plan.sweeps], [s.lines for s in expected.sweeps])
+        self.assertEqual(self.pipeline.Progress(), (6, 6))
+        self.pipeline.Join(60)
+        self.assertIsNone(self.pipeline.executor)  # the worker processes are shut down after the last page
+        # the rasterized pages are removed once planned, only the single page pdfs are left
+        self.assertEqual(sorted(os.listdir(self.pdfconverter.working_dir)), sorted('doc%d.pdf' % p for p in range(6)))
+
+    def test_pages_in_memory(self):
+        self.pipeline.Start(self.pdfconverter, self.planner, 160, start_position, render=fake_render)
+        from_memory = []
+        while True:
+            page, plan = self.pipeline.Get(60)
+            if page is None:
+                break
+            from_memory.append([s.lines for s in plan.sweeps])
+        self.assertFalse(os.path.exists(self.pdfconverter.working_dir))  # nothing split or written
+        self.planner.cache_dir = os.path.join(self.temp_dir.name, 'plans_files')
+        from_files = [[s.lines for s in plan.sweeps] for page, plan in self.print_all()]
+        self.assertEqual(from_memory, from_files)
+
+    def test_cached_second_time(self):
+        first = self.print_all()
+        self.assertEqual(len(os.listdir(self.planner.cache_dir)), 6)
+        second = self.print_all()
+        self.assertEqual([s.lines for p in first for s in p[1].sweeps], [s.lines for p in second for s in p[1].sweeps])
+
+    def test_traced_in_workers(self):
+        tracer = GetTracer()
+        tracer.Enable()
+        self.addCleanup(tracer.Clear)
+        self.addCleanup(tracer.Disable)
+        self.pipeline.Start(self.pdfconverter, self.planner, 160, start_position, render=fake_render)
+        plans = []
+        while True:
+            page, plan = self.pipeline.Get(60)
+            if page is None:
+                break
+            plans.append(plan)
+        self.assertTrue(all(plan is not None for plan in plans))  # the traced results are unwrapped
+        events = [event for event in tracer.Take() if event['ph'] == 'X']
+        renders = [event for event in events if event['name'] == 'page render']
+        self.assertEqual(sorted(event['args']['page'] for event in renders), list(range(6)))
+        self.assertNotIn(os.getpid(), [event['pid'] for event in renders])  # recorded in the workers
+        self.assertEqual(len([event for event in events if event['name'] == 'threshold']), 6)
+
+    def test_cancel(self):
+        self.pipeline.Start(self.pdfconverter, self.planner, 160, start_position, fake_rasterize)
+        page, plan = self.pipeline.Get(60)
+        self.assertEqual(page, 0)
+        self.pipeline.Cancel()
+        pages = []
+        while True:
+            page, plan = self.pipeline.Get(60)
+            if page is None:
+                break
+            pages.append(page)
+        self.assertLessEqual(len(pages), self.pipeline.window)
+
+
+class TestParsePGM(unittest.TestCase):
+    def test_two_pages(self):
+        first = np.arange(12, dtype=np.uint8).reshape(3, 4)
+        second = np.full((2, 5), 255, dtype=np.uint8)
+        second[1, 1] = 10  # 10 is a newline, must be read as a pixel
+        data = (b'P5\n4 3\n255\n' + first.tobytes() + b'P5\n# pdftoppm\n5 2\n255\n' + second.tobytes())
+        pages = parse_pgm_stream(data)
+        self.assertEqual(len(pages), 2)
+        np.testing.assert_array_equal(pages[0], first)
+        np.testing.assert_array_equal(pages[1], second)
+
+    def test_not_pgm(self):
+        with self.assertRaises(ValueError):
+            parse_pgm_stream(b'P6\n1 1\n255\n\x00\x00\x00')
+
+
+if __name__ == '__main__':
+    unittest.main()
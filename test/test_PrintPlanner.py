@@ -0,0 +1,145 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+sys.path.insert(0, TEST_FILE_PATH)  # shared test helpers
+
+import B64
+from PrintPlanner import PrintPlanner, PrintPlan
+from fakes import FakeImage
+
+
+def parse_line(line):
+    """Returns (position in microns, burst) of an SBR line"""
+    command, pos, burst = line.split(' ')
+    return int(B64.B64FromSingle(pos)), burst
+
+
+def make_image():
+    image_array = np.zeros((700, 400))
+    image_array[100:130, 50:90] = 1
+    image_array[300:480, 200:210] = 1
+    image_array[650:690:3, ::7] = 1
+    return image_array
+
+
+class TestPrintPlanner(unittest.TestCase):
+    def setUp(self):
+        self.planner = PrintPlanner()
+        self.image = FakeImage(make_image())
+
+    def test_sweeps_cover_ink(self):
+        plan = self.planner.Compile(self.image, 70.0, 275.0)
+        self.assertGreater(len(plan.sweeps), 0)
+        for sweep in plan.sweeps:
+            self.assertTrue(self.image.image_array[sweep.band_start:sweep.band_end].any())
+            self.assertEqual(len(sweep.moves), 2)
+            self.assertLess(sweep.y_start_pos, sweep.y_end_pos)
+
+    def test_lines_start_and_end_off(self):
+        plan = self.planner.Compile(self.image, 70.0, 275.0)
+        empty = B64.B64ToArray(np.zeros(150))
+        for sweep in plan.sweeps:
+            self.assertTrue(sweep.lines[0].endswith(' ' + empty))
+            self.assertTrue(sweep.lines[-1].endswith(' ' + empty))
+
+    def test_empty_image(self):
+        plan = self.planner.Compile(FakeImage(np.zeros((50, 50))), 70.0, 275.0)
+        self.assertEqual(plan.sweeps, [])
+
+    def test_bidirectional_alternates(self):
+        self.planner.bidirectional = 1
+        plan = self.planner.Compile(self.image, 70.0, 275.0)
+        self.assertEqual([s.direction for s in plan.sweeps], [1, -1, 1, -1][:len(plan.sweeps)])
+        for sweep in plan.sweeps:
+            (x, y_from, travel), (_, y_to, feed) = sweep.moves
+            self.assertEqual(feed, self.planner.print_speed)
+            self.assertEqual(y_from < y_to, sweep.direction == 1)
+
+    def test_reverse_sweeps_print_the_same(self):
+        forward = self.planner.Compile(self.image, 70.0, 275.0)
+        self.planner.bidirectional = 1
+        serpentine = self.planner.Compile(self.image, 70.0, 275.0)
+        self.assertGreaterEqual(len(serpentine.sweeps), 2)
+        column = 25.4 / self.image.dpi * 1000
+        for sweep_forward, sweep_reverse in zip(forward.sweeps[1::2], serpentine.sweeps[1::2]):
+            lines_forward = [parse_line(line) for line in sweep_forward.lines]
+            lines_reverse = [parse_line(line) for line in sweep_reverse.lines]
+            positions = [pos for pos, burst in lines_reverse]
+            self.assertEqual(positions, sorted(positions, reverse=True))
+            for pos, burst in lines_forward:
+                middle = pos + column / 2
+                # moving up the last line below fired, moving down the last line above
+                fired_up = [b for p, b in lines_forward if p <= middle][-1]
+                fired_down = [b for p, b in lines_reverse if p >= middle][-1]
+                self.assertEqual(fired_up, fired_down)
+
+    def test_packed_bands(self):
+        image_array = np.zeros((700, 400))
+        for row in (40, 220, 400, 580):  # lines of text 100 rows high, the fixed step splits three of them
+            image_array[row:row + 100, 20:300] = 1
+        image_array[699, 10] = 1  # the last inked row must be printed too
+        image = FakeImage(image_array)
+        fixed, packed = self.planner.CompareBands(image)
+        self.planner.pack_bands = 1
+        plan = self.planner.Compile(image, 70.0, 275.0)
+        self.assertEqual((fixed, packed), (5, 4))
+        self.assertEqual(len(plan.sweeps), packed)
+        self.assertEqual(plan.settings['fixed_sweeps'], fixed)
+        self.assertEqual([(s.band_start, s.band_end) for s in plan.sweeps], [(40, 190), (220, 370), (400, 550), (580, 700)])
+        covered = np.zeros(700, dtype=bool)
+        for sweep in plan.sweeps:
+            covered[sweep.band_start:sweep.band_end] = True
+        self.assertTrue(covered[image_array.any(axis=1)].all())
+
+    def test_packed_bands_same_as_fixed_without_gaps(self):
+        image = FakeImage(np.ones((450, 40)))
+        self.planner.pack_bands = 1
+        packed = self.planner.Compile(image, 70.0, 275.0)
+        self.assertEqual([(s.band_start, s.band_end) for s in packed.sweeps], [(0, 150), (150, 300), (300, 450)])
+
+    def test_sweep_size(self):
+        default = self.planner.Compile(self.image, 70.0, 275.0)
+        self.planner.sweep_size = 50
+        narrow = self.planner.Compile(self.image, 70.0, 275.0)
+        self.assertGreater(len(narrow.sweeps), len(default.sweeps))
+        self.assertEqual(narrow.settings['sweep_size'], 50)
+        for sweep in narrow.sweeps:
+            self.assertLessEqual(sweep.band_end - sweep.band_start, 50)
+            for line in sweep.lines:
+                self.assertEqual(len(parse_line(line)[1]), 25)  # a bit for all 150 nozzles
+        self.planner.sweep_size = 1000  # never more than the nozzles
+        self.assertEqual(self.planner.SweepSize(300), 150)
+
+    def test_estimate(self):
+        plan = self.planner.Compile(self.image, 70.0, 275.0)
+        unidirectional, bidirectional = self.planner.CompareDirections(plan)
+        self.assertGreater(unidirectional, bidirectional)
+        self.assertEqual(self.planner.EstimateTime(plan), unidirectional)
+        self.assertAlmostEqual(self.planner.MoveTime(300.0, 6000.0), 3.0 + 100.0 / self.planner.acceleration)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.planner.cache_dir = os.path.join(temp_dir, 'plans')
+            source = os.path.join(temp_dir, 'page.png')
+            with open(source, 'wb') as f:
+                f.write(b'page')
+            key = self.planner.PlanKey(source, 0, 300, 160, 1, 70.0, 275.0)
+            self.assertNotEqual(key, self.planner.PlanKey(source, 0, 300, 161, 1, 70.0, 275.0))
+            self.assertNotEqual(key, self.planner.PlanKey(source, 0, 300, 160, -1, 70.0, 55.0))
+            self.assertIsNone(self.planner.LoadCached(key))
+
+            plan = self.planner.Compile(self.image, 70.0, 275.0, key)
+            self.planner.SaveCached(plan)
+            self.assertEqual(os.listdir(self.planner.cache_dir), [key + '.plan'])  # no temporary file left
+            cached = self.planner.LoadCached(key)
+            self.assertIsInstance(cached, PrintPlan)
+            self.assertEqual([s.lines for s in cached.sweeps], [s.lines for s in plan.sweeps])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+sys.path.insert(0, TEST_FILE_PATH)  # shared test helpers
+
+from PrintPlanner import PrintPlanner
+from PrintSimulator import EventQueue, PrintSimulator
+from SerialGRBL import GRBL
+from fakes import FakeImage
+
+
+def make_plan(planner):
+    image_array = np.zeros((500, 600))
+    image_array[20:140, 100:400] = 1
+    image_array[300:450:4, 50:550:3] = 1
+    return planner.Compile(FakeImage(image_array), 70.0, 275.0)
+
+
+class TestEventQueue(unittest.TestCase):
+    def test_order(self):
+        events = EventQueue()
+        called = []
+        events.At(2.0, called.append, 'b')
+        events.At(1.0, called.append, 'a')
+        events.At(2.0, called.append, 'c')
+        while events.RunNext():
+            pass
+        self.assertEqual(called, ['a', 'b', 'c'])
+        self.assertEqual(events.now, 2.0)
+
+
+class TestPrintSimulator(unittest.TestCase):
+    def setUp(self):
+        self.planner = PrintPlanner()
+        self.plan = make_plan(self.planner)
+        self.simulator = PrintSimulator(self.planner)
+
+    def test_job(self):
+        report = self.simulator.Run(self.plan)
+        self.assertEqual(report.completed, 1)
+        self.assertEqual(len(report.sweeps), len(self.plan.sweeps))
+        # homing and the sweep moves at least, the estimate leaves out homing and parking
+        self.assertGreater(report.motion_time, self.planner.EstimateTime(self.plan) + self.simulator.homing_time)
+        self.assertGreaterEqual(report.job_time, report.motion_time)
+        self.assertEqual(report.overflows, 0)
+        self.assertLessEqual(report.buffer_peak, self.simulator.inkjet_buffer_size)
+        for sweep in report.sweeps:
+            self.assertEqual(sweep.arrived, sweep.lines)
+            self.assertIsNotNone(sweep.print_start)
+        self.assertIn('Job time', report.Summary())
+
+    def test_underruns(self):
+        # slow enough, every line is in the HP45 before the head gets there
+        self.planner.print_speed = 600.0
+        self.assertEqual(self.simulator.Run(make_plan(self.planner)).Underruns(), 0)
+        # a slow connection can not keep up with a fast head
+        self.planner.print_speed = 30000.0
+        self.simulator.inkjet_baudrate = 9600
+        self.assertGreater(self.simulator.Run(make_plan(self.planner)).Underruns(), 0)
+
+    def test_pipelined(self):
+        pipelined = self.simulator.Run(self.plan)
+        self.simulator.pipelined = 0
+        one_by_one = self.simulator.Run(self.plan)
+        self.assertLess(pipelined.job_time, one_by_one.job_time)
+        self.assertLess(pipelined.IdleTime(), one_by_one.IdleTime())
+
+    def test_new_layer(self):
+        report = self.simulator.Run(self.plan, 0.2)
+        grbl = GRBL()
+        spread_time = (grbl.nl_front_pos_x - grbl.nl_back_pos_x) / (grbl.nl_feed_speed / 60.0)
+        self.assertGreater(report.new_layer_time, spread_time)
+        self.assertAlmostEqual(report.job_time - report.new_layer_time, self.simulator.Run(self.plan).job_time, delta=1.0)
+
+    def test_new_layer_lines(self):
+        grbl = GRBL()
+        lines = grbl.NewLayerLines(0.2)
+        self.assertEqual(lines[0], grbl.GotoLine(grbl.nl_back_pos_x, grbl.nl_back_pos_y, grbl.nl_travel_speed))
+        self.assertEqual(lines[lines.index('M4') + 1], grbl.GotoLine(grbl.nl_front_pos_x, grbl.nl_back_pos_y, grbl.nl_feed_speed))
+        self.assertEqual(lines[lines.index('M4') + 2], 'M5')
+        self.assertEqual(lines[-1], 'G90')
+        self.assertNotEqual(lines, grbl.NewLayerLines(0.2, 1))  # only feed
+
+
+if __name__ == '__main__':
+    unittest.main()
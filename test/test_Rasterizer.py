@@ -0,0 +1,131 @@
+import math
+import os
+import random
+import re
+import sys
+import unittest
+import numpy as np
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+try:
+    from ImageConverter import ImageConverter  # the cython extension, built with setup.py build_ext -i
+except ImportError:
+    ImageConverter = None
+from Rasterizer import ParsePoints, FillPolygons
+
+SVG_PATH = os.path.join(TEST_FILE_PATH, 'data', 'slic3r_layers.svg')
+
+
+def toggle_reference(polygons, height, width, pixel_size):
+    """The toggle algorithm of ImageConverter.ArrayAddPolygon and ArrayConvert, without the class"""
+    image = np.zeros((height, width))
+    for points in polygons:
+        temp_x = [float(p.partition(',')[0]) for p in points.split(' ')]
+        temp_y = [float(p.partition(',')[2]) for p in points.split(' ')]
+        for pos in range(len(temp_x)):
+            if temp_x[pos - 1] < temp_x[pos]:
+                x_start, x_end, y_start, y_end = temp_x[pos - 1], temp_x[pos], temp_y[pos - 1], temp_y[pos]
+            else:
+                x_start, x_end, y_start, y_end = temp_x[pos], temp_x[pos - 1], temp_y[pos], temp_y[pos - 1]
+            if x_start == x_end:
+                continue
+            for x in range(int(x_start / pixel_size), int(x_end / pixel_size) + 1):
+                x_pos = float(x * pixel_size)
+                if x_start <= x_pos <= x_end:
+                    calc_y = float((y_end - y_start) * ((x_pos - x_start) / (x_end - x_start))) + y_start
+                    y = int(calc_y / pixel_size)
+                    if 0 <= x < height and 0 <= y < width:
+                        image[x][y] = 1 - image[x][y]
+    for x in range(height):
+        state = 0
+        for y in range(width):
+            if image[x][y] != 0:
+                state = 1 - state
+            image[x][y] = state
+    return image
+
+
+def points_string(points):
+    return ' '.join('%s,%s' % (x, y) for x, y in points)
+
+
+def svg_layers(path):
+    """The points strings of the polygons per layer of a Slic3r svg"""
+    layers = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith('  <g '):
+                layers.append([])
+            elif line.startswith('    <polygon '):
+                layers[-1].append(re.search(r'points="([^"]*)"', line).group(1))
+    return layers
+
+
+class TestRasterizer(unittest.TestCase):
+    def check(self, polygons, height=60, width=50, dpi=300):
+        pixel_size = 25.4 / dpi
+        expected = toggle_reference(polygons, height, width, pixel_size)
+        filled = FillPolygons([ParsePoints(p) for p in polygons], height, width, pixel_size)
+        np.testing.assert_array_equal(filled, expected)
+        return filled
+
+    def test_parse_points(self):
+        np.testing.assert_array_equal(ParsePoints('15,35 10,35.5 -1,2e-3'), [[15, 35], [10, 35.5], [-1, 0.002]])
+
+    def test_square_with_hole(self):
+        filled = self.check(['1,1 4,1 4,3 1,3', '2,1.5 3,1.5 3,2.5 2,2.5'])
+        self.assertTrue(filled.any())
+        self.assertFalse(filled[29, 23])  # inside the hole
+
+    def test_vertices_on_rows(self):
+        # every vertex lies on a pixel row or column, where ends of edges count twice
+        pixel_size = 25.4 / 300
+        grid = [(k * pixel_size, j * pixel_size) for k, j in [(5, 5), (40, 5), (20, 30), (40, 45), (5, 45), (20, 20)]]
+        self.check([points_string(grid)])
+
+    def test_outside_and_overlapping(self):
+        self.check(['-1,-1 2,-1 2,6 -1,6', '3,3 8,3 8,8 3,8', '3,3 8,3 8,8 3,8'])
+
+    def test_random_layers(self):
+        rng = random.Random(45)
+        for dpi in (150, 300, 600):
+            polygons = []
+            for n in range(5):
+                cx, cy, r = rng.uniform(0, 5), rng.uniform(0, 4), rng.uniform(0.2, 2)
+                count = rng.randint(3, 30)
+                polygons.append(points_string(
+                    (round(cx + r * math.cos(2 * math.pi * k / count) * rng.uniform(0.5, 1.2), 3),
+                     round(cy + r * math.sin(2 * math.pi * k / count), 3)) for k in range(count)))
+            self.check(polygons, 120, 100, dpi)
+
+    def test_empty(self):
+        self.assertFalse(FillPolygons([], 10, 10, 0.1).any())
+
+    def test_slic3r_layers(self):
+        # 20 x 15 mm, x runs along the svg width
+        for dpi in (150, 300):
+            for polygons in svg_layers(SVG_PATH):
+                self.assertTrue(self.check(polygons, int(20 / 25.4 * dpi) + 1, int(15 / 25.4 * dpi) + 1, dpi).any())
+
+
+@unittest.skipIf(ImageConverter is None, 'ImageConverter extension is not built')
+class TestSVGLayerToArray(unittest.TestCase):
+    def test_matches_toggle(self):
+        for dpi in (150, 300, 600):
+            for packed in (0, 1):
+                converter = ImageConverter()
+                converter.SetDPI(dpi)
+                converter.SetPackedMode(packed)
+                converter.SetLayerCacheBudget(0)
+                self.assertEqual(converter.OpenFile(SVG_PATH, 0), 2)
+                for layer in range(converter.svg_layers):
+                    converter.SVGLayerToArrayPixel(layer)
+                    expected = converter.GetArray().copy()
+                    converter.SVGLayerToArray(layer)
+                    np.testing.assert_array_equal(converter.GetArray(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+from Tracer import Tracer, TracedResult, NULL_SPAN
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.tracer = Tracer()
+
+    def test_disabled(self):
+        self.assertIs(self.tracer.Span('threshold', 'convert'), NULL_SPAN)
+        self.tracer.Instant('idle', 'motion', 'GRBL motion')
+        self.tracer.Serial('GRBL serial', 'tx', 'G1 X10\n')
+        self.tracer.Complete('sweep', 'print', 1.0, 2.0)
+        self.assertEqual(self.tracer.events, [])
+
+    def test_events(self):
+        self.tracer.Enable()
+        with self.tracer.Span('sweep', 'print', {'rows': [0, 150]}):
+            with self.tracer.Span('HP45 fill', 'print'):
+                pass
+        self.tracer.Complete('G1 print', 'motion', 2.0, 2.5, 'gantry (estimated)')
+        self.tracer.Serial('HP45 serial', 'tx', 'SBR ' + 'A' * 200)
+        fill, sweep, move, serial = self.tracer.events
+        self.assertEqual((sweep['ph'], sweep['args']), ('X', {'rows': [0, 150]}))
+        self.assertGreaterEqual(fill['ts'], sweep['ts'])  # nested in the sweep
+        self.assertLessEqual(fill['ts'] + fill['dur'], sweep['ts'] + sweep['dur'])
+        self.assertEqual(fill['tid'], threading.get_ident())
+        self.assertEqual((move['ts'], move['dur']), (2.0e6, 0.5e6))
+        self.assertNotEqual(move['tid'], serial['tid'])  # a track per name
+        self.assertEqual((serial['ph'], serial['args']['bytes'], len(serial['args']['data'])), ('i', 204, 120))
+        names = {event['tid']: event['args']['name'] for event in self.tracer.Metadata() if event['name'] == 'thread_name'}
+        self.assertEqual(names[move['tid']], 'gantry (estimated)')
+        self.assertEqual(names[fill['tid']], threading.current_thread().name)
+
+    def test_limit(self):
+        self.tracer.Enable()
+        self.tracer.max_events = 3
+        for index in range(5):
+            self.tracer.Instant('ok', 'serial')
+        self.assertEqual((len(self.tracer.events), self.tracer.dropped), (3, 2))
+
+    def test_save(self):
+        self.tracer.Enable()
+        with self.tracer.Span('plan', 'plan'):
+            pass
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'job.json')
+            self.tracer.Save(path)
+            with open(path) as file_object:
+                trace = json.load(file_object)
+            self.assertEqual(os.listdir(temp_dir), ['job.json'])
+        phases = [event['ph'] for event in trace['traceEvents']]
+        self.assertEqual(phases.count('X'), 1)
+        self.assertIn('M', phases)
+        self.assertEqual(trace['otherData']['dropped_events'], 0)
+
+    def test_take_and_merge(self):
+        self.tracer.Enable()
+        self.tracer.Instant('ok', 'serial')
+        events = self.tracer.Take()  # as a worker process would return them
+        self.assertEqual(self.tracer.events, [])
+        self.assertEqual([event['ph'] for event in events], ['M', 'M', 'i'])
+        main = Tracer()
+        main.Enable()
+        main.Merge(TracedResult('plan', events).events)
+        self.assertEqual(len(main.events), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
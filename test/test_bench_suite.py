@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+TEST_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_FILE_PATH, '..', 'OasisII'))  # modules import each other by name
+
+import bench_suite
+
+
+def result(best):
+    return {'best': best, 'median': best, 'runs': [best], 'units': 1, 'unit': 'pages', 'rate': 1.0 / best}
+
+
+class TestBenchSuite(unittest.TestCase):
+    def tearDown(self):
+        logging.disable(logging.NOTSET)  # main turns the HP45 debug log off
+
+    def test_compare(self):
+        baseline = {'tolerance': 0.25, 'tolerances': {'grbl_stream': 1.0},
+                    'stages': {'plan': result(1.0), 'b64': result(1.0), 'grbl_stream': result(1.0)}}
+        results = {'stages': {'plan': result(1.2), 'b64': result(1.3), 'grbl_stream': result(1.9),
+                              'threshold': result(5.0)}}  # not in the baseline, not compared
+        self.assertEqual([regression['stage'] for regression in bench_suite.compare(results, baseline)], ['b64'])
+        self.assertEqual([regression['stage'] for regression in bench_suite.compare(results, baseline, 0.1)],
+                         ['plan', 'b64'])
+        self.assertEqual(bench_suite.compare(results, {}), [])
+
+    def test_fixture_pdf(self):
+        import PyPDF2
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fixtures = bench_suite.make_fixtures(temp_dir)
+            reader = PyPDF2.PdfFileReader(fixtures['pdf'])
+            self.assertEqual(reader.getNumPages(), bench_suite.PDF_PAGES)
+            self.assertEqual([float(value) for value in reader.getPage(0).mediaBox], [0, 0, 612, 792])
+            self.assertTrue(os.path.exists(fixtures['png']))
+
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = os.path.join(temp_dir, 'results.json')
+            baseline = os.path.join(temp_dir, 'baseline.json')
+            with open(baseline, 'w') as file_object:
+                json.dump({'stages': {'b64': result(1e-9)}}, file_object)  # impossible to match
+            self.assertEqual(bench_suite.main(['--stages', 'b64,serial_parse', '--repeat', '1',
+                                               '--output', output, '--baseline', baseline]), 1)
+            with open(output) as file_object:
+                results = json.load(file_object)
+            self.assertEqual(sorted(results['stages']), ['b64', 'serial_parse'])
+            self.assertEqual(results['failed'], {})
+            self.assertEqual([regression['stage'] for regression in results['regressions']], ['b64'])
+            self.assertGreater(results['stages']['serial_parse']['units'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()